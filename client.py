@@ -1,53 +1,177 @@
+#!/usr/bin/env python3
+"""
+ECG Desktop Viewer
+Live plot of one device from realtime_server.py's TCP feed (see ecg_feed.py)
+
+Frames on the feed are length-prefixed ECGD data frames (ecg_protocol.py):
+a batch split across TCP segments, or several batches in one recv(), is
+reassembled instead of crashing the viewer, and nothing received is ever
+unpickled.
+
+A receiver thread appends every batch to a fixed-size ring buffer. The
+main thread redraws at most MAX_FPS times per second by blitting one
+persistent Line2D over a cached background, so each frame costs one
+buffer snapshot and one line draw, never a full figure redraw; axes are
+only redrawn when the signal leaves the y range.
+
+Usage:
+    python3 client.py [server ip [device id]]
+"""
+
+import json
 import socket
+import sys
+import threading
+import time
+
+import numpy as np
 import matplotlib.pyplot as plt
-import pickle
 
-# Define the server IP address and port number
+from ecg_buffer import RingBuffer
+from ecg_protocol import encode_frame, decode_data_frame, FrameDecoder
+
+# Define the server IP address and port number (realtime_server.py TCP_PORT)
 SERVER_IP = '192.168.0.194'
 SERVER_PORT = 5000
+DEVICE = None           # device id to show, None for the server's default device
+
+# Display
+CHANNEL = 'filtered'    # 'raw' or 'filtered'
+WINDOW_SECONDS = 10     # seconds of signal on screen
+MAX_SAMPLE_RATE = 2000  # the buffer holds WINDOW_SECONDS at up to this rate
+MAX_FPS = 60            # redraw cap, about the display refresh rate
+Y_MARGIN = 0.1          # headroom above and below the signal after a rescale
+
+# Column order in the feed's data frames
+FEED_COLUMNS = {'raw': 0, 'filtered': 1}
+
+
+def receive(sock, buffer, column, stats, stop):
+    """Receiver thread: reassemble frames and append their samples to the buffer"""
+    decoder = FrameDecoder()
+    try:
+        while not stop.is_set():
+            data = sock.recv(65536)
+            if not data:
+                print("Server closed the connection")
+                break
+            for body in decoder.feed(data):
+                _, _, times, columns = decode_data_frame(body)
+                buffer.extend(time=times, voltage=columns[column])
+                stats['frames'] += 1
+                stats['samples'] += len(times)
+    except (OSError, ValueError) as e:
+        print(f"Error receiving data: {e}")
+    finally:
+        stop.set()
+
+
+class BlitViewer:
+    """A scrolling trace whose x axis is seconds before the newest sample"""
+
+    def __init__(self, window):
+        self.window = window
+        self.fig, self.ax = plt.subplots(figsize=(12, 5))
+        self.line, = self.ax.plot([], [], linewidth=1, color='tab:red', animated=True)
+        self.ax.set_xlim(-window, 0)
+        self.ax.set_ylim(-1, 1)
+        self.ax.set_xlabel('Time (s)')
+        self.ax.set_ylabel('Voltage (V)')
+        self.ax.grid(True, alpha=0.3)
+        self.blit = getattr(self.fig.canvas, 'supports_blit', False)
+        self._background = None
+        # Any full redraw (first show, resize, rescale) refreshes the cached background
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+
+    @property
+    def open(self):
+        return plt.fignum_exists(self.fig.number)
+
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.ax.draw_artist(self.line)
+
+    def _rescale(self, values):
+        """Fit the y axis when the signal leaves it or uses less than a quarter of it"""
+        lo, hi = float(values.min()), float(values.max())
+        bottom, top = self.ax.get_ylim()
+        if lo >= bottom and hi <= top and (hi - lo) >= (top - bottom) / 4:
+            return False
+        margin = max(hi - lo, 1e-3) * Y_MARGIN
+        self.ax.set_ylim(lo - margin, hi + margin)
+        return True
+
+    def update(self, times, values):
+        if len(times) == 0:
+            return
+        # Only the visible window is drawn
+        first = int(np.searchsorted(times, times[-1] - self.window))
+        times, values = times[first:], values[first:]
+        self.line.set_data(times - times[-1], values)
+
+        canvas = self.fig.canvas
+        if self._rescale(values) or not self.blit or self._background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            self.ax.draw_artist(self.line)
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def idle(self):
+        self.fig.canvas.flush_events()
+
+
+def main(server_ip=SERVER_IP, device=DEVICE, duration=None):
+    column = FEED_COLUMNS[CHANNEL]
+    buffer = RingBuffer.for_window(WINDOW_SECONDS, MAX_SAMPLE_RATE)
+    stats = {'frames': 0, 'samples': 0}
+    stop = threading.Event()
+
+    # Connect to the server and ask for the device (an empty request means the default)
+    client_socket = socket.create_connection((server_ip, SERVER_PORT))
+    client_socket.sendall(encode_frame(json.dumps({'device': device}).encode('utf-8')))
+    threading.Thread(target=receive, args=(client_socket, buffer, column, stats, stop),
+                     daemon=True).start()
+    print(f"Connected to {server_ip}:{SERVER_PORT}, device {device or 'default'}")
+
+    viewer = BlitViewer(WINDOW_SECONDS)
+    frame_time = 1.0 / MAX_FPS
+    drawn = buffer.end
+    draws = 0
+    started = report_at = time.perf_counter()
+    try:
+        while viewer.open and not stop.is_set():
+            tick = time.perf_counter()
+            if buffer.end != drawn:
+                drawn = buffer.end
+                _, columns = buffer.snapshot()
+                viewer.update(columns['time'], columns['voltage'])
+                draws += 1
+            else:
+                viewer.idle()
+
+            now = time.perf_counter()
+            if now - report_at >= 1.0:
+                # Print the received data rate once a second rather than every message
+                print(f"Received {stats['samples']} samples in {stats['frames']} frames, "
+                      f"{draws / (now - report_at):.0f} fps")
+                report_at, draws = now, 0
+            if duration is not None and now - started >= duration:
+                break
+            delay = frame_time - (now - tick)
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        # Close the socket
+        client_socket.close()
+    return stats
+
 
-# Create a socket object
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-# Connect to the server
-client_socket.connect((SERVER_IP, SERVER_PORT))
-
-# Set up the plot
-fig, ax = plt.subplots()
-plt.ion()
-# x_data = []
-# y_data = []
-# plot, = ax.plot(x_data, y_data)
-
-# Receive real-time data from the server
-while True:
-    # Receive the data from the server
-    data = client_socket.recv(4096)
-
-    buffer = pickle.loads(data)
-    y_data = buffer
-    x_data = range(len(buffer))
-    ax.clear()
-    plot, = ax.plot(x_data, y_data)
-
-    # try:
-    #     value = float(data)
-    # except ValueError:
-    #     continue
-
-    # Add the received data to the plot
-    # x_data.append(len(x_data))
-    # y_data.append(value)
-    plot.set_data(x_data, y_data)
-
-    # Update the plot
-    plt.xlim([max(0, len(x_data) - 50), len(x_data)])
-    plt.ylim([min(y_data), max(y_data)])
-    plt.draw()
-    plt.pause(0.01)
-
-    # Print the received data
-    print(f"Received data: {pickle.loads(data)}")
-
-# Close the socket
-client_socket.close()
\ No newline at end of file
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
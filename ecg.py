@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+ECG Command Line
+One entry point for recording, sending, serving, plotting, simulating and replaying
+
+    ecg record     ADS1115 (or --simulate) to a text or .ecg recording  rpi_ecg_recorder.py
+    ecg send       ADS1115 over UDP to the server                      rpi_ecg_sender.py
+    ecg serve      the realtime server (--asyncio for the asyncio mode) realtime_server.py
+    ecg plot       plot a recording, or --capture legacy UDP and plot  rpi_plot_ecg.py / plot_ecg.py
+    ecg simulate   synthetic ECG over UDP                              ecg_udp_simulator.py
+    ecg replay     recordings over UDP, in real time or N times faster ecg_replay.py
+
+This file only imports argparse: a subcommand imports the script behind
+it when it runs, so `ecg send` on a Pi Zero loads NumPy and the I2C
+driver but never matplotlib, SciPy or Flask, and `ecg --help` loads
+nothing. Every option is the lower-case name of a constant in that
+script (SAMPLE_RATE is --sample-rate) and defaults to it. A JSON file
+given with --config sets options per subcommand, under the same names;
+the command line wins:
+
+    {"send": {"target_ip": "192.168.0.194", "sample_rate": 500, "device_id": 1},
+     "serve": {"notch_hz": 50, "archive_dir": null}}
+
+--import-time prints how long the subcommand's imports took and which
+heavy packages they pulled in.
+
+Usage:
+    python3 ecg.py send --target-ip 192.168.0.194 --sample-rate 500
+    python3 ecg.py --config pi.json record --output-format binary
+    python3 ecg.py serve --asyncio --notch-hz 50
+    python3 ecg.py replay sessions/*.ecg --speed 60 --loops 0
+"""
+
+import argparse
+import sys
+import time
+
+# Subcommand -> script whose main() runs it, and the flag that picks another one
+SCRIPTS = {
+    'record': ('rpi_ecg_recorder', ('simulate', 'rpi_ecg_recorder_simulator')),
+    'send': ('rpi_ecg_sender', None),
+    'serve': ('realtime_server', None),
+    'plot': ('rpi_plot_ecg', ('capture', 'plot_ecg')),
+    'simulate': ('ecg_udp_simulator', None),
+    'replay': ('ecg_replay', None),
+}
+
+# Reported by --import-time when a subcommand pulls them in
+HEAVY_PACKAGES = ('numpy', 'scipy', 'matplotlib', 'flask', 'aiohttp', 'board')
+
+ENCODINGS = ('float32', 'delta')
+DTYPES = ('float32', 'int16', 'delta')
+
+
+def optional(cast):
+    """Argument type that also takes 'none' (or 'off') for settings that can be None"""
+    def convert(text):
+        return None if text.lower() in ('none', 'off') else cast(text)
+    convert.__name__ = cast.__name__
+    return convert
+
+
+def option(parser, name, **kwargs):
+    """--name-with-dashes for the keyword argument `name` of the script's main()"""
+    parser.add_argument('--' + name.replace('_', '-'), dest=name, **kwargs)
+
+
+def add_adc_options(parser):
+    group = parser.add_argument_group('ADS1115')
+    option(group, 'channel', type=int, help="input channel (A0-A3)")
+    option(group, 'negative', type=optional(int),
+           help="second channel for a differential input, e.g. 1 for A0-A1")
+    option(group, 'gain', type=int, choices=(1, 2, 4, 8, 16),
+           help="PGA gain: 1 = ±4.096V ... 16 = ±0.256V")
+    option(group, 'ads_address', type=lambda text: int(text, 0), help="I2C address (0x48)")
+
+
+def add_output_options(parser):
+    option(parser, 'output_file', help="text recording")
+    option(parser, 'output_format', choices=('text', 'binary'))
+    option(parser, 'binary_file', help="binary recording (--output-format binary)")
+    option(parser, 'binary_dtype', choices=DTYPES)
+    option(parser, 'duration', type=float, help="seconds to record")
+    option(parser, 'sample_rate', type=float, help="Hz")
+    option(parser, 'buffer_seconds', type=float,
+           help="samples held between acquisition and the writer")
+    option(parser, 'write_interval', type=float, help="seconds between writes")
+    option(parser, 'spin_margin', type=optional(float),
+           help="seconds busy-waited before each read, 0 to only sleep")
+
+
+def add_udp_sender_options(parser, sample_rate_help):
+    option(parser, 'target_ip', help="server address")
+    option(parser, 'udp_port', type=int, help="server UDP port")
+    option(parser, 'sample_rate', type=float, help=sample_rate_help)
+    option(parser, 'batch_size', type=int, help="samples per UDP packet")
+    option(parser, 'device_id', type=int, help="device id in the packet header")
+    option(parser, 'encoding', choices=ENCODINGS,
+           help="'delta' packs ADC codes as varint differences")
+
+
+def add_record(commands):
+    parser = commands.add_parser('record', help="record the ADC to a file",
+                                 argument_default=argparse.SUPPRESS)
+    add_output_options(parser)
+    add_adc_options(parser)
+    simulated = parser.add_argument_group('simulated ADC')
+    simulated.add_argument('--simulate', action='store_true',
+                           help="record a synthetic ECG, no hardware needed")
+    option(simulated, 'binary_gain', type=int, choices=(1, 2, 4, 8, 16),
+           help="gain the codes are quantized at")
+    option(simulated, 'heart_rate', type=float, help="BPM")
+    option(simulated, 'hrv', type=float, help="RR spread (fraction of RR)")
+    option(simulated, 'mains', type=float, help="mains interference amplitude (V)")
+    option(simulated, 'noise', type=float, help="white noise standard deviation (V)")
+
+
+def add_send(commands):
+    parser = commands.add_parser('send', help="stream the ADC over UDP",
+                                 argument_default=argparse.SUPPRESS)
+    add_udp_sender_options(parser, "Hz, 500 recommended (ADS1115 maximum is 860)")
+    option(parser, 'flush_interval', type=float, help="seconds before a partial batch is sent")
+    option(parser, 'buffer_seconds', type=float,
+           help="samples held between acquisition and the sender")
+    option(parser, 'spin_margin', type=optional(float),
+           help="seconds busy-waited before each read, 0 to only sleep")
+    add_adc_options(parser)
+
+
+def add_serve(commands):
+    parser = commands.add_parser('serve', help="run the realtime server",
+                                 argument_default=argparse.SUPPRESS)
+    parser.add_argument('--asyncio', dest='server_mode', action='store_const', const='asyncio',
+                        help="same as --server-mode asyncio")
+    option(parser, 'server_mode', choices=('threading', 'asyncio'))
+    option(parser, 'udp_ip', help="UDP address to listen on")
+    option(parser, 'udp_port', type=int)
+    option(parser, 'http_port', type=int)
+    option(parser, 'tcp_port', type=optional(int), help="TCP feed for client.py, 'none' for off")
+    option(parser, 'feed_hz', type=float, help="TCP feed frames per second")
+
+    stream = parser.add_argument_group('Socket.IO stream')
+    option(stream, 'broadcast_hz', type=float, help="'ecg_batch' messages per second")
+    option(stream, 'emit_mode', choices=('batch', 'sample', 'both'))
+    option(stream, 'client_queue', type=int, help="messages queued per viewer")
+    option(stream, 'client_policy', choices=('drop-oldest', 'decimate', 'disconnect'))
+    option(stream, 'client_window', type=int, help="unacknowledged batches per viewer")
+
+    devices = parser.add_argument_group('devices')
+    option(devices, 'device_key', choices=('id', 'address'))
+    option(devices, 'max_devices', type=int)
+    option(devices, 'default_device', type=optional(str))
+    option(devices, 'buffer_seconds', type=float, help="live window length")
+    option(devices, 'max_sample_rate', type=float, help="live window is sized for this rate")
+    option(devices, 'legacy_sample_rate', type=float,
+           help="assumed rate of legacy 4-byte packets")
+    option(devices, 'filter_band', type=float, nargs=2, metavar=('LOW', 'HIGH'))
+    option(devices, 'notch_hz', type=optional(float), help="50 or 60, 'none' for off")
+    option(devices, 'filter_order', type=int)
+    option(devices, 'jitter_delay', type=float,
+           help="seconds a packet waits for a missing one")
+    option(devices, 'gap_fill', choices=('interpolate', 'none'))
+    option(devices, 'max_gap_fill', type=float, help="longest interpolated gap (s)")
+
+    history = parser.add_argument_group('history and spectrum')
+    option(history, 'archive_dir', type=optional(str), help="'none' turns history off")
+    option(history, 'rollup_seconds', type=int, nargs='+')
+    option(history, 'archive_segment_seconds', type=float)
+    option(history, 'spectrum_segment', type=optional(float),
+           help="seconds per FFT segment, 'none' for off")
+    option(history, 'spectrum_average', type=float)
+    option(history, 'spectrogram_seconds', type=float)
+    option(history, 'spectrum_hz', type=float, help="'ecg_spectrum' events per second")
+    option(history, 'spectrum_event_max_hz', type=float)
+
+    metrics = parser.add_argument_group('metrics')
+    metrics.add_argument('--no-metrics', dest='metrics', action='store_false',
+                         help="turn /metrics and its timers off")
+    option(metrics, 'metrics_log_seconds', type=optional(float),
+           help="print a summary line this often")
+
+
+def add_plot(commands):
+    parser = commands.add_parser('plot', help="plot a recording (or --capture UDP and plot it)",
+                                 argument_default=argparse.SUPPRESS)
+    parser.add_argument('input_file', nargs='?', help="text or .ecg recording")
+    option(parser, 'output_image', help="PNG to write")
+    option(parser, 'zoom_seconds', type=float, help="close-up length")
+    parser.add_argument('--no-show', dest='show', action='store_false',
+                        help="only save the image")
+    option(parser, 'dpi', type=int)
+    capture = parser.add_argument_group('capture')
+    capture.add_argument('--capture', action='store_true',
+                         help="record legacy 4-byte UDP packets first, then plot them")
+    option(capture, 'udp_ip')
+    option(capture, 'udp_port', type=int)
+    option(capture, 'duration', type=float, help="seconds to capture")
+    option(capture, 'filter_band', type=float, nargs=2, metavar=('LOW', 'HIGH'))
+    option(capture, 'filter_order', type=int)
+
+
+def add_simulate(commands):
+    parser = commands.add_parser('simulate', help="stream a synthetic ECG over UDP",
+                                 argument_default=argparse.SUPPRESS)
+    add_udp_sender_options(parser, "Hz, up to 10000")
+    option(parser, 'channels', type=int, help="channel k is sent as device DEVICE_ID + k")
+    option(parser, 'duration', type=optional(float), help="seconds to send, 'none' for no end")
+    parser.add_argument('--fast', dest='realtime', action='store_false',
+                        help="send as fast as possible")
+    option(parser, 'gain', type=int, choices=(1, 2, 4, 8, 16),
+           help="gain the codes are quantized at (delta only)")
+    signal = parser.add_argument_group('signal')
+    option(signal, 'heart_rate', type=float, help="BPM")
+    option(signal, 'hrv', type=float, help="RR spread (fraction of RR)")
+    option(signal, 'wander', type=float, help="baseline wander amplitude (V)")
+    option(signal, 'mains', type=float, help="mains interference amplitude (V)")
+    option(signal, 'mains_hz', type=float)
+    option(signal, 'noise', type=float, help="white noise standard deviation (V)")
+
+
+def add_replay(commands):
+    parser = commands.add_parser('replay', help="send recordings over UDP at their own timing",
+                                 argument_default=argparse.SUPPRESS)
+    parser.add_argument('files', nargs='+', help="text or .ecg recordings, played at once")
+    option(parser, 'target_ip', help="server address")
+    option(parser, 'udp_port', type=int, help="server UDP port")
+    option(parser, 'speed', type=float, help="1 = recorded timing, 60 = an hour a minute")
+    parser.add_argument('--fast', dest='speed', action='store_const', const=0,
+                        help="send as fast as possible (--speed 0)")
+    option(parser, 'loops', type=int, help="plays of each file, 0 to loop until Ctrl+C")
+    option(parser, 'batch_size', type=int, help="samples per UDP packet")
+    option(parser, 'device_id', type=int, help="file k is sent as device DEVICE_ID + k")
+    option(parser, 'encoding', choices=ENCODINGS,
+           help="'delta' packs ADC codes as varint differences")
+    option(parser, 'gain', type=int, choices=(1, 2, 4, 8, 16),
+           help="gain text recordings are quantized at (delta only)")
+    option(parser, 'report_seconds', type=optional(float),
+           help="seconds between progress lines, 'none' for none")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ecg', description="Raspberry Pi ECG tools")
+    parser.add_argument('--config', help="JSON file with options per subcommand")
+    parser.add_argument('--import-time', action='store_true',
+                        help="report how long the subcommand's imports took")
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for add in (add_record, add_send, add_serve, add_plot, add_simulate, add_replay):
+        add(commands)
+    return parser
+
+
+def load_config(parser, path, command):
+    """Options for command from a JSON config file (keys may be upper case too)"""
+    import json
+
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        parser.error(f"can't read config {path}: {e}")
+    section = config.get(command, {})
+    if not isinstance(section, dict):
+        parser.error(f"config {path}: '{command}' must be an object")
+    return {name.lower(): value for name, value in section.items()}
+
+
+def script_for(command, options):
+    """Module name of the script that runs command with these options"""
+    module, variant = SCRIPTS[command]
+    if variant is not None:
+        flag, other = variant
+        if options.pop(flag, False):
+            module = other
+    return module
+
+
+def check_options(parser, command, module, options):
+    """
+    parser.error for options the chosen script's main() doesn't take;
+    main(**options) scripts list theirs in SETTINGS (realtime_server.py)
+    """
+    import inspect
+
+    parameters = inspect.signature(module.main).parameters
+    accepted = set(parameters)
+    if any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+        accepted = {name.lower() for name in getattr(module, 'SETTINGS', options)}
+    unknown = sorted(set(options) - accepted)
+    if unknown:
+        names = ', '.join('--' + name.replace('_', '-') for name in unknown)
+        parser.error(f"{command}: {names} not used by {module.__name__}.py")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = vars(parser.parse_args(argv))
+    command = args.pop('command')
+    config, import_time = args.pop('config', None), args.pop('import_time')
+    options = load_config(parser, config, command) if config else {}
+    options.update(args)
+    # Lists from nargs or JSON stand in for the scripts' tuples
+    options = {name: tuple(value) if isinstance(value, list) else value
+               for name, value in options.items()}
+
+    module_name = script_for(command, options)
+    loaded = set(sys.modules)
+    started = time.perf_counter()
+    module = __import__(module_name)
+    elapsed = time.perf_counter() - started
+    if import_time:
+        heavy = [name for name in HEAVY_PACKAGES if name in sys.modules and name not in loaded]
+        print(f"ecg {command}: imported {module_name} in {elapsed * 1000:.0f} ms, "
+              f"{len(sys.modules) - len(loaded)} modules ({', '.join(heavy) or 'nothing heavy'})",
+              file=sys.stderr)
+
+    check_options(parser, command, module, options)
+    try:
+        module.main(**options)
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
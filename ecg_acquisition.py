@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+ECG Acquisition Scheduler
+Deadline-based sampling loop shared by the recorders, senders and simulators
+
+A plain `read(); time.sleep(interval)` loop adds the read and write time
+to every period, so a "200 Hz" loop really runs at ~150 Hz with jitter.
+SampleScheduler instead sleeps until absolute deadlines (start + n * period),
+so slow iterations are compensated by shorter sleeps and the average rate
+does not drift. Iterations that overrun a whole period are counted and
+the missed slots skipped rather than bursting to catch up.
+
+Any object with `.voltage` and `.value` attributes can be sampled, which
+is the adafruit AnalogIn interface; SimulatedADC provides the same
+interface on a plain Linux box.
+"""
+
+import os
+import threading
+import time
+
+# Sleep this much short of a deadline, then spin; keeps wake-up jitter
+# below the scheduler tick. On a single core (Pi Zero) the spin takes the
+# CPU from the writer/sender stages, so there it only sleeps by default
+SPIN_MARGIN = 0.0005 if (os.cpu_count() or 1) > 1 else 0.0
+
+
+class SimulatedADC:
+    """
+    Stand-in for adafruit AnalogIn: `.voltage` evaluates waveform(t) at the
+    current time, `.value` is the matching 16-bit ADC code.
+    """
+
+    def __init__(self, waveform, full_scale=4.096):
+        self.waveform = waveform
+        self.scale = full_scale / 32768.0
+        self._start = time.monotonic()
+
+    @property
+    def voltage(self):
+        return self.waveform(time.monotonic() - self._start)
+
+    @property
+    def value(self):
+        return max(-32768, min(32767, int(round(self.voltage / self.scale))))
+
+
+def open_ads1115(channel=0, negative=None, gain=1, address=0x48, data_rate=None):
+    """Open an ADS1115 input (differential when `negative` is given); imports the Pi libraries lazily"""
+    import board
+    import busio
+    import adafruit_ads1x15.ads1115 as ADS
+    from adafruit_ads1x15.analog_in import AnalogIn
+
+    i2c = busio.I2C(board.SCL, board.SDA)
+    ads = ADS.ADS1115(i2c, address=address)
+    ads.gain = gain
+    if data_rate is not None:
+        ads.data_rate = data_rate
+    if negative is None:
+        return AnalogIn(ads, channel)
+    return AnalogIn(ads, channel, negative)
+
+
+class SampleScheduler:
+    """
+    Runs reads at absolute deadlines and records when each one happened.
+
+    for index, elapsed, value in SampleScheduler(500).run(chan, duration=10):
+        ...
+
+    `elapsed` is the real acquisition time (seconds since start, taken at
+    the midpoint of the read), not the nominal deadline.
+
+    Each wait sleeps until `spin_margin` seconds before the deadline and
+    busy-waits the rest: 0 only sleeps (a few hundred microseconds more
+    jitter, no CPU spent), None takes SPIN_MARGIN.
+    """
+
+    def __init__(self, sample_rate, spin_margin=None):
+        self.sample_rate = float(sample_rate)
+        self.period = 1.0 / self.sample_rate
+        self.spin_margin = SPIN_MARGIN if spin_margin is None else spin_margin
+        self.count = 0          # samples taken
+        self.overruns = 0       # iterations that finished after the next deadline
+        self.missed = 0         # deadlines skipped because of overruns
+        self.max_late = 0.0     # worst lateness of a read vs. its deadline (s)
+        self.start_time = None  # wall-clock time of the first deadline
+        self.started = threading.Event()    # set once start_time is known
+        self.elapsed = 0.0
+        self._stop = False
+
+    def stop(self):
+        """Make run() return after the current sample"""
+        self._stop = True
+
+    def _wait_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_margin:
+            time.sleep(remaining - self.spin_margin)
+        if self.spin_margin:
+            while time.perf_counter() < deadline:
+                pass
+
+    def run(self, channel, duration=None, raw=False):
+        """Yield (index, elapsed, value) for each sample; value is .value if raw else .voltage"""
+        period = self.period
+        self.start_time = time.time()
+        start = time.perf_counter()
+        self.started.set()
+        slot = 0
+        self._stop = False
+
+        while not self._stop:
+            deadline = start + slot * period
+            if duration is not None and deadline - start >= duration:
+                break
+            self._wait_until(deadline)
+
+            before = time.perf_counter()
+            value = channel.value if raw else channel.voltage
+            after = time.perf_counter()
+            self.max_late = max(self.max_late, before - deadline)
+
+            elapsed = (before + after) / 2 - start
+            yield self.count, elapsed, value
+            self.count += 1
+            self.elapsed = elapsed
+
+            # Caller's processing is included: are we already past the next slot?
+            slot += 1
+            now = time.perf_counter()
+            behind = int((now - start) / period) - slot
+            if now > start + slot * period:
+                self.overruns += 1
+            if behind > 0:
+                # Skip missed slots instead of bursting to catch up
+                self.missed += behind
+                slot += behind
+
+    @property
+    def actual_rate(self):
+        return (self.count - 1) / self.elapsed if self.count > 1 and self.elapsed > 0 else 0.0
+
+    def report(self):
+        """One-line timing summary"""
+        return (f"{self.count} samples in {self.elapsed:.3f}s "
+                f"({self.actual_rate:.2f} Hz, target {self.sample_rate:.0f} Hz), "
+                f"{self.overruns} overruns, {self.missed} missed, "
+                f"max late {self.max_late * 1000:.2f} ms")
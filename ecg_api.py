@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+ECG HTTP API
+Route logic shared by the Flask server (realtime_server.py) and the
+asyncio server (ecg_async_server.py)
+
+Each server turns its request into plain values (query arguments, Accept
+and If-None-Match headers), calls one of the *_view functions and copies
+the returned ApiResponse into its own response type, so both modes answer
+every route byte for byte the same.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags
+
+from ecg_protocol import encode_data_frame, DATA_CONTENT_TYPE
+from ecg_decimate import METHODS as DECIMATION_METHODS
+from ecg_devices import CHANNELS, DEVICE_COLUMNS
+from ecg_archive import device_directory, query as query_archive
+from ecg_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+JSON_CONTENT_TYPE = 'application/json'
+HISTORY_SECONDS = 3600      # default /history range, ending now
+MAX_HISTORY_POINTS = 10000
+
+
+class ApiResponse:
+    """Status, body bytes, content type, unquoted ETag and extra headers"""
+
+    __slots__ = ('status', 'body', 'content_type', 'etag', 'headers')
+
+    def __init__(self, status=200, body=b'', content_type=JSON_CONTENT_TYPE, etag=None,
+                 headers=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.headers = headers or {}
+
+
+def json_response(payload, status=200, **kwargs):
+    return ApiResponse(status, json.dumps(payload, separators=(',', ':')).encode(), **kwargs)
+
+
+def error_response(message, status=400):
+    return json_response({'error': message}, status)
+
+
+def int_arg(args, name):
+    """Integer query argument, None when missing or malformed"""
+    try:
+        return int(args.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def float_arg(args, name):
+    """Float query argument, None when missing or malformed"""
+    try:
+        return float(args.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def wants_binary(args, accept_header):
+    """Binary if ?format=binary or the Accept header prefers it over JSON"""
+    fmt = args.get('format')
+    if fmt:
+        return fmt == 'binary'
+    accept = parse_accept_header(accept_header, MIMEAccept)
+    best = accept.best_match([JSON_CONTENT_TYPE, DATA_CONTENT_TYPE, 'application/octet-stream'])
+    return best is not None and best != JSON_CONTENT_TYPE
+
+
+def empty_columns():
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in DEVICE_COLUMNS}
+
+
+def resolve_device(devices, name):
+    """Device for a URL, the default device when name is None; (device, error response)"""
+    if name is None:
+        # Nothing received yet is not an error for the default view
+        return devices.default(), None
+    device = devices.get(name)
+    if device is None:
+        return None, error_response(f"unknown device {name!r}", 404)
+    return device, None
+
+
+def devices_view(devices):
+    """Every device heard from, with its sample rate, counters and BPM"""
+    default = devices.default()
+    return json_response({
+        'default': default.name if default else None,
+        'devices': [device.info() for device in devices]
+    })
+
+
+def data_view(devices, name, args, accept_header=None, if_none_match=None):
+    """
+    Buffered data for one device (the default device when name is None).
+
+    ?since=<cursor>  only samples with sequence number >= cursor; pass the
+                     'next' value of the previous response to poll
+    ?limit=<n>       at most the newest n samples
+    ?format=binary   float32 columns (see ecg_protocol.encode_data_frame)
+                     instead of JSON, also selected by Accept header
+    ?points=<n>      decimated view of the whole window sized for a chart
+                     n pixels wide (since/limit are ignored)
+    ?method=<m>      decimation method, 'minmax' (default) or 'lttb'
+    ?channel=<c>     channel to decimate, 'raw' (default) or 'filtered'
+    """
+    device, error = resolve_device(devices, name)
+    if error:
+        return error
+    since = int_arg(args, 'since')
+    limit = int_arg(args, 'limit')
+    points = int_arg(args, 'points')
+    method = args.get('method', 'minmax')
+    channel = args.get('channel', 'raw')
+    binary = wants_binary(args, accept_header)
+    if method not in DECIMATION_METHODS:
+        return error_response(f"method must be one of {', '.join(DECIMATION_METHODS)}")
+    if channel not in CHANNELS:
+        return error_response(f"channel must be one of {', '.join(CHANNELS)}")
+    if points is not None:
+        since = limit = None
+
+    buffer = device.buffer if device else None
+    end = buffer.end if buffer else 0
+    if since is not None and since > end:
+        # Cursor from before a server restart, start over
+        since = None
+
+    # The answer only depends on the device, the request and how much has been written
+    tag = f"{device.name if device else ''}-{since}-{limit}-{points}-{method}-{channel}-{int(binary)}"
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept'}
+    if parse_etags(if_none_match).contains(f"{end}-{tag}"):
+        return ApiResponse(304, etag=f"{end}-{tag}", headers=headers)
+
+    if buffer is None:
+        first, columns, next_seq = 0, empty_columns(), 0
+    elif points is not None:
+        # Cached per resolution, only new samples get folded in
+        first = buffer.start
+        times, values = device.views[channel].get(points, method)
+        columns = {'time': times, CHANNELS[channel]: values}
+        next_seq = buffer.end
+    else:
+        # The snapshot copies under the buffer lock, encoding happens without it
+        first, columns = buffer.snapshot(since=since, limit=limit)
+        next_seq = first + len(columns['time'])
+
+    # Raw and/or filtered columns, in that order
+    names = [column for column in ('voltage', 'filtered') if column in columns]
+    etag = f"{next_seq}-{tag}"
+    if binary:
+        body = encode_data_frame(first, next_seq, columns['time'], *(columns[c] for c in names))
+        return ApiResponse(200, body, DATA_CONTENT_TYPE, etag, headers)
+
+    payload = {
+        'start': first,
+        'next': next_seq,
+        'timestamps': columns['time'].tolist()
+    }
+    if device:
+        payload['device'] = device.name
+        payload['link'] = device.jitter.stats()
+    if 'voltage' in columns:
+        payload['voltages'] = columns['voltage'].tolist()
+    if 'filtered' in columns:
+        payload['filtered'] = columns['filtered'].tolist()
+    return json_response(payload, etag=etag, headers=headers)
+
+
+def clients_view(devices):
+    """Every Socket.IO client's send queue: queued messages, lag, sent/dropped/merged"""
+    return json_response(devices.clients.stats(), headers={'Cache-Control': 'no-cache'})
+
+
+def metrics_view(metrics):
+    """Prometheus text exposition of the server's counters, histograms and gauges"""
+    if not metrics.enabled:
+        return error_response("metrics are disabled (METRICS is False)", 404)
+    return ApiResponse(200, metrics.render().encode(), METRICS_CONTENT_TYPE,
+                       headers={'Cache-Control': 'no-cache'})
+
+
+def spectrum_view(devices, name, args):
+    """
+    Rolling power spectrum of one device (the default device when name is None).
+
+    ?max_freq=<Hz>     only bins up to this frequency (default: all)
+    ?spectrogram=1     also the spectrogram history, one dB row per segment
+    """
+    device, error = resolve_device(devices, name)
+    if error:
+        return error
+    if device is not None and device.spectrum is None:
+        return error_response("the spectrum is disabled (SPECTRUM_SEGMENT is None)", 404)
+    payload = None
+    if device is not None:
+        payload = device.spectrum.to_dict(float_arg(args, 'max_freq'),
+                                          args.get('spectrogram') in ('1', 'true'))
+    if payload is None:
+        # Not a full segment yet
+        payload = {'frames': 0, 'freqs': [], 'psd_db': []}
+    payload['device'] = device.name if device else None
+    return json_response(payload, headers={'Cache-Control': 'no-cache'})
+
+
+def heart_rate_view(devices, name):
+    """Smoothed BPM and the most recent beats from a device's QRS detector"""
+    device, error = resolve_device(devices, name)
+    if error:
+        return error
+    if device is None:
+        return json_response({'bpm': None, 'last_beat': None, 'beats': []})
+    return json_response({
+        'device': device.name,
+        'bpm': device.qrs.heart_rate,
+        'last_beat': device.qrs.last_beat,
+        'beats': list(device.recent_beats)
+    })
+
+
+def history_view(devices, name, args):
+    """
+    Archived history for one device (the default device when name is None).
+
+    ?start=<unix s>  range start, default an hour before end
+    ?end=<unix s>    range end, default now
+    ?points=<n>      at most n min/max/mean buckets (default 1000), answered
+                     from the coarsest rollup tier that fits (see ecg_archive.query)
+    """
+    if devices.archive_dir is None:
+        return error_response("history is disabled (ARCHIVE_DIR is None)", 404)
+    if name is None:
+        device = devices.default()
+        name = device.name if device else devices.default_name
+    directory = device_directory(devices.archive_dir, name)
+    if name is None or not os.path.isdir(directory):
+        return error_response(f"no history for device {name!r}", 404)
+
+    end = float_arg(args, 'end')
+    end = time.time() if end is None else end
+    start = float_arg(args, 'start')
+    start = end - HISTORY_SECONDS if start is None else start
+    points = int_arg(args, 'points') or 1000
+    if not start < end:
+        return error_response("start must be before end")
+    points = max(1, min(points, MAX_HISTORY_POINTS))
+
+    result = query_archive(directory, start, end, points, devices.archive_tiers)
+    result['device'] = name
+    return json_response(result, headers={'Cache-Control': 'no-cache'})
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+ECG Archive
+Persistent, time-indexed history with min/max/mean rollups
+
+Layout, one directory per device under the archive root:
+
+    archive/<device>/
+        20261017-091500.ecg     raw samples, ecg_recording.py chunked format,
+        20261017-101500.ecg     a new segment per server run and per hour;
+                                delta packed ADC codes when the device sends
+                                codes, float32 volts otherwise
+        rollup_1s.bin           min/max/mean per second
+        rollup_10s.bin          ... per 10 s
+        rollup_60s.bin          ... per minute
+
+Rollup files are flat arrays of ROLLUP_DTYPE records in time order, so the
+time index is the record array itself: a range lookup is a searchsorted on
+a memory map. Each tier is built from the one below it (samples -> 1 s ->
+10 s -> 1 min), only complete buckets are written, and everything is
+append-only, so readers in other threads (or processes) never see a half
+written record.
+
+query() answers a time range from the coarsest tier that still has at
+least the requested resolution, so a 24 hour overview reads ~1500
+one-minute records instead of 40 million samples. Times are unix seconds.
+"""
+
+import os
+import re
+import time
+
+import numpy as np
+
+from ecg_recording import RecordingWriter, RecordingReader, DTYPE_FLOAT32, DTYPE_DELTA
+
+ROLLUP_DTYPE = np.dtype([('time', '<f8'), ('min', '<f4'), ('max', '<f4'),
+                         ('mean', '<f4'), ('count', '<u4')])
+DEFAULT_TIERS = (1, 10, 60)     # rollup bucket widths (s)
+SEGMENT_SECONDS = 3600          # start a new raw segment file after this long
+SEGMENT_SUFFIX = '.ecg'
+SEGMENT_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def device_directory(root, device):
+    """Directory for a device's archive; ids are sanitized for use as a name"""
+    return os.path.join(root, re.sub(r'[^\w.-]', '_', str(device)))
+
+
+def rollup_path(directory, width):
+    return os.path.join(directory, f"rollup_{width:g}s.bin")
+
+
+def read_rollup(path):
+    """All complete records of a rollup file, memory mapped"""
+    try:
+        count = os.path.getsize(path) // ROLLUP_DTYPE.itemsize
+    except OSError:
+        count = 0
+    if count == 0:
+        return np.zeros(0, dtype=ROLLUP_DTYPE)
+    return np.memmap(path, dtype=ROLLUP_DTYPE, mode='r', shape=(count,))
+
+
+def combine(times, mins, maxs, sums, counts, width):
+    """
+    Group time-ordered partial aggregates into buckets of `width` seconds.
+    Returns (bucket ids, mins, maxs, sums, counts), one entry per bucket.
+    """
+    ids = np.floor(times / width).astype(np.int64)
+    # Arrival-time jitter can step back a little; never reopen a bucket
+    ids = np.maximum.accumulate(ids)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    return (ids[starts], np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts),
+            np.add.reduceat(sums, starts), np.add.reduceat(counts, starts))
+
+
+class RollupTier:
+    """One resolution: accumulates aggregates and appends complete buckets to its file"""
+
+    def __init__(self, path, width):
+        self.path = path
+        self.width = float(width)
+        # The open bucket: id, min, max, sum, count
+        self._pending = None
+        existing = read_rollup(path)
+        self._last = int(existing['time'][-1] // self.width) if len(existing) else None
+        self._file = open(path, 'ab')
+
+    def add(self, times, mins, maxs, sums, counts):
+        """Fold in aggregates (or raw samples with min = max = sum, count 1); returns completed records"""
+        if len(times) == 0:
+            return None
+        ids, mins, maxs, sums, counts = combine(np.asarray(times, dtype=np.float64),
+                                                np.asarray(mins, dtype=np.float64),
+                                                np.asarray(maxs, dtype=np.float64),
+                                                np.asarray(sums, dtype=np.float64),
+                                                np.asarray(counts, dtype=np.int64), self.width)
+        if self._pending is not None:
+            pid, pmin, pmax, psum, pcount = self._pending
+            if ids[0] <= pid:
+                # Continues the open bucket
+                ids[0] = pid
+                mins[0] = min(mins[0], pmin)
+                maxs[0] = max(maxs[0], pmax)
+                sums[0] += psum
+                counts[0] += pcount
+            else:
+                ids = np.concatenate(([pid], ids))
+                mins = np.concatenate(([pmin], mins))
+                maxs = np.concatenate(([pmax], maxs))
+                sums = np.concatenate(([psum], sums))
+                counts = np.concatenate(([pcount], counts))
+
+        # The last bucket may still grow
+        self._pending = (ids[-1], mins[-1], maxs[-1], sums[-1], counts[-1])
+        done = slice(0, len(ids) - 1)
+        if self._last is not None:
+            # Never write a bucket twice (e.g. after a restart within the same bucket)
+            keep = ids[done] > self._last
+        else:
+            keep = np.ones(len(ids) - 1, dtype=bool)
+        if not keep.any():
+            return None
+
+        records = np.zeros(int(keep.sum()), dtype=ROLLUP_DTYPE)
+        records['time'] = ids[done][keep] * self.width
+        records['min'] = mins[done][keep]
+        records['max'] = maxs[done][keep]
+        records['mean'] = sums[done][keep] / counts[done][keep]
+        records['count'] = counts[done][keep]
+        self._file.write(records.tobytes())
+        self._file.flush()
+        self._last = int(ids[done][keep][-1])
+        return records
+
+    def close(self):
+        self._file.close()
+
+
+class DeviceArchive:
+    """
+    Appends one device's samples to raw segments and all rollup tiers.
+    With `scale` (volts per ADC code, for devices sending codes) segments are
+    stored delta packed at that scale, which loses nothing.
+    """
+
+    def __init__(self, root, device, sample_rate, tiers=DEFAULT_TIERS,
+                 segment_seconds=SEGMENT_SECONDS, scale=None, gain=1):
+        self.directory = device_directory(root, device)
+        os.makedirs(self.directory, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.scale = scale
+        self.gain = gain
+        self.segment_seconds = segment_seconds
+        self.tiers = [RollupTier(rollup_path(self.directory, width), width)
+                      for width in sorted(tiers)]
+        self._writer = None
+        self._segment_start = None
+
+    def _segment(self, t):
+        """Writer for a sample at unix time t, rolling over to a new segment when due"""
+        if self._writer is None or t - self._segment_start >= self.segment_seconds:
+            if self._writer is not None:
+                self._writer.close()
+            name = time.strftime(SEGMENT_FORMAT, time.localtime(t)) + SEGMENT_SUFFIX
+            dtype = DTYPE_FLOAT32 if self.scale is None else DTYPE_DELTA
+            self._writer = RecordingWriter(os.path.join(self.directory, name), self.sample_rate,
+                                           gain=self.gain, dtype=dtype, scale=self.scale,
+                                           start_time=t)
+            self._segment_start = t
+        return self._writer
+
+    def append(self, times, values):
+        """Archive samples taken at unix `times`"""
+        if len(times) == 0:
+            return
+        writer = self._segment(float(times[0]))
+        writer.write_samples(np.asarray(times) - writer.start_time, values, volts=True)
+
+        values = np.asarray(values, dtype=np.float64)
+        records = (times, values, values, values, np.ones(len(values), dtype=np.int64))
+        for tier in self.tiers:
+            records = tier.add(*records)
+            if records is None:
+                break
+            # The next tier is built from this tier's completed buckets
+            records = (records['time'], records['min'], records['max'],
+                       records['mean'] * records['count'], records['count'])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        for tier in self.tiers:
+            tier.close()
+
+
+def segments(directory):
+    """(start unix time, path) of every raw segment, oldest first"""
+    found = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return found
+    for name in names:
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+        try:
+            start = time.mktime(time.strptime(name[:-len(SEGMENT_SUFFIX)], SEGMENT_FORMAT))
+        except ValueError:
+            continue
+        found.append((start, os.path.join(directory, name)))
+    return sorted(found)
+
+
+def read_raw(directory, start, end):
+    """Raw samples with start <= time < end as (unix times, volts)"""
+    times, volts = [], []
+    found = segments(directory)
+    for i, (segment_start, path) in enumerate(found):
+        # Segment names are rounded down to the second
+        if segment_start >= end or (i + 1 < len(found) and found[i + 1][0] < start - 1):
+            continue
+        try:
+            reader = RecordingReader(path)
+        except (OSError, ValueError):
+            continue
+        t, v = reader.read_time_range(start - reader.start_time, end - reader.start_time)
+        times.append(t + reader.start_time)
+        volts.append(v)
+    if not times:
+        return np.zeros(0), np.zeros(0, dtype=np.float32)
+    return np.concatenate(times), np.concatenate(volts)
+
+
+def reduce_records(times, mins, maxs, means, counts, points):
+    """Merge consecutive records into at most `points` buckets"""
+    n = len(times)
+    if n <= points:
+        return times, mins, maxs, means, counts
+    size = int(np.ceil(n / points))
+    starts = np.arange(0, n, size)
+    total = np.add.reduceat(counts.astype(np.int64), starts)
+    weighted = np.add.reduceat(means.astype(np.float64) * counts, starts)
+    return (times[starts], np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts),
+            weighted / np.maximum(total, 1), total)
+
+
+def query(directory, start, end, points=1000, tiers=DEFAULT_TIERS):
+    """
+    Min/max/mean of [start, end) in at most `points` buckets, answered from
+    the coarsest tier whose width is at most (end - start) / points, or the
+    raw segments when even the finest tier is too coarse. Returns a dict
+    with 'tier' ('raw' or the width in seconds) and time/min/max/mean/count
+    lists; times are bucket (or sample) start times.
+    """
+    points = max(1, int(points))
+    resolution = (end - start) / points
+    usable = [width for width in sorted(tiers) if width <= resolution]
+
+    if usable:
+        tier = usable[-1]
+        records = read_rollup(rollup_path(directory, tier))
+        lo = int(np.searchsorted(records['time'], start - tier, side='right'))
+        hi = int(np.searchsorted(records['time'], end, side='left'))
+        block = np.array(records[lo:hi])
+        columns = (block['time'], block['min'], block['max'], block['mean'], block['count'])
+    else:
+        tier = 'raw'
+        times, volts = read_raw(directory, start, end)
+        columns = (times, volts, volts, volts, np.ones(len(times), dtype=np.int64))
+
+    times, mins, maxs, means, counts = reduce_records(*columns, points)
+    return {
+        'start': start,
+        'end': end,
+        'tier': tier,
+        'time': np.asarray(times, dtype=np.float64).tolist(),
+        'min': np.round(np.asarray(mins, dtype=np.float64), 6).tolist(),
+        'max': np.round(np.asarray(maxs, dtype=np.float64), 6).tolist(),
+        'mean': np.round(np.asarray(means, dtype=np.float64), 6).tolist(),
+        'count': np.asarray(counts, dtype=np.int64).tolist()
+    }
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+ECG asyncio Server
+UDP ingestion, HTTP routes and the Socket.IO stream on one event loop
+
+The default server (Flask-SocketIO, async_mode='threading') runs a
+blocking receiver thread plus a thread per connection. This mode does the
+same work without threads: packets arrive through an
+asyncio.DatagramProtocol, /data and the static files are aiohttp
+handlers, and one task publishes every device's 'ecg_batch' per tick and
+drains the per-client send queues (ecg_clients.py). Routes (via
+ecg_api.py), events and subscriptions are the same as realtime_server.py.
+
+Needs aiohttp (pip install aiohttp). Start it with
+    python3 realtime_server.py --asyncio
+or SERVER_MODE = 'asyncio' in realtime_server.py. Only EMIT_MODE 'batch'
+is supported; the per-sample 'ecg_data' event is not.
+"""
+
+import asyncio
+import os
+import time
+
+import socketio
+from aiohttp import web
+from werkzeug.http import quote_etag
+
+from ecg_protocol import decode_packet, ProtocolError
+from ecg_devices import DeviceRegistry
+from ecg_api import (devices_view, data_view, heart_rate_view, history_view, clients_view,
+                     metrics_view, spectrum_view)
+
+
+class ECGDatagramProtocol(asyncio.DatagramProtocol):
+    """Hands every datagram to the server on the event loop"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.handle_datagram(data, addr)
+
+    def error_received(self, exc):
+        print(f"Error receiving data: {exc}")
+
+
+def to_aiohttp(result):
+    """aiohttp response for an ecg_api.ApiResponse"""
+    headers = dict(result.headers)
+    if result.etag:
+        headers['ETag'] = quote_etag(result.etag)
+    # As a header, so types with parameters (charset) pass through unchanged
+    headers['Content-Type'] = result.content_type
+    return web.Response(status=result.status, body=result.body or None, headers=headers)
+
+
+@web.middleware
+async def allow_cors(request, handler):
+    response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+class AsyncECGServer:
+    """
+    server = AsyncECGServer(broadcast_hz=30, key='id', buffer_seconds=10, ...)
+    server.run('0.0.0.0', 5001, '0.0.0.0', 5006)
+
+    Keyword arguments other than static_folder and broadcast_hz go to
+    DeviceRegistry; with an enabled `metrics` there every route is timed.
+    """
+
+    def __init__(self, static_folder='build', broadcast_hz=30, **registry_options):
+        registry_options['emit_mode'] = 'batch'
+        self.static_folder = os.path.abspath(static_folder)
+        self.interval = 1.0 / broadcast_hz
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+        self.devices = DeviceRegistry(self.sio, autostart=False, broadcast_hz=broadcast_hz,
+                                      **registry_options)
+        self.metrics = self.devices.metrics
+        middlewares = [allow_cors]
+        if self.metrics.enabled:
+            middlewares.append(self.time_request)
+        self.app = web.Application(middlewares=middlewares)
+        self.sio.attach(self.app)
+        self.app.router.add_get('/devices', self.get_devices)
+        self.app.router.add_get('/data', self.get_data)
+        self.app.router.add_get('/data/{device}', self.get_data)
+        self.app.router.add_get('/heart_rate', self.get_heart_rate)
+        self.app.router.add_get('/heart_rate/{device}', self.get_heart_rate)
+        self.app.router.add_get('/history', self.get_history)
+        self.app.router.add_get('/history/{device}', self.get_history)
+        self.app.router.add_get('/spectrum', self.get_spectrum)
+        self.app.router.add_get('/spectrum/{device}', self.get_spectrum)
+        self.app.router.add_get('/clients', self.get_clients)
+        self.app.router.add_get('/metrics', self.get_metrics)
+        # Anything else is a build file or index.html for React Router
+        self.app.router.add_get('/{path:.*}', self.static)
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('disconnect', self.on_disconnect)
+        self.sio.on('subscribe', self.on_subscribe)
+        self._transport = None
+        self._broadcast_task = None
+
+    # --- UDP ----------------------------------------------------------------
+
+    def handle_datagram(self, data, addr):
+        try:
+            packet = decode_packet(data)
+        except ProtocolError as e:
+            self.metrics.decode_errors.inc()
+            print(f"Dropping bad packet from {addr[0]}: {e}")
+            return
+
+        try:
+            device, beats = self.devices.ingest(packet, addr)
+            # Beats are rare (~1/s), they go out with the next tick
+            for event in beats:
+                self.devices.clients.publish(device.name, 'ecg_beat', event)
+        except Exception as e:
+            print(f"Error handling packet: {e}")
+
+    async def _broadcast(self):
+        clients = self.devices.clients
+        while True:
+            await asyncio.sleep(self.interval)
+            # Packets the jitter buffers held past their delay go out with this tick
+            try:
+                for device, beats in self.devices.poll():
+                    for event in beats:
+                        clients.publish(device.name, 'ecg_beat', event)
+            except Exception as e:
+                print(f"Error handling packet: {e}")
+            for device in self.devices:
+                message = device.broadcaster.payload()
+                if message is not None:
+                    clients.publish(device.name, 'ecg_batch', message, device.broadcaster.arrival)
+
+            sends, overflowed = clients.drain()
+            timed = self.metrics.enabled
+            for sid, event, message, callback in sends:
+                start = time.perf_counter() if timed else 0.0
+                try:
+                    await self.sio.emit(event, message, to=sid, callback=callback)
+                except Exception as e:
+                    print(f"Error sending {event} to client {sid}: {e}")
+                if timed:
+                    self.metrics.emit_seconds.observe(time.perf_counter() - start)
+            for sid in overflowed:
+                print(f"Disconnecting client {sid}: send queue overflowed")
+                await self.sio.disconnect(sid)
+
+    # --- Socket.IO ----------------------------------------------------------
+
+    async def on_connect(self, sid, environ, auth=None):
+        # Until a client subscribes it gets the default device
+        self.devices.clients.add(sid, self.devices.subscription({}))
+
+    async def on_disconnect(self, sid, *args):
+        self.devices.clients.remove(sid)
+
+    async def on_subscribe(self, sid, data):
+        """Same as realtime_server.on_subscribe; returns the device ids subscribed to"""
+        wanted = self.devices.subscription(data)
+        self.devices.clients.subscribe(sid, wanted)
+        return wanted
+
+    # --- HTTP ---------------------------------------------------------------
+
+    async def get_devices(self, request):
+        return to_aiohttp(devices_view(self.devices))
+
+    async def get_data(self, request):
+        return to_aiohttp(data_view(self.devices, request.match_info.get('device'), request.query,
+                                    request.headers.get('Accept'),
+                                    request.headers.get('If-None-Match')))
+
+    async def get_heart_rate(self, request):
+        return to_aiohttp(heart_rate_view(self.devices, request.match_info.get('device')))
+
+    async def get_history(self, request):
+        return to_aiohttp(history_view(self.devices, request.match_info.get('device'),
+                                       request.query))
+
+    async def get_spectrum(self, request):
+        return to_aiohttp(spectrum_view(self.devices, request.match_info.get('device'),
+                                        request.query))
+
+    async def get_clients(self, request):
+        return to_aiohttp(clients_view(self.devices))
+
+    async def get_metrics(self, request):
+        return to_aiohttp(metrics_view(self.metrics))
+
+    @web.middleware
+    async def time_request(self, request, handler):
+        start = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            route = request.match_info.route.resource
+            name = route.canonical if route is not None else 'other'
+            self.metrics.request_seconds.labels(name).observe(time.perf_counter() - start)
+
+    async def static(self, request):
+        path = os.path.normpath(os.path.join(self.static_folder, request.match_info['path']))
+        if (os.path.commonpath([path, self.static_folder]) != self.static_folder
+                or not os.path.isfile(path)):
+            path = os.path.join(self.static_folder, 'index.html')
+        if not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    # --- Lifecycle ----------------------------------------------------------
+
+    async def start_udp(self, udp_ip, udp_port):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: ECGDatagramProtocol(self), local_addr=(udp_ip, udp_port))
+        self._broadcast_task = asyncio.ensure_future(self._broadcast())
+        print(f"UDP receiver listening on {udp_ip}:{udp_port}")
+
+    async def stop_udp(self):
+        if self._broadcast_task:
+            self._broadcast_task.cancel()
+        if self._transport:
+            self._transport.close()
+        self.devices.close()
+
+    def run(self, host, http_port, udp_ip, udp_port):
+        """Serve until interrupted (blocks)"""
+        async def on_startup(app):
+            await self.start_udp(udp_ip, udp_port)
+
+        async def on_cleanup(app):
+            await self.stop_udp()
+
+        self.app.on_startup.append(on_startup)
+        self.app.on_cleanup.append(on_cleanup)
+        print(f"Starting asyncio web server on http://localhost:{http_port}")
+        web.run_app(self.app, host=host, port=http_port, print=None)
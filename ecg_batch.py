@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+ECG Batch Analysis
+Filters, measures and plots every recording in a directory, in parallel
+
+For each text recording (ecg_data.txt format) and binary .ecg recording
+under the directory, a worker process:
+    loads it (ecg_loader.py / ecg_recording.py)
+    filters it with a zero-phase 0.5-40 Hz bandpass (plus optional notch)
+    computes signal statistics and dropouts (sample gaps > 1.5 periods)
+    finds beats with the live server's QRS detector, fed 1 s at a time:
+        heart rate, SDNN, RMSSD
+    renders <name>.png: the whole raw and filtered traces min/max decimated
+    to --points, a 10 s close-up with beat markers and the RR tachogram
+and writes <name>.json with the results and how long each stage took.
+
+Results are keyed by a SHA-256 of the file's contents and the analysis
+settings, so a re-run only redoes files that changed (--force redoes
+everything). index.csv collects one summary row per file. Files are
+handed out largest first so one long session doesn't end up running
+alone at the end.
+
+Usage:
+    python3 ecg_batch.py sessions/ --output reports/ [--jobs 8] [--notch 50] [--force]
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from scipy import signal
+
+from ecg_decimate import minmax_decimate
+from ecg_filters import design_sos, DEFAULT_BAND
+from ecg_loader import load
+from ecg_qrs import QRSDetector
+from ecg_recording import RecordingReader
+
+# Bump when the analysis or the report changes, so cached results are redone
+ANALYSIS_VERSION = 1
+
+TEXT_SUFFIXES = ('.txt', '.csv')
+BINARY_SUFFIX = '.ecg'
+ZOOM_SECONDS = 10
+HASH_BLOCK = 1 << 20
+QRS_BLOCK_SECONDS = 1.0   # the detector is fed in blocks this long, like the live batches
+INDEX_NAME = 'index.csv'
+
+INDEX_COLUMNS = ('file', 'status', 'samples', 'duration', 'sample_rate', 'mean', 'std',
+                 'min', 'max', 'dropouts', 'beats', 'bpm', 'bpm_min', 'bpm_max', 'sdnn_ms',
+                 'rmssd_ms', 'seconds')
+
+
+def find_recordings(root, output=None):
+    """
+    Every recording under root, largest first. The `output` directory is
+    not searched (and its index.csv skipped if it is root itself), so a
+    re-run never analyzes its own reports.
+    """
+    output = os.path.realpath(output) if output is not None else None
+    found = []
+    for directory, dirs, names in os.walk(root):
+        # Skip hidden directories (and loader caches)
+        dirs[:] = [d for d in dirs if not d.startswith('.')
+                   and os.path.realpath(os.path.join(directory, d)) != output]
+        in_output = os.path.realpath(directory) == output
+        for name in names:
+            if name.startswith('.') or (in_output and name == INDEX_NAME):
+                continue
+            if name.endswith(TEXT_SUFFIXES) or name.endswith(BINARY_SUFFIX):
+                path = os.path.join(directory, name)
+                found.append((os.path.getsize(path), path))
+    return [path for _, path in sorted(found, reverse=True)]
+
+
+def content_hash(path, settings):
+    """SHA-256 of the file's bytes and the settings that shape the result"""
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def report_name(root, path):
+    """Output file stem: the path below root with separators flattened"""
+    return os.path.relpath(path, root).replace(os.sep, '__')
+
+
+def load_recording(path):
+    """(times, volts) of a text or binary recording"""
+    if path.endswith(BINARY_SUFFIX):
+        return RecordingReader(path).read_all()
+    # The loader's .npz cache would double the disk used by the sessions
+    _, times, volts = load(path, use_cache=False)
+    return times, volts
+
+
+def signal_stats(times, volts):
+    period = float(np.median(np.diff(times))) if len(times) > 1 else 0.0
+    gaps = np.diff(times) > 1.5 * period if period > 0 else np.zeros(0, dtype=bool)
+    return {
+        'samples': int(len(volts)),
+        'duration': round(float(times[-1] - times[0]), 3) if len(times) else 0.0,
+        'sample_rate': round(1.0 / period, 3) if period > 0 else None,
+        'mean': round(float(np.mean(volts)), 6),
+        'std': round(float(np.std(volts)), 6),
+        'min': round(float(np.min(volts)), 6),
+        'max': round(float(np.max(volts)), 6),
+        'dropouts': int(gaps.sum()),
+        'dropout_seconds': round(float((np.diff(times)[gaps] - period).sum()), 3)
+    }
+
+
+def beat_stats(beats):
+    rr = np.array([b.rr for b in beats if b.rr])
+    stats = {'beats': len(beats), 'bpm': None, 'bpm_min': None, 'bpm_max': None,
+             'sdnn_ms': None, 'rmssd_ms': None}
+    if len(rr):
+        stats.update(bpm=round(60.0 / rr.mean(), 1), bpm_min=round(60.0 / rr.max(), 1),
+                     bpm_max=round(60.0 / rr.min(), 1), sdnn_ms=round(rr.std() * 1000, 1))
+    if len(rr) > 1:
+        stats['rmssd_ms'] = round(float(np.sqrt(np.mean(np.diff(rr) ** 2))) * 1000, 1)
+    return stats
+
+
+def render(path, title, times, volts, filtered, beats, points):
+    """Summary PNG with decimated full-length traces"""
+    rows = 4 if len(beats) > 1 else 3
+    fig, axes = plt.subplots(rows, 1, figsize=(14, 3 * rows))
+
+    t, v = minmax_decimate(times, volts, points // 2)
+    axes[0].plot(t, v, linewidth=0.5, color='blue')
+    axes[0].set_title(f'{title} - Raw ECG Signal')
+    axes[1].plot(*minmax_decimate(times, filtered, points // 2), linewidth=0.5, color='red')
+    axes[1].set_title('Filtered ECG Signal')
+    for ax in axes[:2]:
+        ax.set_ylabel('Voltage (V)')
+        ax.set_xlim(times[0], times[-1])
+
+    # Close-up after the detector's learning period, at full resolution
+    start = times[0] + min(2.0, max(0.0, times[-1] - times[0] - ZOOM_SECONDS))
+    zoom = (times >= start) & (times < start + ZOOM_SECONDS)
+    axes[2].plot(times[zoom], filtered[zoom], linewidth=0.8, color='red')
+    peaks = [b.time for b in beats if start <= b.time < start + ZOOM_SECONDS]
+    if peaks:
+        axes[2].plot(peaks, np.interp(peaks, times, filtered), 'kv', markersize=6)
+    axes[2].set_title(f'Close-up ({ZOOM_SECONDS} s) with detected beats')
+    axes[2].set_ylabel('Voltage (V)')
+
+    if rows == 4:
+        axes[3].plot([b.time for b in beats if b.rr], [b.rr * 1000 for b in beats if b.rr],
+                     '.-', linewidth=0.8, color='green')
+        axes[3].set_title('RR Intervals')
+        axes[3].set_ylabel('RR (ms)')
+    axes[-1].set_xlabel('Time (seconds)')
+    for ax in axes:
+        ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+
+
+def find_beats(times, volts, rate):
+    """Run the live QRS detector over a whole recording, QRS_BLOCK_SECONDS at a time"""
+    detector = QRSDetector()
+    block = max(1, int(rate * QRS_BLOCK_SECONDS))
+    beats = []
+    for start in range(0, len(volts), block):
+        beats.extend(detector.process(times[start:start + block], volts[start:start + block], rate))
+    return beats
+
+
+def analyze(path, root, output, settings, force=False):
+    """Worker: analyze one recording unless its cached result is current"""
+    started = time.perf_counter()
+    name = report_name(root, path)
+    json_path = os.path.join(output, name + '.json')
+    png_path = os.path.join(output, name + '.png')
+    timings = {}
+
+    digest = content_hash(path, settings)
+    timings['hash'] = time.perf_counter() - started
+    if not force and os.path.exists(png_path):
+        try:
+            with open(json_path) as f:
+                cached = json.load(f)
+            if cached.get('hash') == digest:
+                cached['status'] = 'cached'
+                cached['seconds'] = round(time.perf_counter() - started, 3)
+                return cached
+        except (OSError, ValueError):
+            pass
+
+    result = {'file': os.path.relpath(path, root), 'hash': digest, 'status': 'ok'}
+    try:
+        mark = time.perf_counter()
+        times, volts = load_recording(path)
+        if len(volts) < 2:
+            raise ValueError("fewer than 2 samples")
+        times = np.asarray(times, dtype=np.float64)
+        volts = np.asarray(volts, dtype=np.float64)
+        timings['load'] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        result.update(signal_stats(times, volts))
+        rate = result['sample_rate']
+        try:
+            sos = design_sos(rate, settings['band'], settings['notch'])
+            filtered = signal.sosfiltfilt(sos, volts - volts.mean())
+        except ValueError as e:
+            # Too short for the filter, or a rate that can't hold the band
+            result['filter_error'] = str(e)
+            filtered = volts - volts.mean()
+        timings['filter'] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        beats = find_beats(times, volts, rate)
+        result.update(beat_stats(beats))
+        timings['beats'] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        render(png_path, result['file'], times, volts, filtered, beats, settings['points'])
+        timings['plot'] = time.perf_counter() - mark
+    except (OSError, ValueError) as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+
+    result['timings'] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    if result['status'] == 'ok':
+        with open(json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+def describe(result):
+    if result['status'] == 'error':
+        return f"error: {result['error']}"
+    line = f"{result['seconds']:.2f}s"
+    if result['status'] == 'cached':
+        return line + " (cached)"
+    stages = ', '.join(f"{stage} {seconds:.2f}" for stage, seconds in result['timings'].items())
+    bpm = f", {result['bpm']} BPM" if result.get('bpm') else ''
+    return f"{line} ({stages}){bpm}"
+
+
+def write_index(path, results):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for result in sorted(results, key=lambda r: r['file']):
+            writer.writerow(result)
+
+
+def run(args):
+    files = find_recordings(args.directory, args.output)
+    os.makedirs(args.output, exist_ok=True)
+    settings = {'version': ANALYSIS_VERSION, 'band': list(args.band), 'notch': args.notch,
+                'points': args.points}
+    jobs = args.jobs or os.cpu_count() or 1
+    print(f"Analyzing {len(files)} recordings from {args.directory} with {jobs} workers")
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(analyze, path, args.directory, args.output, settings, args.force):
+                   path for path in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file': os.path.relpath(path, args.directory), 'status': 'error',
+                          'error': repr(e), 'seconds': 0.0}
+            results.append(result)
+            print(f"[{done}/{len(files)}] {result['file']}: {describe(result)}")
+    elapsed = time.perf_counter() - started
+
+    write_index(os.path.join(args.output, INDEX_NAME), results)
+    counts = {status: sum(r['status'] == status for r in results)
+              for status in ('ok', 'cached', 'error')}
+    busy = sum(r['seconds'] for r in results)
+    print(f"\n{counts['ok']} analyzed, {counts['cached']} cached, {counts['error']} failed "
+          f"in {elapsed:.2f}s ({busy:.2f}s summed per-file time, "
+          f"{busy / elapsed if elapsed else 0:.1f} files in flight on average)")
+    print(f"Reports and index.csv in {args.output}")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze and plot a directory of ECG recordings")
+    parser.add_argument('directory', help="directory searched recursively for .txt/.csv/.ecg")
+    parser.add_argument('--output', '-o', default='reports', help="report directory")
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument('--band', type=float, nargs=2, default=DEFAULT_BAND,
+                        metavar=('LOW', 'HIGH'), help="bandpass in Hz")
+    parser.add_argument('--notch', type=float, default=None, help="mains notch in Hz (50/60)")
+    parser.add_argument('--points', type=int, default=4000,
+                        help="points per full-length trace after decimation")
+    parser.add_argument('--force', action='store_true', help="ignore cached results")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    results = run(parse_args())
+    sys.exit(1 if any(r['status'] == 'error' for r in results) else 0)
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+ECG Server Benchmark
+End-to-end load and latency test for realtime_server.py
+
+Starts the server on spare ports, then runs, each in its own process:
+    N senders     stream batched UDP packets at --rate Hz each
+    M consumers   headless Socket.IO clients counting 'ecg_batch' samples
+    K pollers     hammer /data/<device> with ?since= cursors (binary frames)
+
+Senders stream a sample counter instead of an ECG, with a disjoint value
+range per sender, so every sample a consumer receives can be traced back
+to the sender timestamp it was sent with. Reported:
+    loss        samples sent vs. ingested by the server vs. seen by consumers
+                (the server count includes samples its gap fill interpolated,
+                so server loss reads low when packets are dropped)
+    latency     sender timestamp -> consumer receipt percentiles (ms)
+                (not measured with --flood, whose timestamps run ahead of the clock)
+    throughput  sustained samples/s into the server and out to each consumer
+    server      CPU % and resident memory of the server process
+    /data       request rate and response time percentiles
+
+Usage:
+    python3 ecg_benchmark.py --senders 4 --rate 500 --consumers 8 --pollers 2 \\
+        --duration 20 --output results.json
+
+The server archives into a temporary directory that is removed afterwards.
+The JSON result includes the git commit, so runs can be compared across
+commits. Socket.IO consumers need the python-socketio client (installed
+with flask-socketio) and websocket-client.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from ecg_protocol import decode_data_frame, DATA_CONTENT_TYPE
+from ecg_synth import stream
+
+# Sender i's counter values live in [i * span, (i + 1) * span) with
+# span = FLOAT32_EXACT // senders; float32 holds integers exactly up to 2**24
+FLOAT32_EXACT = 2 ** 24
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class CounterSignal:
+    """ECGSynth stand-in whose samples are their own index plus an offset"""
+
+    def __init__(self, sample_rate, offset):
+        self.sample_rate = float(sample_rate)
+        self.channels = 1
+        self.offset = offset
+        self.count = 0
+
+    def generate(self, count):
+        index = self.count + np.arange(count)
+        self.count += count
+        return index / self.sample_rate, (self.offset + index).astype(np.float32)[None, :]
+
+
+def percentiles(values):
+    """Summary of a latency sample in milliseconds"""
+    if len(values) == 0:
+        return None
+    ms = np.asarray(values) * 1000
+    p50, p90, p99, p999 = np.percentile(ms, [50, 90, 99, 99.9])
+    return {'count': int(len(ms)), 'mean': round(float(ms.mean()), 3),
+            'p50': round(float(p50), 3), 'p90': round(float(p90), 3),
+            'p99': round(float(p99), 3), 'p99.9': round(float(p999), 3),
+            'max': round(float(ms.max()), 3)}
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def http_get(url, timeout=5.0, headers=None):
+    request = urllib.request.Request(url, headers=headers or {})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def server_ingested(http_port):
+    """
+    Total samples the server has written to its live buffers, all devices;
+    gap-filled samples included
+    """
+    body = json.loads(http_get(f"http://127.0.0.1:{http_port}/devices"))
+    return sum(device['samples'] for device in body['devices'])
+
+
+# --- Workers (module level so they can run in spawned processes) -------------
+
+def sender_worker(index, args, udp_port, go, results):
+    signal = CounterSignal(args.rate, index * args.value_span)
+    go.wait()
+    stats = stream(signal, ('127.0.0.1', udp_port), batch_size=args.batch_size,
+                   realtime=not args.flood, duration=args.duration, device_id=index)
+    stats.update(index=index, rate=args.rate)
+    results.put(('sender', stats))
+
+
+def consumer_worker(index, args, http_port, ready, go, done, results):
+    import socketio
+
+    received = []  # (receipt time, values)
+    client = socketio.Client(reconnection=False)
+
+    @client.on('ecg_batch')
+    def on_batch(data):
+        received.append((time.time(), data['voltage']))
+
+    try:
+        client.connect(f"http://127.0.0.1:{http_port}", transports=['websocket'])
+        # Sender i streams as device i
+        client.call('subscribe', {'devices': [str(i) for i in range(args.senders)]})
+    except Exception as e:
+        results.put(('consumer', {'index': index, 'error': str(e)}))
+        ready.set()
+        return
+    ready.set()
+    go.wait()
+    done.wait()
+    time.sleep(args.drain)
+    client.disconnect()
+
+    if received:
+        counts = [len(values) for _, values in received]
+        recv_times = np.repeat([t for t, _ in received], counts)
+        values = np.concatenate([np.asarray(v, dtype=np.float64) for _, v in received])
+    else:
+        recv_times, values = np.zeros(0), np.zeros(0)
+    results.put(('consumer', {'index': index, 'events': len(received),
+                              'recv_times': recv_times, 'values': values}))
+
+
+def poller_worker(index, args, http_port, go, done, results):
+    # Pollers spread over the sender devices
+    base = f"http://127.0.0.1:{http_port}/data/{index % max(args.senders, 1)}"
+    headers = {'Accept': DATA_CONTENT_TYPE}
+    interval = 1.0 / args.poll_rate if args.poll_rate else 0.0
+    cursor = None
+    times, errors, nbytes = [], 0, 0
+    go.wait()
+    next_at = time.perf_counter()
+    while not done.is_set():
+        url = base if cursor is None else f"{base}?since={cursor}"
+        started = time.perf_counter()
+        try:
+            body = http_get(url, headers=headers)
+            cursor = decode_data_frame(body)[1]
+            nbytes += len(body)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                # Device has not sent its first packet yet
+                time.sleep(0.01)
+                continue
+            errors += 1
+        except Exception:
+            errors += 1
+        times.append(time.perf_counter() - started)
+        if interval:
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    results.put(('poller', {'index': index, 'requests': len(times), 'errors': errors,
+                            'bytes': nbytes, 'latency_ms': percentiles(times)}))
+
+
+# --- Server process --------------------------------------------------------
+
+def start_server(udp_port, http_port, log, archive_dir, mode='threading'):
+    code = ("import realtime_server as s; "
+            f"s.main(udp_port={udp_port}, http_port={http_port}, tcp_port=None, "
+            f"archive_dir={archive_dir!r}, server_mode={mode!r})")
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=HERE,
+                            stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            server_ingested(http_port)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Server did not come up within 30s")
+
+
+class ProcessMonitor:
+    """Samples CPU and resident memory of a process from /proc (Linux) or psutil"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+
+    def _sample(self):
+        """(cpu seconds, rss bytes) or None"""
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system, self._process.memory_info().rss
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            ticks = os.sysconf('SC_CLK_TCK')
+            cpu = (int(fields[11]) + int(fields[12])) / ticks
+            rss = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+            return cpu, rss
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _run(self):
+        last = self._sample()
+        last_time = time.perf_counter()
+        while last is not None and not self._stop.wait(self.interval):
+            now = self._sample()
+            if now is None:
+                break
+            now_time = time.perf_counter()
+            self.cpu.append(100 * (now[0] - last[0]) / (now_time - last_time))
+            self.rss.append(now[1])
+            last, last_time = now, now_time
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if not self.cpu:
+            return None
+        return {'cpu_percent_mean': round(float(np.mean(self.cpu)), 1),
+                'cpu_percent_max': round(float(np.max(self.cpu)), 1),
+                'rss_mb_max': round(max(self.rss) / 2 ** 20, 1)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Analysis --------------------------------------------------------------
+
+def analyze(args, senders, consumers, pollers, ingested, elapsed):
+    senders = sorted(senders, key=lambda s: s['index'])
+    sent = sum(s['samples'] for s in senders)
+    starts = np.zeros(args.senders)
+    for s in senders:
+        starts[s['index']] = s['start_time']
+
+    result = {
+        'sent': {
+            'samples': sent,
+            'packets': sum(s['packets'] for s in senders),
+            'bytes': sum(s['bytes'] for s in senders),
+            'samples_per_s': round(sent / elapsed, 1),
+            'max_send_late_ms': max((s['max_late_ms'] for s in senders), default=0.0)
+        },
+        'server': {
+            'ingested': ingested,
+            'samples_per_s': round(ingested / elapsed, 1),
+            'loss': round(1 - ingested / sent, 6) if sent else None,
+            'note': 'ingested includes gap-filled samples'
+        }
+    }
+
+    all_latencies = []
+    per_consumer = []
+    for c in sorted(consumers, key=lambda c: c['index']):
+        if 'error' in c:
+            per_consumer.append({'index': c['index'], 'error': c['error']})
+            continue
+        values = c['values']
+        sender = (values // args.value_span).astype(np.int64)
+        valid = (sender >= 0) & (sender < args.senders)
+        index = values[valid] - sender[valid] * args.value_span
+        sender_time = starts[sender[valid]] + index / args.rate
+        latency = c['recv_times'][valid] - sender_time
+        unique = len(np.unique(values[valid]))
+        if args.flood:
+            # Flooded packets carry timestamps ahead of the wall clock
+            latency = np.zeros(0)
+        all_latencies.append(latency)
+        per_consumer.append({
+            'index': c['index'],
+            'events': c['events'],
+            'samples': int(valid.sum()),
+            'samples_per_s': round(float(valid.sum()) / elapsed, 1),
+            'loss': round(1 - unique / sent, 6) if sent else None,
+            'latency_ms': percentiles(latency)
+        })
+
+    result['consumers'] = per_consumer
+    result['latency_ms'] = percentiles(np.concatenate(all_latencies)) if all_latencies else None
+
+    if pollers:
+        requests = sum(p['requests'] for p in pollers)
+        result['data_endpoint'] = {
+            'requests': requests,
+            'requests_per_s': round(requests / elapsed, 1),
+            'errors': sum(p['errors'] for p in pollers),
+            'bytes': sum(p['bytes'] for p in pollers),
+            'pollers': sorted(pollers, key=lambda p: p['index'])
+        }
+    return result
+
+
+def run(args):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    go, done = ctx.Event(), ctx.Event()
+
+    udp_port = args.udp_port or free_port(socket.SOCK_DGRAM)
+    http_port = args.http_port or free_port()
+    log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+    server = archive_dir = None
+    if not args.external:
+        # Keep the run's archive out of the working tree
+        archive_dir = tempfile.mkdtemp(prefix='ecg-benchmark-')
+        server = start_server(udp_port, http_port, log, archive_dir, args.server_mode)
+    monitor = ProcessMonitor(server.pid) if server else None
+
+    workers = []
+    try:
+        ready = []
+        for i in range(args.consumers):
+            event = ctx.Event()
+            ready.append(event)
+            workers.append(ctx.Process(target=consumer_worker,
+                                       args=(i, args, http_port, event, go, done, results)))
+        for i in range(args.senders):
+            workers.append(ctx.Process(target=sender_worker, args=(i, args, udp_port, go, results)))
+        for i in range(args.pollers):
+            workers.append(ctx.Process(target=poller_worker,
+                                       args=(i, args, http_port, go, done, results)))
+        for w in workers:
+            w.start()
+        for event in ready:
+            event.wait(30)
+
+        before = server_ingested(http_port)
+        if monitor:
+            monitor.start()
+        started = time.perf_counter()
+        go.set()
+
+        # Senders finish on their own after --duration seconds of signal
+        expected = args.senders + args.consumers + args.pollers
+        collected = {'sender': [], 'consumer': [], 'poller': []}
+        while len(collected['sender']) < args.senders:
+            kind, stats = results.get()
+            collected[kind].append(stats)
+        elapsed = time.perf_counter() - started
+        time.sleep(args.drain)
+        ingested = server_ingested(http_port) - before
+        if monitor:
+            monitor.stop()
+        done.set()
+
+        while sum(len(v) for v in collected.values()) < expected:
+            kind, stats = results.get(timeout=args.drain + 30)
+            collected[kind].append(stats)
+        for w in workers:
+            w.join(10)
+    finally:
+        done.set()
+        go.set()
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+        if server:
+            server.terminate()
+            server.wait(10)
+        if archive_dir:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+
+    result = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {name: value for name, value in vars(args).items()
+                   if name not in ('output', 'server_log')},
+        'elapsed_s': round(elapsed, 3)
+    }
+    result.update(analyze(args, collected['sender'], collected['consumer'],
+                          collected['poller'], ingested, elapsed))
+    result['server']['process'] = monitor.summary() if monitor else None
+    return result
+
+
+def summarize(result):
+    """Human-readable lines for the terminal"""
+    sent, server = result['sent'], result['server']
+    lines = [f"commit {result['commit']}, {result['elapsed_s']}s",
+             f"sent      {sent['samples']} samples ({sent['samples_per_s']}/s) in {sent['packets']} packets",
+             f"server    {server['ingested']} samples ({server['samples_per_s']}/s), loss {server['loss']} "
+             "(gap fill included)"]
+    if server['process']:
+        p = server['process']
+        lines.append(f"          CPU {p['cpu_percent_mean']}% mean / {p['cpu_percent_max']}% max, "
+                     f"RSS {p['rss_mb_max']} MB")
+    for c in result['consumers']:
+        if 'error' in c:
+            lines.append(f"consumer {c['index']}: {c['error']}")
+    latency = result['latency_ms']
+    if latency:
+        lines.append(f"latency   p50 {latency['p50']} ms, p90 {latency['p90']} ms, "
+                     f"p99 {latency['p99']} ms, max {latency['max']} ms")
+    data = result.get('data_endpoint')
+    if data:
+        lines.append(f"/data     {data['requests']} requests ({data['requests_per_s']}/s), "
+                     f"{data['errors']} errors")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for realtime_server.py")
+    parser.add_argument('--senders', type=int, default=1, help="simulated devices")
+    parser.add_argument('--rate', type=float, default=500, help="samples/s per sender")
+    parser.add_argument('--batch-size', type=int, default=25, help="samples per packet")
+    parser.add_argument('--flood', action='store_true', help="send as fast as possible")
+    parser.add_argument('--consumers', type=int, default=1, help="Socket.IO clients")
+    parser.add_argument('--pollers', type=int, default=0, help="/data pollers")
+    parser.add_argument('--poll-rate', type=float, default=0,
+                        help="requests/s per poller, 0 for back-to-back")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of signal per sender")
+    parser.add_argument('--drain', type=float, default=1.0,
+                        help="seconds to wait for in-flight data after the senders stop")
+    parser.add_argument('--server-mode', choices=('threading', 'asyncio'), default='threading',
+                        help="realtime_server.py SERVER_MODE")
+    parser.add_argument('--external', action='store_true',
+                        help="use a server that is already running on --udp-port/--http-port")
+    parser.add_argument('--udp-port', type=int, default=None)
+    parser.add_argument('--http-port', type=int, default=None)
+    parser.add_argument('--server-log', default=None, help="file for the server's output")
+    parser.add_argument('--output', '-o', default=None, help="write the JSON result here")
+    args = parser.parse_args(argv)
+    if args.external and not (args.udp_port and args.http_port):
+        parser.error("--external needs --udp-port and --http-port")
+    args.value_span = FLOAT32_EXACT // max(args.senders, 1)
+    if args.rate * args.duration > args.value_span:
+        parser.error(f"at most {args.value_span} samples per sender, lower --rate or --duration")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = run(args)
+    print(summarize(result), file=sys.stderr)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+ECG Socket.IO Broadcaster
+Collects incoming samples and emits them to clients as one batched message per tick
+"""
+
+import threading
+import numpy as np
+
+# Emit modes
+MODE_BATCH = 'batch'    # 'ecg_batch' events with columnar arrays, once per tick
+MODE_SAMPLE = 'sample'  # legacy 'ecg_data' event per sample
+MODE_BOTH = 'both'
+MODES = (MODE_BATCH, MODE_SAMPLE, MODE_BOTH)
+
+
+class Broadcaster:
+    """
+    Coalesces samples pushed by the UDP receiver and emits them every
+    1/rate seconds as {'time': [...], 'voltage': [...], 'filtered': [...]}
+    on 'ecg_batch'.
+    In 'sample' mode the old per-sample 'ecg_data' event is emitted instead.
+
+    With `clients` set (an ecg_clients.ClientHub) events are published to
+    the send queues of the clients subscribed to `device` instead of
+    emitted to everyone, and `device` is added to every event so clients
+    subscribed to several devices can tell the streams apart. `stats` is an optional callable whose dict is
+    sent with every batch as 'link'; gaps pushed with the samples go out
+    as 'gaps'. After payload() `arrival` is when the oldest of its samples
+    reached the server.
+    """
+
+    def __init__(self, socketio, rate=30, mode=MODE_BATCH, time_decimals=4, voltage_decimals=6,
+                 clients=None, device=None, stats=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown emit mode {mode!r}, expected one of {MODES}")
+        self.socketio = socketio
+        self.interval = 1.0 / rate
+        self.mode = mode
+        self.time_decimals = time_decimals
+        self.voltage_decimals = voltage_decimals
+        self.clients = clients
+        self.device = device
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._times = []
+        self._voltages = []
+        self._filtered = []
+        self._gaps = []
+        self._arrival = None
+        self.arrival = None
+        self._running = False
+
+    def push(self, times, voltages, filtered, gaps=(), arrival=None):
+        """Queue a batch of samples (numpy arrays) and the gaps before them for the next tick"""
+        if self.mode != MODE_BATCH:
+            for t, voltage, value in zip(times.tolist(), voltages.tolist(), filtered.tolist()):
+                self.emit('ecg_data', {'time': t, 'voltage': voltage, 'filtered': value,
+                                       'device': self.device})
+        if self.mode == MODE_SAMPLE:
+            return
+        with self._lock:
+            self._times.append(times)
+            self._voltages.append(voltages)
+            self._filtered.append(filtered)
+            self._gaps.extend(gaps)
+            if self._arrival is None:
+                self._arrival = arrival
+
+    def emit(self, event, message, arrival=None):
+        if self.clients is not None:
+            self.clients.publish(self.device, event, message, arrival)
+        else:
+            self.socketio.emit(event, message)
+
+    def start(self):
+        """Start the emit loop as a Socket.IO background task"""
+        if self._running or self.mode == MODE_SAMPLE:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+
+    def _drain(self):
+        with self._lock:
+            if not self._times:
+                return None
+            times, self._times = self._times, []
+            voltages, self._voltages = self._voltages, []
+            filtered, self._filtered = self._filtered, []
+            gaps, self._gaps = self._gaps, []
+            self.arrival, self._arrival = self._arrival, None
+        return np.concatenate(times), np.concatenate(voltages), np.concatenate(filtered), gaps
+
+    def payload(self):
+        """The 'ecg_batch' message for everything queued since the last call, or None"""
+        batch = self._drain()
+        if batch is None:
+            return None
+        times, voltages, filtered, gaps = batch
+        message = {
+            'device': self.device,
+            'time': np.round(times, self.time_decimals).tolist(),
+            'voltage': np.round(voltages, self.voltage_decimals).tolist(),
+            'filtered': np.round(filtered, self.voltage_decimals).tolist()
+        }
+        if gaps:
+            message['gaps'] = gaps
+        if self.stats is not None:
+            message['link'] = self.stats()
+        return message
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            message = self.payload()
+            if message is None:
+                continue
+            try:
+                self.emit('ecg_batch', message, self.arrival)
+            except Exception as e:
+                print(f"Error broadcasting batch: {e}")
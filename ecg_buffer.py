@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ECG Ring Buffer
+Fixed-capacity, preallocated NumPy ring buffer for the server's live window
+"""
+
+import threading
+import numpy as np
+
+# Default columns: float64 time axis, float32 voltages
+DEFAULT_COLUMNS = (('time', np.float64), ('voltage', np.float32))
+
+
+class RingBuffer:
+    """
+    Preallocated column store with a monotonically increasing write index.
+
+    Every sample ever written gets a sequence number (0, 1, 2, ...). The
+    buffer keeps the most recent `capacity` of them, so valid sequence
+    numbers are [start, end). Appends are batched and O(1) per sample;
+    snapshots copy contiguous slices under the lock and leave any
+    serialization to the caller, outside the lock.
+    """
+
+    def __init__(self, capacity, columns=DEFAULT_COLUMNS, lock=None):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self.columns = tuple(name for name, _ in columns)
+        self._arrays = {name: np.zeros(self.capacity, dtype=dtype) for name, dtype in columns}
+        self._end = 0
+        # Any context manager; ecg_metrics.TimedLock measures wait and hold times
+        self._lock = lock if lock is not None else threading.Lock()
+
+    @classmethod
+    def for_window(cls, seconds, sample_rate, columns=DEFAULT_COLUMNS, lock=None):
+        """Size the buffer to hold `seconds` of data at `sample_rate` Hz"""
+        return cls(int(np.ceil(seconds * sample_rate)), columns, lock)
+
+    @property
+    def end(self):
+        """Sequence number the next sample will get (total samples written)"""
+        return self._end
+
+    @property
+    def start(self):
+        """Sequence number of the oldest sample still held"""
+        return max(0, self._end - self.capacity)
+
+    def __len__(self):
+        return self._end - self.start
+
+    def append(self, **values):
+        """Append a single sample; one scalar per column"""
+        with self._lock:
+            pos = self._end % self.capacity
+            for name in self.columns:
+                self._arrays[name][pos] = values[name]
+            self._end += 1
+
+    def extend(self, **values):
+        """Append a batch; pass one equal-length array per column"""
+        arrays = [np.asarray(values[name]) for name in self.columns]
+        count = len(arrays[0])
+        if count == 0:
+            return
+        if count > self.capacity:
+            # Only the tail can survive, skip the rest up front
+            skip = count - self.capacity
+            arrays = [a[skip:] for a in arrays]
+        else:
+            skip = 0
+
+        with self._lock:
+            pos = (self._end + skip) % self.capacity
+            n = len(arrays[0])
+            first = min(n, self.capacity - pos)
+            for name, a in zip(self.columns, arrays):
+                dest = self._arrays[name]
+                dest[pos:pos + first] = a[:first]
+                if first < n:
+                    dest[:n - first] = a[first:]
+            self._end += count
+
+    def snapshot(self, since=None, limit=None):
+        """
+        Copy out samples with sequence number >= since (default: everything
+        held), at most `limit` of the newest ones. Returns (first_seq, {column: array}).
+        """
+        with self._lock:
+            end = self._end
+            first = max(end - self.capacity, 0)
+            if since is not None:
+                first = min(max(first, since), end)
+            if limit is not None:
+                first = max(first, end - limit)
+            count = end - first
+            pos = first % self.capacity
+            out = {}
+            for name in self.columns:
+                src = self._arrays[name]
+                if pos + count <= self.capacity:
+                    out[name] = src[pos:pos + count].copy()
+                else:
+                    out[name] = np.concatenate((src[pos:], src[:pos + count - self.capacity]))
+        return first, out
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+ECG Viewer Queues
+Bounded per-client send queues, so one slow dashboard only ever holds up itself
+
+Emitting to a room hands every client every event at once, and the
+transports buffer whatever a client can't take yet: engine.io queues it
+without limit and the threading server's websocket writes whatever the
+kernel accepts, so a browser on a weak link sees the stream later and
+later or not at all. Instead every Socket.IO client gets its own queue of
+at most `queue_size` messages.
+
+publish() only appends to the queues of the clients subscribed to a
+device, so the UDP receiver and the broadcast loops never wait for a
+viewer. The drain pass sends a client what it has queued only while fewer
+than `window` of its batches are unacknowledged: the dashboard
+acknowledges every 'ecg_batch' (Python Socket.IO clients do so
+automatically), so each client is fed as fast as it actually takes the
+data. Batches of a device queued meanwhile go out joined into one
+message, so a long round trip costs latency but no samples. Until its
+first acknowledgement a client is paced by its engine.io queue instead,
+and one that has acknowledged nothing after ACK_TIMEOUT is an older
+client that is no longer asked to.
+
+When a queue is full the policy decides:
+
+    drop-oldest  the oldest message is dropped
+    decimate     the two oldest batches of a device are merged into one with
+                 half the samples, picked by min/max so R peaks survive; the
+                 viewer gets the whole signal at a lower resolution
+    disconnect   the client is disconnected (the dashboard reconnects and
+                 starts again from live data)
+
+Queue length, lag (age of the oldest queued message), batches in flight,
+acknowledgement round trip and sent/dropped/merged counts per client are
+served at /clients.
+"""
+
+import functools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from ecg_decimate import minmax_indices
+from ecg_metrics import DISABLED as METRICS_DISABLED
+
+POLICY_DROP_OLDEST = 'drop-oldest'
+POLICY_DECIMATE = 'decimate'
+POLICY_DISCONNECT = 'disconnect'
+POLICIES = (POLICY_DROP_OLDEST, POLICY_DECIMATE, POLICY_DISCONNECT)
+
+BATCH_EVENT = 'ecg_batch'
+BATCH_COLUMNS = ('time', 'voltage', 'filtered')
+MERGE_BUCKET = 4    # merged batches keep a min/max pair per this many samples
+ACK_TIMEOUT = 5.0   # seconds a client may leave its first batch unacknowledged
+
+
+def transport_backlog(server, sid, namespace='/'):
+    """Packets engine.io has queued for a client but not yet written to it"""
+    try:
+        socket = server.eio.sockets.get(server.manager.eio_sid_from_sid(sid, namespace))
+        return socket.queue.qsize() if socket is not None else 0
+    except (AttributeError, KeyError):
+        return 0
+
+
+def join_batches(first, second):
+    """One 'ecg_batch' message with the samples of two consecutive ones"""
+    joined = dict(second)   # keeps the newer link statistics
+    for name in BATCH_COLUMNS:
+        joined[name] = list(first[name]) + list(second[name])
+    gaps = first.get('gaps', []) + second.get('gaps', [])
+    if gaps:
+        joined['gaps'] = gaps
+    if first.get('decimated'):
+        joined['decimated'] = True
+    return joined
+
+
+def merge_batches(first, second):
+    """One 'ecg_batch' message covering two consecutive ones with about half their samples"""
+    columns = {name: np.concatenate((first[name], second[name])) for name in BATCH_COLUMNS}
+    idx = minmax_indices(columns['filtered'], max(1, len(columns['time']) // MERGE_BUCKET))
+    merged = join_batches(first, second)
+    for name in BATCH_COLUMNS:
+        merged[name] = columns[name][idx].tolist()
+    merged['decimated'] = True
+    return merged
+
+
+class ClientQueue:
+    """One client's subscribed devices, pending messages and counters"""
+
+    def __init__(self, sid, devices, size, policy, now):
+        self.sid = sid
+        self.devices = set(devices)
+        self.size = size
+        self.policy = policy
+        self.connected = now
+        self.acks = None            # True once it acknowledges a batch, False if it never does
+        self.rtt = None             # smoothed acknowledgement round trip (seconds)
+        self.sent = 0
+        self.dropped = 0
+        self.merged = 0
+        self.max_lag = 0.0
+        self.overflowed = False     # disconnect policy: waiting to be disconnected
+        self._pending = deque()     # (queued at, arrival, event, message)
+        self._in_flight = deque()   # send times of unacknowledged batches
+        self._lock = threading.Lock()
+
+    def put(self, event, message, now, arrival=None):
+        with self._lock:
+            if self.overflowed:
+                self.dropped += 1
+                return
+            if len(self._pending) >= self.size:
+                if self.policy == POLICY_DISCONNECT:
+                    self.overflowed = True
+                    self.dropped += len(self._pending) + 1
+                    self._pending.clear()
+                    return
+                if not (self.policy == POLICY_DECIMATE and self._merge_oldest()):
+                    self._pending.popleft()
+                    self.dropped += 1
+            self._pending.append((now, arrival or now, event, message))
+
+    def take(self, window, backlog, now):
+        """
+        (event, message, ack wanted, arrival) to send now, oldest first,
+        with each device's queued batches joined into one message; arrival
+        is when the oldest of a message's samples reached the server
+        """
+        with self._lock:
+            if not self._pending:
+                return []
+            if self.acks is None and self._in_flight and now - self._in_flight[0] > ACK_TIMEOUT:
+                # Never acknowledged a batch: an older client, go by the transport instead
+                self.acks = False
+                self._in_flight.clear()
+            # Until its first acknowledgement a client is paced by its transport
+            in_flight = len(self._in_flight) if self.acks else backlog
+            if in_flight >= window:
+                return []
+
+            out = []
+            batches = {}    # device -> index in out
+            while self._pending:
+                queued, arrival, event, message = self._pending.popleft()
+                self.max_lag = max(self.max_lag, now - queued)
+                device = message.get('device') if event == BATCH_EVENT else None
+                if device is not None and device in batches:
+                    i = batches[device]
+                    out[i] = (event, join_batches(out[i][1], message), out[i][2])
+                    continue
+                if device is not None:
+                    batches[device] = len(out)
+                out.append((event, message, arrival))
+            self.sent += len(out)
+
+            wants_ack = self.acks is not False
+            if wants_ack:
+                self._in_flight.extend([now] * len(batches))
+            return [(event, message, wants_ack and event == BATCH_EVENT, arrival)
+                    for event, message, arrival in out]
+
+    def acked(self, now):
+        with self._lock:
+            if not self._in_flight:
+                return
+            rtt = now - self._in_flight.popleft()
+            self.rtt = rtt if self.rtt is None else self.rtt + (rtt - self.rtt) / 8.0
+            self.acks = True
+
+    def lag(self, now):
+        """Seconds the oldest queued message has been waiting"""
+        pending = self._pending
+        return now - pending[0][0] if pending else 0.0
+
+    def stats(self, now, backlog):
+        return {
+            'sid': self.sid,
+            'devices': sorted(self.devices),
+            'acks': self.acks,
+            'queued': len(self._pending),
+            'in_flight': len(self._in_flight),
+            'backlog': backlog,
+            'lag': round(self.lag(now), 3),
+            'max_lag': round(self.max_lag, 3),
+            'rtt_ms': round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'connected': round(now - self.connected, 1)
+        }
+
+    def _merge_oldest(self):
+        """Merge the two oldest batches of one device; False if there are no two"""
+        batches = {}
+        for i, (_, _, event, message) in enumerate(self._pending):
+            if event != BATCH_EVENT:
+                continue
+            device = message.get('device')
+            if device in batches:
+                first = batches[device]
+                queued, arrival, _, older = self._pending[first]
+                # The merged batch keeps the older one's place and times
+                self._pending[first] = (queued, arrival, event, merge_batches(older, message))
+                del self._pending[i]
+                self.merged += 1
+                return True
+            batches[device] = i
+        return False
+
+
+class ClientHub:
+    """
+    hub = ClientHub(socketio, queue_size=32, policy='drop-oldest', window=4, rate=30)
+
+    The servers call add(), subscribe() and remove() from their Socket.IO
+    handlers and publish() for every event of a device.
+    In threading mode start() runs the drain loop as a background task,
+    woken by every publish and acknowledgement; the asyncio server calls
+    drain() itself and emits what it returns, passing each send's
+    callback on to emit(). With `metrics` (ecg_metrics.Metrics) the
+    arrival-to-send latency of every message and the time of every emit
+    are recorded.
+    """
+
+    def __init__(self, socketio, queue_size=32, policy=POLICY_DROP_OLDEST, window=4, rate=30,
+                 metrics=METRICS_DISABLED):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown client queue policy {policy!r}, expected one of {POLICIES}")
+        self.socketio = socketio
+        # Flask-SocketIO wraps the python-socketio server, AsyncServer is one
+        self.server = getattr(socketio, 'server', socketio)
+        self.queue_size = queue_size
+        self.policy = policy
+        self.window = window
+        self.interval = 1.0 / rate
+        self.metrics = metrics
+        self.disconnected = 0       # clients disconnected by the policy
+        self._clients = {}          # copied on write, like DeviceRegistry
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+
+    def add(self, sid, devices):
+        client = ClientQueue(sid, devices, self.queue_size, self.policy, time.time())
+        with self._lock:
+            clients = dict(self._clients)
+            clients[sid] = client
+            self._clients = clients
+
+    def subscribe(self, sid, devices):
+        client = self._clients.get(sid)
+        if client is None:
+            self.add(sid, devices)
+        else:
+            client.devices = set(devices)
+
+    def remove(self, sid):
+        with self._lock:
+            if sid not in self._clients:
+                return
+            clients = dict(self._clients)
+            del clients[sid]
+            self._clients = clients
+
+    def __len__(self):
+        return len(self._clients)
+
+    def publish(self, device, event, message, arrival=None):
+        """
+        Queue an event for every client subscribed to device; never blocks
+        on a client. arrival is when its data reached the server (default now).
+        """
+        now = time.time()
+        for client in self._clients.values():
+            if device in client.devices:
+                client.put(event, message, now, arrival)
+        self._wake.set()
+
+    def acked(self, sid, *args):
+        """Socket.IO callback for a client's acknowledgement of a batch"""
+        client = self._clients.get(sid)
+        if client is not None:
+            client.acked(time.time())
+            self._wake.set()
+
+    def drain(self):
+        """
+        ([(sid, event, message, callback)] to send now, [sid] to disconnect);
+        callback is None for events that need no acknowledgement
+        """
+        now = time.time()
+        sends, overflowed = [], []
+        for sid, client in self._clients.items():
+            if client.overflowed:
+                overflowed.append(sid)
+                continue
+            backlog = 0 if client.acks else transport_backlog(self.server, sid)
+            for event, message, ack, arrival in client.take(self.window, backlog, now):
+                callback = functools.partial(self.acked, sid) if ack else None
+                sends.append((sid, event, message, callback))
+                self.metrics.emit_latency.observe(now - arrival)
+        for sid in overflowed:
+            self.remove(sid)
+            self.disconnected += 1
+        return sends, overflowed
+
+    def stats(self):
+        now = time.time()
+        return {
+            'policy': self.policy,
+            'queue_size': self.queue_size,
+            'window': self.window,
+            'disconnected': self.disconnected,
+            'clients': [client.stats(now, transport_backlog(self.server, sid))
+                        for sid, client in self._clients.items()]
+        }
+
+    def start(self):
+        """Start the drain loop as a Socket.IO background task"""
+        if self._running:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            sends, overflowed = self.drain()
+            timed = self.metrics.enabled
+            for sid, event, message, callback in sends:
+                start = time.perf_counter() if timed else 0.0
+                try:
+                    self.socketio.emit(event, message, to=sid, callback=callback)
+                except Exception as e:
+                    print(f"Error sending {event} to client {sid}: {e}")
+                if timed:
+                    self.metrics.emit_seconds.observe(time.perf_counter() - start)
+            for sid in overflowed:
+                print(f"Disconnecting client {sid}: send queue overflowed")
+                try:
+                    self.server.disconnect(sid)
+                except Exception as e:
+                    print(f"Error disconnecting client {sid}: {e}")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+ECG Sample Codec
+Delta + zigzag + varint packing of 16-bit ADC codes
+
+The ADS1115 produces 16-bit codes and consecutive ECG samples differ by a
+few codes, so instead of 4-byte floats each sample is stored as the
+difference from the previous one, zigzag mapped to an unsigned number
+(0, -1, 1, -2, ... -> 0, 1, 2, 3, ...) and written as a LEB128 varint:
+7 bits per byte, high bit set on every byte but the last. Differences
+within +-63 codes take one byte, within +-8191 two, anything else three.
+
+A block is the first code (int16, stored by the caller) plus the varints
+of the count - 1 differences after it. Encoding and decoding are both
+vectorized; no Python loop runs per sample.
+"""
+
+import numpy as np
+
+MAX_VARINT_BYTES = 3    # a zigzagged int16 difference fits in 17 bits
+
+
+class CodecError(ValueError):
+    """Raised when a varint block is truncated or does not match its count"""
+
+
+def to_codes(volts, scale):
+    """Volts to int16 ADC codes at `scale` volts per code, clipped to the int16 range"""
+    codes = np.round(np.asarray(volts, dtype=np.float64) / scale)
+    return np.clip(codes, -32768, 32767).astype(np.int16)
+
+
+def zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint32)
+
+
+def unzigzag(values):
+    values = values.astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+def encode_deltas(codes):
+    """(first code, varint bytes of the differences) for a block of int16 codes"""
+    codes = np.asarray(codes, dtype=np.int32)
+    if len(codes) == 0:
+        return 0, b''
+    z = zigzag(np.diff(codes))
+    sizes = 1 + (z >= 1 << 7).astype(np.int64) + (z >= 1 << 14)
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(MAX_VARINT_BYTES):
+        has = sizes > k
+        more = (sizes[has] > k + 1).astype(np.uint32) << 7
+        out[starts[has] + k] = ((z[has] >> (7 * k)) & 0x7F) | more
+    return int(codes[0]), out.tobytes()
+
+
+def decode_deltas(first, data, count):
+    """int16 codes of a block from its first code and the varint differences"""
+    if count == 0:
+        return np.zeros(0, dtype=np.int16)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    # A trailing byte with the high bit set is a truncated varint (ends may be empty)
+    if len(ends) != count - 1 or (len(raw) and raw[-1] >= 0x80):
+        raise CodecError(f"Expected {count - 1} varints in {len(raw)} bytes, found {len(ends)}")
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    if len(ends) and (ends - starts).max() >= MAX_VARINT_BYTES:
+        raise CodecError("Varint longer than an int16 difference")
+    # Each byte's 7 payload bits, shifted into place within its varint
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = 7 * (np.arange(len(raw)) - starts[group])
+    parts = (raw & 0x7F).astype(np.int64) << shifts
+    z = np.bincount(group, weights=parts, minlength=len(ends)).astype(np.int64)
+
+    codes = np.empty(count, dtype=np.int64)
+    codes[0] = first
+    codes[1:] = unzigzag(z)
+    return np.cumsum(codes).astype(np.int16)
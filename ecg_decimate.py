@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+ECG Display Decimation
+Reduces the live window to roughly one point per pixel while keeping QRS peaks
+
+Two methods, both kept incrementally per resolution:
+    minmax  min/max envelope per bucket
+    lttb    Largest-Triangle-Three-Buckets
+
+Buckets are aligned to absolute sequence numbers, so a new sample only
+touches the bucket it lands in; full buckets are computed once and
+expire with the window. Only the open bucket at the end is redone on
+each request.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+METHODS = ('minmax', 'lttb')
+
+# Requested point counts are rounded up to a multiple of this so that
+# slightly different chart widths share one cached view
+POINTS_QUANTUM = 64
+MIN_POINTS = 64
+MAX_POINTS = 8192
+
+
+def quantize_points(points):
+    """Clamp and round a requested point count to a cacheable resolution"""
+    points = max(MIN_POINTS, min(int(points), MAX_POINTS))
+    return int(math.ceil(points / POINTS_QUANTUM) * POINTS_QUANTUM)
+
+
+def minmax_decimate(times, values, buckets):
+    """Min/max envelope: two points per bucket, in time order"""
+    if len(values) <= 2 * buckets:
+        return times, values
+    idx = minmax_indices(values, buckets)
+    return times[idx], values[idx]
+
+
+def minmax_indices(values, buckets):
+    """Indices of the min/max envelope, for picking the same samples from other columns"""
+    n = len(values)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = int(math.ceil(n / buckets))
+    full = n // size
+    idx = _minmax_indices(values[:full * size].reshape(full, size)) + \
+        np.repeat(np.arange(full) * size, 2)
+    if full * size < n:
+        tail = values[full * size:]
+        extra = np.array(sorted((int(np.argmin(tail)), int(np.argmax(tail))))) + full * size
+        idx = np.concatenate((idx, extra))
+    return idx
+
+
+def _minmax_indices(blocks):
+    """Per-row argmin/argmax, flattened as (first, second) in time order"""
+    lo = np.argmin(blocks, axis=1)
+    hi = np.argmax(blocks, axis=1)
+    return np.column_stack((np.minimum(lo, hi), np.maximum(lo, hi))).ravel()
+
+
+def lttb(times, values, points):
+    """Largest-Triangle-Three-Buckets downsampling to `points` points"""
+    n = len(values)
+    if points >= n or points < 3:
+        return times, values
+
+    x = np.asarray(times, dtype=np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    # Bucket edges over the interior points, first and last are always kept
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    out = np.empty(points, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+
+    a = 0
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Average of the next bucket is the third triangle vertex
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+            cx, cy = x[nxt].mean(), y[nxt].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[start:stop] - ay) - (ax - x[start:stop]) * (cy - ay))
+        a = start + int(np.argmax(area))
+        out[i + 1] = a
+
+    return times[out], values[out]
+
+
+class MinMaxView:
+    """
+    Incrementally maintained min/max envelope of a RingBuffer column.
+
+    Buckets are aligned to absolute sequence numbers, so once a bucket is
+    full it never changes; update() only scans samples written since the
+    last call.
+    """
+
+    def __init__(self, buffer, points, column='voltage'):
+        self.buffer = buffer
+        self.column = column
+        self.bucket_size = max(1, int(math.ceil(buffer.capacity / (points // 2))))
+        slots = buffer.capacity // self.bucket_size + 2
+        self._slots = slots
+        self._times = np.zeros((slots, 2), dtype=np.float64)
+        self._values = np.zeros((slots, 2), dtype=np.float32)
+        self._next = 0      # first sequence number not yet in a full bucket
+        self._lock = threading.Lock()
+
+    def update(self):
+        """Fold newly written samples into full buckets, return the partial tail"""
+        w = self.bucket_size
+        first, cols = self.buffer.snapshot(since=self._next)
+        if first > self._next:
+            # The buffer wrapped past us, restart at a bucket boundary
+            aligned = -(-first // w) * w
+            skip = aligned - first
+            cols = {k: v[skip:] for k, v in cols.items()}
+            first = self._next = aligned
+        times, values = cols['time'], cols[self.column]
+
+        full = len(values) // w
+        if full:
+            block_v = values[:full * w].reshape(full, w)
+            block_t = times[:full * w].reshape(full, w)
+            idx = _minmax_indices(block_v).reshape(full, 2)
+            rows = np.arange(full)[:, None]
+            slots = (np.arange(full) + first // w) % self._slots
+            self._times[slots] = block_t[rows, idx]
+            self._values[slots] = block_v[rows, idx]
+            self._next = first + full * w
+        return times[full * w:], values[full * w:]
+
+    def view(self):
+        """Current envelope as (times, values) covering the buffer window"""
+        with self._lock:
+            tail_t, tail_v = self.update()
+            w = self.bucket_size
+            lo = -(-self.buffer.start // w)
+            hi = self._next // w
+            slots = np.arange(lo, hi) % self._slots
+            times = self._times[slots].ravel()
+            values = self._values[slots].ravel()
+        if len(tail_v):
+            tail_t, tail_v = minmax_decimate(tail_t, tail_v, 1)
+            times = np.concatenate((times, tail_t))
+            values = np.concatenate((values, tail_v))
+        return times, values
+
+
+class LTTBView:
+    """
+    Incrementally maintained LTTB selection of a RingBuffer column.
+
+    A bucket's point depends on the point picked in the bucket before it
+    and the average of the bucket after it, so it is final as soon as the
+    next bucket is full; update() only picks the buckets completed since
+    the last call. The window is chained from the first bucket ever
+    picked rather than from its current first sample, which only changes
+    which point the oldest retained bucket keeps.
+    """
+
+    def __init__(self, buffer, points, column='voltage'):
+        self.buffer = buffer
+        self.column = column
+        # Up to two open buckets and the newest sample come on top of the picked ones
+        self.bucket_size = max(1, int(math.ceil(buffer.capacity / max(1, points - 3))))
+        slots = buffer.capacity // self.bucket_size + 2
+        self._slots = slots
+        self._times = np.zeros(slots, dtype=np.float64)
+        self._values = np.zeros(slots, dtype=np.float32)
+        self._next = 0          # first sequence number of the first bucket not yet picked
+        self._prev = None       # (time, value) picked in the bucket before it
+        self._cached = (None, None)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _pick(prev, times, values, next_x, next_y):
+        """Index of the point forming the largest triangle with the previous pick and next_*"""
+        if prev is None:
+            return 0
+        ax, ay = prev
+        y = values.astype(np.float64)
+        area = np.abs((ax - next_x) * (y - ay) - (ax - times) * (next_y - ay))
+        return int(np.argmax(area))
+
+    def update(self):
+        """Pick every bucket whose successor is now full, return the samples after them"""
+        w = self.bucket_size
+        first, cols = self.buffer.snapshot(since=self._next)
+        if first > self._next:
+            # The buffer wrapped past us, restart the chain at a bucket boundary
+            aligned = -(-first // w) * w
+            skip = aligned - first
+            cols = {k: v[skip:] for k, v in cols.items()}
+            first = self._next = aligned
+            self._prev = None
+        times, values = cols['time'], cols[self.column]
+
+        done = max(len(values) // w - 1, 0)
+        for k in range(done):
+            bucket = slice(k * w, (k + 1) * w)
+            following = slice((k + 1) * w, (k + 2) * w)
+            i = k * w + self._pick(self._prev, times[bucket], values[bucket],
+                                   times[following].mean(), float(values[following].mean()))
+            slot = (first // w + k) % self._slots
+            self._times[slot] = times[i]
+            self._values[slot] = values[i]
+            self._prev = (times[i], float(values[i]))
+        self._next = first + done * w
+        return times[done * w:], values[done * w:]
+
+    def view(self):
+        """Current selection as (times, values); the same object until new samples arrive"""
+        with self._lock:
+            end = self.buffer.end
+            if self._cached[0] == end:
+                return self._cached[1]
+            tail_t, tail_v = self.update()
+            w = self.bucket_size
+            lo = -(-self.buffer.start // w)
+            hi = self._next // w
+            slots = np.arange(lo, hi) % self._slots
+            times = self._times[slots]
+            values = self._values[slots]
+            if len(tail_v):
+                # The open buckets are picked like the rest, the last against the
+                # newest sample, which is always kept (their picks are not stored)
+                prev = self._prev
+                keep = []
+                n = len(tail_v)
+                for start in range(0, n - 1, w):
+                    stop = min(start + w, n - 1)
+                    following = slice(stop, min(stop + w, n - 1))
+                    if stop == n - 1:
+                        following = slice(n - 1, n)
+                    i = start + self._pick(prev, tail_t[start:stop], tail_v[start:stop],
+                                           tail_t[following].mean(),
+                                           float(tail_v[following].mean()))
+                    keep.append(i)
+                    prev = (tail_t[i], float(tail_v[i]))
+                keep.append(n - 1)
+                times = np.concatenate((times, tail_t[keep]))
+                values = np.concatenate((values, tail_v[keep]))
+            result = times, values
+            self._cached = (end, result)
+            return result
+
+
+class DecimationCache:
+    """Per-resolution decimated views of one RingBuffer, most recently used kept"""
+
+    def __init__(self, buffer, column='voltage', max_views=8):
+        self.buffer = buffer
+        self.column = column
+        self.max_views = max_views
+        self._minmax = OrderedDict()
+        self._lttb = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, cache, key, factory):
+        with self._lock:
+            entry = cache.get(key)
+            if entry is None:
+                entry = factory()
+                cache[key] = entry
+                if len(cache) > self.max_views:
+                    cache.popitem(last=False)
+            else:
+                cache.move_to_end(key)
+            return entry
+
+    def get(self, points, method='minmax'):
+        """Decimated (times, values) for roughly `points` points of the live window"""
+        if method not in METHODS:
+            raise ValueError(f"Unknown decimation method {method!r}, expected one of {METHODS}")
+        points = quantize_points(points)
+
+        if method == 'minmax':
+            view = self._lookup(self._minmax, points,
+                                lambda: MinMaxView(self.buffer, points, self.column))
+            return view.view()
+
+        view = self._lookup(self._lttb, points,
+                            lambda: LTTBView(self.buffer, points, self.column))
+        return view.view()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+ECG Device Registry
+Per-device live state for realtime_server.py
+
+Packets are demultiplexed by device id (the `device_id` in the packet
+header) or by source address, and every device gets its own ring buffer,
+display caches, filter, QRS detector and clock origin, and its events
+only reach the Socket.IO clients subscribed to it (through their send
+queues, see ecg_clients.py), so several Pis can share one server without
+their streams mixing.
+Legacy 4-byte packets carry no id and are always keyed by source address.
+
+Samples are timed by the sender's sample clock through a per-device
+jitter buffer (ecg_jitter.py), so time 0 is the device's first sample and
+the axis stays uniform however the packets arrive. Legacy packets carry
+no timestamp and are still timed by their arrival.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from ecg_archive import DeviceArchive, DEFAULT_TIERS, SEGMENT_SECONDS
+from ecg_broadcast import Broadcaster
+from ecg_buffer import RingBuffer
+from ecg_clients import ClientHub, POLICY_DROP_OLDEST
+from ecg_decimate import DecimationCache
+from ecg_filters import StreamingFilter
+from ecg_jitter import JitterBuffer
+from ecg_metrics import DISABLED as METRICS_DISABLED
+from ecg_qrs import QRSDetector
+from ecg_spectrum import StreamingSpectrum, DEFAULT_SEGMENT, DEFAULT_AVERAGE, DEFAULT_HISTORY
+
+KEY_ID = 'id'
+KEY_ADDRESS = 'address'
+KEYS = (KEY_ID, KEY_ADDRESS)
+
+DEVICE_COLUMNS = (('time', np.float64), ('voltage', np.float32), ('filtered', np.float32))
+
+# Raw and filtered channels share one time axis
+CHANNELS = {'raw': 'voltage', 'filtered': 'filtered'}
+
+
+class Device:
+    """Buffer, filters, detector and broadcaster for one sender"""
+
+    def __init__(self, name, socketio, sample_rate, address=None, buffer_seconds=10,
+                 min_sample_rate=500, filter_band=(0.5, 40.0), notch=None, filter_order=2,
+                 broadcast_hz=30, emit_mode='batch', archive=None, jitter_delay=0.05,
+                 gap_fill='interpolate', max_gap_fill=1.0, clients=None,
+                 metrics=METRICS_DISABLED, spectrum_segment=DEFAULT_SEGMENT,
+                 spectrum_average=DEFAULT_AVERAGE, spectrogram_seconds=DEFAULT_HISTORY,
+                 spectrum_hz=1.0, spectrum_event_max_hz=100.0):
+        self.name = name
+        self.address = address
+        self.sample_rate = sample_rate
+        # Sized for the rate the device announces, never smaller than min_sample_rate
+        self.buffer = RingBuffer.for_window(buffer_seconds, max(sample_rate, min_sample_rate),
+                                            DEVICE_COLUMNS, metrics.lock())
+        self.views = {channel: DecimationCache(self.buffer, column)
+                      for channel, column in CHANNELS.items()}
+        self.filter = StreamingFilter(filter_band, notch, filter_order)
+        self.qrs = QRSDetector()
+        self.recent_beats = deque(maxlen=64)
+        self.jitter = JitterBuffer(jitter_delay, gap_fill, max_gap_fill)
+        self.recent_gaps = deque(maxlen=64)
+        # Rolling PSD and spectrogram of the raw signal, None when turned off
+        self.spectrum = None
+        if spectrum_segment:
+            self.spectrum = StreamingSpectrum(spectrum_segment, average_seconds=spectrum_average,
+                                              history_seconds=spectrogram_seconds)
+        self.spectrum_interval = 1.0 / spectrum_hz if spectrum_hz else None
+        self.spectrum_event_max_hz = spectrum_event_max_hz
+        self._spectrum_sent = 0.0
+        self.broadcaster = Broadcaster(socketio, rate=broadcast_hz, mode=emit_mode,
+                                       clients=clients, device=name, stats=self.jitter.stats)
+        self.archive = archive  # DeviceArchive, or None when history is off
+        self.start_time = None  # server clock time of time 0
+        self.last_seen = None
+        self.packets = 0
+
+    def ingest(self, packet, arrival, sample_rate):
+        """Buffer, filter and queue one packet; returns the beats it completed"""
+        self.last_seen = arrival
+        self.packets += 1
+
+        if packet.legacy or sample_rate <= 0:
+            if self.start_time is None:
+                self.start_time = arrival
+            current_time = arrival - self.start_time
+            count = len(packet)
+            if count > 1 and sample_rate > 0:
+                # Last sample arrived now, space the earlier ones at the sample period
+                times = current_time - np.arange(count - 1, -1, -1) / sample_rate
+            else:
+                times = np.full(count, current_time)
+            return self._process(times, packet.voltages, [], sample_rate, arrival)
+
+        released = self.jitter.push(packet, arrival, sample_rate)
+        if released is None:
+            return []
+        return self._process(*released, sample_rate, arrival)
+
+    def poll(self, now):
+        """Release packets the jitter buffer held past its delay; returns their beats"""
+        released = self.jitter.poll(now)
+        if released is None:
+            return []
+        return self._process(*released, self.sample_rate, now)
+
+    def _process(self, times, voltages, gaps, sample_rate, arrival):
+        if len(times) == 0:
+            return []
+        if self.start_time is None:
+            # The first sample block ends about now
+            self.start_time = arrival - float(times[-1])
+        self.recent_gaps.extend(gaps)
+
+        filtered = self.filter.process(voltages, sample_rate)
+        self.buffer.extend(time=times, voltage=voltages, filtered=filtered)
+
+        # Queued for the next broadcast tick
+        self.broadcaster.push(times, voltages, filtered, gaps, arrival)
+
+        if self.spectrum is not None:
+            self.spectrum.update(times, voltages, sample_rate)
+            if self.spectrum_interval and arrival - self._spectrum_sent >= self.spectrum_interval:
+                self._send_spectrum(arrival)
+
+        beats = []
+        for beat in self.qrs.process(times, voltages, sample_rate):
+            event = beat.to_dict()
+            event['device'] = self.name
+            self.recent_beats.append(event)
+            beats.append(event)
+
+        if self.archive is not None:
+            try:
+                self.archive.append(self.start_time + times, voltages)
+            except OSError as e:
+                # A full or failing disk must not stop the live view
+                print(f"Error archiving device {self.name}: {e}")
+        return beats
+
+    def _send_spectrum(self, now):
+        """Low-rate 'ecg_spectrum' event: the averaged PSD up to spectrum_event_max_hz"""
+        message = self.spectrum.to_dict(self.spectrum_event_max_hz)
+        if message is None:
+            return
+        message['device'] = self.name
+        self._spectrum_sent = now
+        self.broadcaster.emit('ecg_spectrum', message)
+
+    def info(self):
+        return {
+            'id': self.name,
+            'address': self.address,
+            'sample_rate': self.sample_rate,
+            'samples': self.buffer.end,
+            'packets': self.packets,
+            'start_time': self.start_time,
+            'last_seen': round(time.time() - self.last_seen, 3) if self.last_seen else None,
+            'bpm': self.qrs.heart_rate,
+            'link': self.jitter.stats()
+        }
+
+
+class DeviceRegistry:
+    """
+    Creates devices on their first packet. Lookups may come from request
+    threads while the receiver thread adds devices, so the table is
+    copied on write.
+
+    `clients` is the ClientHub holding every Socket.IO client's
+    subscriptions and send queue (client_queue messages at most, overflow
+    handled by client_policy, see ecg_clients.py).
+
+    With autostart each new device's broadcaster starts its own emit loop
+    and the hub its drain loop; the asyncio server passes autostart=False
+    and drains them itself.
+    With archive_dir set every device's samples are also archived there
+    (see ecg_archive.py). `metrics` (ecg_metrics.Metrics) times the ring
+    buffer locks and the client queues.
+    """
+
+    def __init__(self, socketio, key=KEY_ID, max_devices=16, default=None,
+                 legacy_sample_rate=100, autostart=True, archive_dir=None,
+                 archive_tiers=DEFAULT_TIERS, archive_segment_seconds=SEGMENT_SECONDS,
+                 client_queue=32, client_policy=POLICY_DROP_OLDEST, client_window=4,
+                 metrics=METRICS_DISABLED, **device_options):
+        if key not in KEYS:
+            raise ValueError(f"Unknown device key {key!r}, expected one of {KEYS}")
+        self.socketio = socketio
+        self.key = key
+        self.max_devices = max_devices
+        self.default_name = default
+        self.legacy_sample_rate = legacy_sample_rate
+        self.autostart = autostart
+        self.archive_dir = archive_dir
+        self.archive_tiers = archive_tiers
+        self.archive_segment_seconds = archive_segment_seconds
+        self.device_options = device_options
+        self.metrics = metrics
+        if metrics.enabled:
+            metrics.watch(self)
+        self.clients = ClientHub(socketio, client_queue, client_policy, client_window,
+                                 device_options.get('broadcast_hz', 30), metrics)
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._rejected = set()
+
+    def key_for(self, packet, addr):
+        if packet.legacy or self.key == KEY_ADDRESS:
+            return addr[0]
+        return str(packet.device_id)
+
+    def get(self, name):
+        return self._devices.get(name)
+
+    def default(self):
+        """The configured default device if it exists, else the first one seen"""
+        devices = self._devices
+        if self.default_name in devices:
+            return devices[self.default_name]
+        return next(iter(devices.values()), None)
+
+    def subscription(self, request):
+        """
+        Device ids a 'subscribe' event asks for: {'devices': [...]},
+        {'device': id}, or {} for the default device
+        """
+        request = request or {}
+        wanted = request.get('devices')
+        if wanted is None and request.get('device') is not None:
+            wanted = [request['device']]
+        if wanted is None:
+            device = self.default()
+            wanted = [device.name if device else self.default_name]
+        return [str(name) for name in wanted if name is not None]
+
+    def __iter__(self):
+        return iter(list(self._devices.values()))
+
+    def __len__(self):
+        return len(self._devices)
+
+    def _create(self, name, addr, sample_rate, packet):
+        with self._lock:
+            if name in self._devices:
+                return self._devices[name]
+            if len(self._devices) >= self.max_devices:
+                if name not in self._rejected:
+                    self._rejected.add(name)
+                    print(f"Ignoring device {name} from {addr[0]}: {self.max_devices} devices already")
+                return None
+            archive = None
+            if self.archive_dir is not None:
+                archive = DeviceArchive(self.archive_dir, name, sample_rate, self.archive_tiers,
+                                        self.archive_segment_seconds, scale=packet.scale,
+                                        gain=packet.gain or 1)
+            device = Device(name, self.socketio, sample_rate, address=addr[0], archive=archive,
+                            clients=self.clients, metrics=self.metrics, **self.device_options)
+            if self.autostart:
+                device.broadcaster.start()
+                self.clients.start()
+            devices = dict(self._devices)
+            devices[name] = device
+            self._devices = devices
+        print(f"New device {name} from {addr[0]} at {sample_rate:g} Hz")
+        return device
+
+    def poll(self, now=None):
+        """Release held packets on every device; returns [(device, beats)] with beats"""
+        now = time.time() if now is None else now
+        results = []
+        for device in self:
+            beats = device.poll(now)
+            if beats:
+                results.append((device, beats))
+        return results
+
+    def close(self):
+        """Finish every device's archive files"""
+        for device in self:
+            if device.archive is not None:
+                device.archive.close()
+
+    def ingest(self, packet, addr, arrival=None):
+        """Route a packet to its device; returns (device, beats), device None if rejected"""
+        arrival = time.time() if arrival is None else arrival
+        sample_rate = packet.sample_rate or self.legacy_sample_rate
+        name = self.key_for(packet, addr)
+        device = self._devices.get(name) or self._create(name, addr, sample_rate, packet)
+        if device is None:
+            return None, []
+        return device, device.ingest(packet, arrival, sample_rate)
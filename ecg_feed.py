@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+ECG TCP Feed
+Length-prefixed binary stream of one device's samples for desktop viewers (client.py)
+
+A client connects, may send one request frame ({"device": "1"}, JSON,
+framed as in ecg_protocol.py; nothing or {} means the default device) and
+then receives an ECGD data frame with the time, raw and filtered columns
+of everything new in the device's ring buffer, `rate` times per second.
+The first frame carries the whole live window so the plot starts full.
+Nothing on the wire is pickled, so a client can't be made to run code.
+
+Each connection gets its own thread reading the ring buffer through a
+sequence cursor, exactly like a /data?since= poller, so a slow viewer
+never holds up UDP ingestion; one that falls a whole window behind just
+skips ahead. The server runs in both server modes.
+"""
+
+import json
+import socket
+import threading
+import time
+
+from ecg_protocol import encode_frame, encode_data_frame, FrameDecoder, ProtocolError
+
+REQUEST_TIMEOUT = 1.0   # seconds to wait for the optional request frame
+SEND_TIMEOUT = 5.0      # drop clients that stop reading for this long
+
+
+class FeedServer:
+    """
+    feed = FeedServer(devices, '0.0.0.0', 5000, rate=30)
+    feed.start()
+    """
+
+    def __init__(self, devices, host='0.0.0.0', port=5000, rate=30):
+        self.devices = devices
+        self.host = host
+        self.port = port
+        self.interval = 1.0 / rate
+        self._sock = None
+        self._running = False
+
+    def start(self):
+        """Listen and accept clients in a background thread"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen()
+        self._running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+        print(f"TCP feed listening on {self.host}:{self.port}")
+
+    def stop(self):
+        self._running = False
+        if self._sock is not None:
+            self._sock.close()
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn, addr = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn, addr), daemon=True).start()
+
+    def _request(self, conn):
+        """The client's request frame, {} if it sends none in time"""
+        decoder = FrameDecoder(max_frame=4096)
+        conn.settimeout(REQUEST_TIMEOUT)
+        try:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return None
+                frames = decoder.feed(data)
+                if frames:
+                    request = json.loads(frames[0].decode('utf-8'))
+                    return request if isinstance(request, dict) else {}
+        except socket.timeout:
+            return {}
+        except (ProtocolError, ValueError) as e:
+            print(f"Bad feed request: {e}")
+            return {}
+
+    def _serve(self, conn, addr):
+        with conn:
+            request = self._request(conn)
+            if request is None:
+                return
+            name = request.get('device')
+            name = None if name is None else str(name)
+            conn.settimeout(SEND_TIMEOUT)
+            print(f"Feed client {addr[0]} connected (device {name or 'default'})")
+
+            cursor = None
+            device = None
+            next_at = time.monotonic()
+            try:
+                while self._running:
+                    next_at += self.interval
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        # Fell behind (slow client): don't try to catch up with a burst
+                        next_at = time.monotonic()
+                    current = self.devices.default() if name is None else self.devices.get(name)
+                    if current is None:
+                        continue
+                    if current is not device:
+                        # New (or newly default) device: start with its whole window
+                        device, cursor = current, None
+                    first, columns = device.buffer.snapshot(since=cursor)
+                    count = len(columns['time'])
+                    if count == 0:
+                        continue
+                    cursor = first + count
+                    body = encode_data_frame(first, cursor, columns['time'],
+                                             columns['voltage'], columns['filtered'])
+                    conn.sendall(encode_frame(body))
+            except OSError:
+                pass
+            print(f"Feed client {addr[0]} disconnected")
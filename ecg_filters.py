@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+ECG Streaming Filters
+Causal bandpass / notch filtering of the live stream, one batch at a time
+
+Unlike the offline filtfilt in plot_ecg.py this runs in the receiver
+path: second-order sections carry their state (zi) from one batch to
+the next, so the output is continuous across packets.
+"""
+
+import numpy as np
+from scipy import signal
+
+# Standard ECG diagnostic band
+DEFAULT_BAND = (0.5, 40.0)
+NOTCH_Q = 30.0
+
+
+def design_sos(sample_rate, band=DEFAULT_BAND, notch=None, order=2):
+    """Butterworth bandpass (plus optional mains notch) as second-order sections"""
+    nyquist = sample_rate / 2
+    low, high = band
+    high = min(high, nyquist * 0.9)  # Don't exceed Nyquist
+    if not 0 < low < high:
+        raise ValueError(f"Band {band} is not usable at {sample_rate:.1f} Hz")
+    sos = signal.butter(order, [low, high], btype='band', output='sos', fs=sample_rate)
+
+    if notch and notch < nyquist:
+        b, a = signal.iirnotch(notch, NOTCH_Q, fs=sample_rate)
+        sos = np.vstack((sos, signal.tf2sos(b, a)))
+    return sos
+
+
+class StreamingFilter:
+    """
+    Stateful SOS filter for a single channel.
+
+    The filter is designed lazily for the first sample rate it sees and
+    redesigned (state reset) if the rate changes.
+    """
+
+    def __init__(self, band=DEFAULT_BAND, notch=None, order=2):
+        self.band = band
+        self.notch = notch
+        self.order = order
+        self.sample_rate = None
+        self._sos = None
+        self._zi = None
+
+    def reset(self):
+        self._zi = None
+
+    def process(self, samples, sample_rate):
+        """Filter one batch, returns float32 output of the same length"""
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+        if sample_rate != self.sample_rate:
+            self._sos = design_sos(sample_rate, self.band, self.notch, self.order)
+            self.sample_rate = sample_rate
+            self._zi = None
+
+        x = np.asarray(samples, dtype=np.float64)
+        if self._zi is None:
+            # Start in steady state for the first value to avoid a big step transient
+            self._zi = signal.sosfilt_zi(self._sos) * x[0]
+        y, self._zi = signal.sosfilt(self._sos, x, zi=self._zi)
+        return y.astype(np.float32)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+ECG Jitter Buffer
+Reorders a device's packets by sequence number and rebuilds a uniform time axis
+
+Packets carry a sequence number and the sender's timestamp of their first
+sample (see ecg_protocol.py). Instead of stamping samples with their
+arrival time, which bakes network jitter and Wi-Fi bursts into the time
+axis, the receiver places every sample on the sender's sample clock:
+
+    - in-order packets are released immediately, so a clean link adds no
+      latency at all
+    - a packet that arrives ahead of a missing one is held for up to
+      `delay` seconds waiting for the missing packet; after that the
+      missing packets are counted as lost and the held ones released
+    - late packets (their slot was already given up) and duplicates are
+      dropped and counted
+    - a jump in the sender timestamp larger than 1.5 sample periods is a
+      gap; gaps up to `max_gap` seconds are filled by linear interpolation
+      (fill='interpolate') or left as a hole in the time axis (fill='none'),
+      and reported either way
+    - a sequence jump of more than RESYNC_PACKETS, or the numbering going
+      back while the timestamps go on, means the sender restarted and the
+      buffer starts over; if the sender clock goes back by more than
+      RESYNC_SECONDS the time axis carries on without a step
+
+Jitter is the RFC 3550 interarrival jitter of the packets' transit times
+(arrival minus sender timestamp), so a constant clock offset between the
+Pi and the server does not matter.
+"""
+
+from collections import deque
+
+import numpy as np
+
+SEQ_MODULO = 2 ** 32
+RESYNC_PACKETS = 1000       # larger sequence jumps mean the sender restarted
+RESYNC_SECONDS = 1.0        # so does its clock going back by more than this
+GAP_TOLERANCE = 1.5         # sample periods of timestamp slip before it is a gap
+MAX_HELD = 64               # packets held at most while waiting for a missing one
+DUPLICATE_HISTORY = 64      # released sequence numbers remembered to spot duplicates
+
+FILL_INTERPOLATE = 'interpolate'
+FILL_NONE = 'none'
+FILL_MODES = (FILL_INTERPOLATE, FILL_NONE)
+
+
+def seq_distance(seq, expected):
+    """How far seq is ahead of expected, negative when behind (wrap-aware)"""
+    diff = (seq - expected) % SEQ_MODULO
+    return diff - SEQ_MODULO if diff >= SEQ_MODULO // 2 else diff
+
+
+class JitterBuffer:
+    """
+    One device's reorder buffer and sample clock.
+
+    push() takes each packet as it arrives and poll() is called
+    periodically so held packets are released even when the stream stops;
+    both return (times, voltages, gaps) for the samples released, or None.
+    Times are seconds on the sender's clock with 0 at the first sample;
+    gaps are dicts with the start/end time of the missing stretch, its
+    length in samples and whether it was filled.
+    """
+
+    def __init__(self, delay=0.05, fill=FILL_INTERPOLATE, max_gap=1.0):
+        if fill not in FILL_MODES:
+            raise ValueError(f"Unknown gap fill {fill!r}, expected one of {FILL_MODES}")
+        self.delay = delay
+        self.fill = fill
+        self.max_gap = max_gap
+        self._held = {}             # seq -> (packet, arrival, sample rate)
+        self._expected = None       # next sequence number to release
+        self._released = deque(maxlen=DUPLICATE_HISTORY)
+        self._origin = None         # sender timestamp of time 0
+        self._next_time = 0.0       # time of the next expected sample
+        self._period = None
+        self._last_value = None
+        self._transit = None
+        self.jitter = 0.0
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.gaps = 0
+        self.gap_samples = 0
+        self.resyncs = 0
+        self.last_gap = None
+
+    def push(self, packet, arrival, sample_rate):
+        """Queue a packet; returns whatever it lets through"""
+        self.received += 1
+        self._update_jitter(packet, arrival, sample_rate)
+
+        if self._expected is None:
+            self._expected = packet.seq
+        if packet.seq in self._held or packet.seq in self._released:
+            self.duplicates += 1
+            return None
+
+        ahead = seq_distance(packet.seq, self._expected)
+        if abs(ahead) > RESYNC_PACKETS or (ahead < 0 and self._is_newer(packet)):
+            # Sender restarted: release what is held and follow the new numbering
+            self.resyncs += 1
+            released = self._release(arrival, flush=True)
+            self._released.clear()
+            self._expected = packet.seq
+            ahead = 0
+        else:
+            released = []
+
+        if ahead < 0:
+            self.late += 1
+            return self._join(released)
+
+        if ahead == 0 and self._held:
+            # Fills a hole that later packets are waiting behind
+            self.reordered += 1
+        self._held[packet.seq] = (packet, arrival, sample_rate)
+        released.extend(self._release(arrival))
+        return self._join(released)
+
+    def poll(self, now):
+        """Release held packets whose wait is over"""
+        if not self._held:
+            return None
+        return self._join(self._release(now))
+
+    @property
+    def held(self):
+        return len(self._held)
+
+    def stats(self):
+        total = self.received + self.lost - self.late - self.duplicates
+        return {
+            'received': self.received,
+            'lost': self.lost,
+            'late': self.late,
+            'duplicates': self.duplicates,
+            'reordered': self.reordered,
+            'loss': round(self.lost / total, 6) if total > 0 else 0.0,
+            'jitter_ms': round(self.jitter * 1000, 3),
+            'held': len(self._held),
+            'gaps': self.gaps,
+            'gap_samples': self.gap_samples,
+            'resyncs': self.resyncs,
+            'last_gap': self.last_gap
+        }
+
+    def _is_newer(self, packet):
+        """True if a packet starts after everything released so far"""
+        if self._origin is None or packet.t0 is None:
+            return False
+        return packet.t0 - self._origin >= self._next_time - GAP_TOLERANCE * self._period
+
+    def _update_jitter(self, packet, arrival, sample_rate):
+        """RFC 3550 interarrival jitter of the last sample's transit time"""
+        if packet.t0 is None or sample_rate <= 0:
+            return
+        transit = arrival - (packet.t0 + (len(packet) - 1) / sample_rate)
+        if self._transit is not None:
+            self.jitter += (abs(transit - self._transit) - self.jitter) / 16.0
+        self._transit = transit
+
+    def _release(self, now, flush=False):
+        """Sample blocks for every packet that can go, oldest first"""
+        out = []
+        while self._held:
+            if self._expected in self._held:
+                packet, _, sample_rate = self._held.pop(self._expected)
+                self._released.append(self._expected)
+                self._expected = (self._expected + 1) % SEQ_MODULO
+                out.append(self._place(packet, sample_rate))
+                continue
+            # Give up on the missing packet(s) once the next one has waited long enough
+            seq = min(self._held, key=lambda s: seq_distance(s, self._expected))
+            waited = now - self._held[seq][1]
+            if not flush and waited < self.delay and len(self._held) < MAX_HELD:
+                break
+            self.lost += seq_distance(seq, self._expected)
+            self._expected = seq
+        return out
+
+    def _place(self, packet, sample_rate):
+        """Times for a packet's samples, plus gap fill before them"""
+        count = len(packet)
+        voltages = np.asarray(packet.voltages, dtype=np.float32)
+        period = self._period = 1.0 / sample_rate
+        if self._origin is None:
+            self._origin = packet.t0
+        slip = (packet.t0 - self._origin) - self._next_time
+
+        gap = None
+        fill_times = fill_values = None
+        if slip > GAP_TOLERANCE * period:
+            missing = int(round(slip * sample_rate))
+            start = self._next_time
+            filled = (self.fill == FILL_INTERPOLATE and missing * period <= self.max_gap
+                      and self._last_value is not None and count > 0)
+            if filled:
+                steps = np.arange(1, missing + 1) / (missing + 1)
+                fill_times = start + np.arange(missing) * period
+                fill_values = (self._last_value + (voltages[0] - self._last_value) * steps
+                               ).astype(np.float32)
+            self._next_time += missing * period
+            gap = {'start': round(start, 6), 'end': round(self._next_time, 6),
+                   'samples': missing, 'filled': bool(filled)}
+            self.gaps += 1
+            self.gap_samples += missing
+            self.last_gap = gap
+        elif slip < -RESYNC_SECONDS:
+            # Sender clock went back: keep the time axis running
+            self._origin = packet.t0 - self._next_time
+            self.resyncs += 1
+
+        # Within tolerance the sample count is the clock, so the axis stays uniform
+        times = self._next_time + np.arange(count) * period
+        self._next_time += count * period
+        if count:
+            self._last_value = float(voltages[-1])
+        if fill_times is not None:
+            times = np.concatenate((fill_times, times))
+            voltages = np.concatenate((fill_values, voltages))
+        return times, voltages, gap
+
+    @staticmethod
+    def _join(blocks):
+        if not blocks:
+            return None
+        times = np.concatenate([b[0] for b in blocks])
+        voltages = np.concatenate([b[1] for b in blocks])
+        gaps = [b[2] for b in blocks if b[2] is not None]
+        return times, voltages, gaps
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+ECG Recording Loader
+Fast, chunked loading of ecg_data.txt style recordings
+
+    # ECG Data Recording
+    # Format: sample_number,time(s),voltage(V)
+    # Sample rate: ~200 Hz
+    0,0.000001,1.960000
+    ...
+
+The file is read in large byte blocks and each block is parsed with one
+vectorized NumPy call (np.loadtxt) instead of split(',') per line; only
+a block with malformed lines is parsed line by line. Parsed arrays are
+cached next to the recording (.<name>.npz), keyed by file size and mtime,
+so loading the same recording again is nearly instant.
+"""
+
+import io
+import os
+import re
+
+import numpy as np
+
+BLOCK_BYTES = 16 * 1024 * 1024
+COLUMNS = 3  # sample_number, time, voltage
+CACHE_VERSION = 1
+
+
+def read_header(path):
+    """Metadata from the '#' lines at the top of a recording, keys lower-cased"""
+    meta = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.startswith('#'):
+                break
+            match = re.match(r'#\s*([^:]+):\s*(.*)', line.strip())
+            if match:
+                meta[match.group(1).strip().lower()] = match.group(2).strip()
+    return meta
+
+
+def header_sample_rate(meta):
+    """Nominal sample rate from a '# Sample rate: ~200 Hz' header, or None"""
+    match = re.search(r'[\d.]+', meta.get('sample rate', ''))
+    return float(match.group()) if match else None
+
+
+def _parse_block(text):
+    """Parse complete CSV lines into an (n, 3) float64 array"""
+    if '#' in text:
+        text = '\n'.join(line for line in text.splitlines() if not line.startswith('#'))
+    if not text.strip():
+        return np.zeros((0, COLUMNS))
+    try:
+        values = np.loadtxt(io.StringIO(text), dtype=np.float64, delimiter=',', ndmin=2)
+        if values.shape[1] == COLUMNS:
+            return values
+    except ValueError:
+        pass
+
+    # Malformed lines (e.g. a truncated last line after a crash): parse the slow way
+    rows = []
+    for line in text.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) == COLUMNS:
+            try:
+                rows.append([float(p) for p in parts])
+            except ValueError:
+                continue
+    return np.array(rows, dtype=np.float64).reshape(-1, COLUMNS)
+
+
+def iter_blocks(path, block_bytes=BLOCK_BYTES):
+    """Yield (sample_numbers, times, voltages) array blocks without loading the whole file"""
+    with open(path, 'rb') as f:
+        leftover = b''
+        while True:
+            chunk = f.read(block_bytes)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            cut = chunk.rfind(b'\n')
+            if cut < 0:
+                leftover = chunk
+                continue
+            leftover = chunk[cut + 1:]
+            data = _parse_block(chunk[:cut].decode('ascii', errors='replace'))
+            if len(data):
+                yield data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+        if leftover.strip():
+            data = _parse_block(leftover.decode('ascii', errors='replace'))
+            if len(data):
+                yield data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+def cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.npz")
+
+
+def _cache_key(path):
+    stat = os.stat(path)
+    return np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _read_cache(path):
+    try:
+        with np.load(cache_path(path)) as cached:
+            if np.array_equal(cached['key'], _cache_key(path)):
+                return cached['sample_numbers'], cached['times'], cached['voltages']
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+def _write_cache(path, sample_numbers, times, voltages):
+    target = cache_path(path)
+    tmp = target + '.tmp.npz'
+    try:
+        np.savez(tmp, key=_cache_key(path), sample_numbers=sample_numbers,
+                 times=times, voltages=voltages)
+        os.replace(tmp, target)
+    except OSError as e:
+        # A read-only directory just means no cache
+        print(f"Could not write cache {target}: {e}")
+
+
+def load(path, use_cache=True):
+    """Load a whole recording as (sample_numbers, times, voltages) arrays"""
+    if use_cache:
+        cached = _read_cache(path)
+        if cached is not None:
+            return cached
+
+    blocks = list(iter_blocks(path))
+    if blocks:
+        sample_numbers, times, voltages = (np.concatenate(column) for column in zip(*blocks))
+    else:
+        sample_numbers, times, voltages = np.zeros(0, np.int64), np.zeros(0), np.zeros(0)
+
+    if use_cache:
+        _write_cache(path, sample_numbers, times, voltages)
+    return sample_numbers, times, voltages
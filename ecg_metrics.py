@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+ECG Server Metrics
+Counters, histograms and gauges for the ingest and broadcast path, in Prometheus text format
+
+Most numbers already exist as plain counters on the devices, jitter
+buffers and client queues (packets, samples, lost packets, gaps, queued
+and dropped messages), so they are read when /metrics is scraped and cost
+the hot path nothing. Only what has to be measured as it happens is
+recorded live:
+
+    ecg_decode_errors_total            packets that failed to decode
+    ecg_receive_to_emit_seconds        packet arrival to its batch being handed
+                                       to Socket.IO for a client
+    ecg_emit_seconds                   one Socket.IO emit (serialization included)
+    ecg_buffer_lock_wait_seconds       waiting for a device's ring buffer lock
+    ecg_buffer_lock_hold_seconds       holding it (appends and /data snapshots)
+    ecg_http_request_seconds{route}    HTTP handler time per route
+
+With metrics disabled every instrument is a shared no-op object, buffers
+get a plain threading.Lock and nothing reads the clock, so all that is
+left on the hot path is an `if metrics.enabled` here and there.
+
+No prometheus_client dependency: the text format is small enough to write
+out here.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; ingest and emit times are sub-millisecond, latencies tens of ms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0,
+                   2.5, 5.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                0.01, 0.025, 0.1)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Null:
+    """Stands in for every instrument while metrics are disabled"""
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+NULL = _Null()
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        return _Child(self, tuple(str(v) for v in values))
+
+    def inc(self, amount=1, key=()):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values) or ({(): 0} if not self.labelnames else {})
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative buckets plus sum and count, per label set"""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}   # label values -> [bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        return _Child(self, tuple(str(v) for v in values))
+
+    def observe(self, value, key=()):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.bounds) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def counts(self):
+        """Bucket counts summed over every label set (not cumulative)"""
+        total = [0] * (len(self.bounds) + 1)
+        with self._lock:
+            for counts, _ in self._series.values():
+                total = [a + b for a, b in zip(total, counts)]
+        return total
+
+    def quantile(self, q, counts):
+        """Upper bucket bound below which a fraction q of the counted observations fall"""
+        n = sum(counts)
+        if n == 0:
+            return None
+        rank, seen = q * n, 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                le = ('le', _number(bound if bound == float('inf') else float(bound)))
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_number(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _Child:
+    """One label set of a labelled counter or histogram"""
+
+    __slots__ = ('parent', 'key')
+
+    def __init__(self, parent, key):
+        self.parent = parent
+        self.key = key
+
+    def inc(self, amount=1):
+        self.parent.inc(amount, self.key)
+
+    def observe(self, value):
+        self.parent.observe(value, self.key)
+
+
+class TimedLock:
+    """threading.Lock that records how long it is waited for and held"""
+
+    def __init__(self, wait, hold):
+        self.wait = wait
+        self.hold = hold
+        self._lock = threading.Lock()
+        self._acquired = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        # Only the holder writes this, and reads it back before releasing
+        self._acquired = time.perf_counter()
+        self.wait.observe(self._acquired - start)
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self._acquired
+        self._lock.release()
+        self.hold.observe(held)
+
+
+class Metrics:
+    """
+    metrics = Metrics(enabled=True)
+    metrics.watch(devices)          # DeviceRegistry read at scrape time
+    text = metrics.render()         # Prometheus exposition format
+
+    The instruments are attributes (metrics.decode_errors.inc(),
+    metrics.emit_seconds.observe(...)); callers that have to read the
+    clock for a measurement check metrics.enabled first.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.time()
+        self._instruments = []
+        self._devices = None
+        self._last_log = None
+        self.decode_errors = self.counter(
+            'ecg_decode_errors_total', 'UDP packets that failed to decode')
+        self.emit_latency = self.histogram(
+            'ecg_receive_to_emit_seconds',
+            'Packet arrival to its samples being handed to Socket.IO for a client')
+        self.emit_seconds = self.histogram(
+            'ecg_emit_seconds', 'Time spent in one Socket.IO emit', FAST_BUCKETS)
+        self.lock_wait = self.histogram(
+            'ecg_buffer_lock_wait_seconds', 'Time spent waiting for a ring buffer lock',
+            FAST_BUCKETS)
+        self.lock_hold = self.histogram(
+            'ecg_buffer_lock_hold_seconds', 'Time a ring buffer lock was held', FAST_BUCKETS)
+        self.request_seconds = self.histogram(
+            'ecg_http_request_seconds', 'HTTP handler time per route', FAST_BUCKETS + (0.25, 1.0),
+            ('route',))
+
+    def counter(self, name, help, labelnames=()):
+        if not self.enabled:
+            return NULL
+        counter = Counter(name, help, labelnames)
+        self._instruments.append(counter)
+        return counter
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        if not self.enabled:
+            return NULL
+        histogram = Histogram(name, help, buckets, labelnames)
+        self._instruments.append(histogram)
+        return histogram
+
+    def lock(self):
+        """Lock for a ring buffer, timed when metrics are on"""
+        if not self.enabled:
+            return threading.Lock()
+        return TimedLock(self.lock_wait, self.lock_hold)
+
+    def watch(self, devices):
+        self._devices = devices
+
+    # --- Exposition ---------------------------------------------------------
+
+    def render(self):
+        lines = []
+        for instrument in self._instruments:
+            lines.extend(instrument.render())
+        if self._devices is not None:
+            lines.extend(self._collect(self._devices))
+        lines.append('# HELP ecg_uptime_seconds Seconds since the server started')
+        lines.append('# TYPE ecg_uptime_seconds gauge')
+        lines.append(f'ecg_uptime_seconds {_number(round(time.time() - self.started, 3))}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _collect(devices):
+        """Counters and gauges read from the devices and client queues"""
+        devices_list = list(devices)
+        per_device = (
+            ('ecg_packets_total', 'counter', 'Packets received', lambda d: d.packets),
+            ('ecg_samples_total', 'counter', 'Samples buffered', lambda d: d.buffer.end),
+            ('ecg_lost_packets_total', 'counter', 'Packets given up as lost',
+             lambda d: d.jitter.lost),
+            ('ecg_late_packets_total', 'counter', 'Packets that arrived too late',
+             lambda d: d.jitter.late),
+            ('ecg_duplicate_packets_total', 'counter', 'Duplicate packets',
+             lambda d: d.jitter.duplicates),
+            ('ecg_gaps_total', 'counter', 'Gaps in the sender timestamps', lambda d: d.jitter.gaps),
+            ('ecg_gap_samples_total', 'counter', 'Samples missing in gaps',
+             lambda d: d.jitter.gap_samples),
+            ('ecg_jitter_seconds', 'gauge', 'Interarrival jitter', lambda d: d.jitter.jitter),
+            ('ecg_buffer_fill_ratio', 'gauge', 'Fraction of the live window buffer in use',
+             lambda d: len(d.buffer) / d.buffer.capacity),
+            ('ecg_heart_rate_bpm', 'gauge', 'Smoothed heart rate', lambda d: d.qrs.heart_rate),
+        )
+        lines = []
+        for name, kind, help, value in per_device:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for device in devices_list:
+                lines.append(f'{name}{_labels(("device",), (device.name,))} '
+                             f'{_number(value(device))}')
+
+        clients = devices.clients.stats()['clients']
+        totals = (
+            ('ecg_clients', 'gauge', 'Connected Socket.IO clients', len(clients)),
+            ('ecg_client_queued_messages', 'gauge', 'Messages waiting in client send queues',
+             sum(c['queued'] for c in clients)),
+            ('ecg_client_max_lag_seconds', 'gauge', 'Age of the oldest queued client message',
+             max((c['lag'] for c in clients), default=0.0)),
+            ('ecg_client_dropped_messages', 'gauge',
+             'Messages dropped by the connected clients\' queues', sum(c['dropped'] for c in clients)),
+            ('ecg_client_disconnects_total', 'counter', 'Clients disconnected by the queue policy',
+             devices.clients.disconnected),
+        )
+        for name, kind, help, value in totals:
+            lines.extend((f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {_number(value)}'))
+        return lines
+
+    # --- Logging ------------------------------------------------------------
+
+    def summary(self):
+        """One line with rates and latency quantiles since the previous call"""
+        now = time.time()
+        devices = list(self._devices) if self._devices is not None else []
+        state = {
+            'time': now,
+            'packets': sum(d.packets for d in devices),
+            'samples': sum(d.buffer.end for d in devices),
+            'lost': sum(d.jitter.lost for d in devices),
+            'latency': self.emit_latency.counts(),
+            'emit': self.emit_seconds.counts(),
+            'hold': self.lock_hold.counts(),
+        }
+        last = self._last_log or {'time': self.started, 'packets': 0, 'samples': 0, 'lost': 0,
+                                  'latency': [0] * len(state['latency']),
+                                  'emit': [0] * len(state['emit']),
+                                  'hold': [0] * len(state['hold'])}
+        self._last_log = state
+        elapsed = max(now - last['time'], 1e-9)
+
+        def quantiles(histogram, key, scale=1000):
+            counts = [a - b for a, b in zip(state[key], last[key])]
+            p50, p99 = histogram.quantile(0.5, counts), histogram.quantile(0.99, counts)
+            if p50 is None:
+                return '-'
+            return f"p50<={p50 * scale:g} p99<={p99 * scale:g}"
+
+        clients = self._devices.clients.stats()['clients'] if self._devices is not None else []
+        return (f"{(state['packets'] - last['packets']) / elapsed:.0f} packets/s, "
+                f"{(state['samples'] - last['samples']) / elapsed:.0f} samples/s, "
+                f"{state['lost'] - last['lost']} lost, "
+                f"latency ms {quantiles(self.emit_latency, 'latency')}, "
+                f"emit ms {quantiles(self.emit_seconds, 'emit')}, "
+                f"lock hold ms {quantiles(self.lock_hold, 'hold')}, "
+                f"{len(clients)} clients, {sum(c['queued'] for c in clients)} queued")
+
+    def start_logging(self, interval):
+        """Print summary() every interval seconds from a daemon thread"""
+        if not self.enabled or not interval:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    print(f"Metrics: {self.summary()}")
+                except Exception as e:
+                    print(f"Error logging metrics: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+DISABLED = Metrics(enabled=False)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+ECG Acquisition Pipeline
+Keeps ADC reads independent of disk and network I/O
+
+    acquisition thread --> RingBuffer --> writer stage (file)
+                                     \\-> sender stage (UDP)
+
+The acquisition thread only reads the ADC at its deadlines and appends
+to a preallocated ring; it never waits on a consumer. Each stage runs in
+its own thread with its own read cursor and drains everything new in
+bulk every `interval` seconds. A stage that falls more than the ring's
+capacity behind loses the oldest samples, and those are counted as
+dropped instead of stalling acquisition.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from ecg_buffer import RingBuffer
+
+PIPELINE_COLUMNS = (('time', np.float64), ('value', np.float64))
+
+
+class Stage:
+    """A consumer thread that drains the ring in bulk and hands batches to handler(times, values)"""
+
+    def __init__(self, name, ring, handler, interval=0.05):
+        self.name = name
+        self.ring = ring
+        self.handler = handler
+        self.interval = interval
+        self.cursor = 0
+        self.samples = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_latency = 0.0     # acquisition of the oldest sample -> handled (s)
+        self.max_latency = 0.0
+        self.busy_time = 0.0        # total time spent in handler (s)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"stage-{name}", daemon=True)
+
+    @property
+    def depth(self):
+        """Samples written but not yet handled by this stage"""
+        return self.ring.end - self.cursor
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Drain what is left, then stop"""
+        self._stop.set()
+        self._thread.join()
+
+    def drain(self):
+        """Hand everything new to the handler; returns the number of samples handled"""
+        self.max_depth = max(self.max_depth, self.depth)
+        first, columns = self.ring.snapshot(since=self.cursor)
+        if first > self.cursor:
+            self.dropped += first - self.cursor
+        times, values = columns['time'], columns['value']
+        self.cursor = first + len(times)
+        if len(times) == 0:
+            return 0
+
+        started = time.time()
+        try:
+            self.handler(times, values)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error in {self.name} stage: {e}")
+        done = time.time()
+        self.busy_time += done - started
+        self.last_latency = done - times[0]
+        self.max_latency = max(self.max_latency, self.last_latency)
+        self.samples += len(times)
+        self.batches += 1
+        return len(times)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.drain()
+        self.drain()
+
+    def stats(self):
+        return {
+            'samples': self.samples,
+            'batches': self.batches,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'latency_ms': round(self.last_latency * 1000, 2),
+            'max_latency_ms': round(self.max_latency * 1000, 2),
+            'busy_ms': round(self.busy_time * 1000, 1)
+        }
+
+
+class Pipeline:
+    """
+    Acquisition thread plus any number of consumer stages.
+
+    Sample times handed to stages are wall-clock (time.time()) acquisition
+    timestamps taken by the SampleScheduler.
+    """
+
+    def __init__(self, scheduler, channel, buffer_seconds=5.0, raw=False, duration=None):
+        self.scheduler = scheduler
+        self.channel = channel
+        self.raw = raw
+        self.duration = duration
+        self.ring = RingBuffer.for_window(buffer_seconds, scheduler.sample_rate, PIPELINE_COLUMNS)
+        self.stages = []
+        self.error = None
+        self._thread = threading.Thread(target=self._acquire, name="acquisition", daemon=True)
+
+    def add_stage(self, name, handler, interval=0.05):
+        stage = Stage(name, self.ring, handler, interval)
+        self.stages.append(stage)
+        if self._thread.ident is not None:
+            # Added while acquiring: catches up from the oldest sample still in the ring
+            stage.start()
+        return stage
+
+    def _acquire(self):
+        ring = self.ring
+        try:
+            samples = self.scheduler.run(self.channel, duration=self.duration, raw=self.raw)
+            for _, elapsed, value in samples:
+                ring.append(time=self.scheduler.start_time + elapsed, value=value)
+        except Exception as e:
+            self.error = e
+            print(f"Error in acquisition: {e}")
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stop(self):
+        """Stop acquisition, let every stage drain, then stop the stages"""
+        self.scheduler.stop()
+        self._thread.join()
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self):
+        s = self.scheduler
+        return {
+            'acquired': s.count,
+            'rate_hz': round(s.actual_rate, 2),
+            'overruns': s.overruns,
+            'missed': s.missed,
+            'buffer_capacity': self.ring.capacity,
+            'stages': {stage.name: stage.stats() for stage in self.stages}
+        }
+
+    def report(self):
+        """One line per stage: depth, drops and latency"""
+        lines = [self.scheduler.report()]
+        for stage in self.stages:
+            st = stage.stats()
+            lines.append(f"  {stage.name}: {st['samples']} samples in {st['batches']} batches, "
+                         f"depth {st['depth']} (max {st['max_depth']}/{self.ring.capacity}), "
+                         f"dropped {st['dropped']}, latency {st['latency_ms']} ms "
+                         f"(max {st['max_latency_ms']} ms)")
+        return '\n'.join(lines)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+ECG UDP Wire Protocol
+Batched, versioned packet format shared by the senders and realtime_server.py
+
+Packet layout (little-endian):
+    magic        2s   b'EC'
+    version      B    protocol version (1)
+    encoding     B    payload encoding (0 = float32 volts, 1 = delta int16 codes)
+    device_id    H    sender id, lets the server tell devices apart
+    seq          I    packet sequence number, wraps at 2**32
+    sample_rate  f    nominal sample rate in Hz
+    t0           d    sender timestamp of the first sample (seconds)
+    count        H    number of samples in the payload
+    payload      count * float32                        (encoding 0)
+                 gain f, scale f, first h, count - 1 varints (encoding 1)
+
+Encoding 1 carries raw ADS1115 codes: `scale` volts per code at ADC
+`gain`, the first code, then the differences between successive codes
+zigzag/varint packed (see ecg_codec.py). ECG samples rarely move more
+than 63 codes between samples, so most take one byte instead of four.
+decode_packet() turns either encoding into float32 volts.
+
+Legacy senders send a bare 4-byte float per datagram; decode_packet()
+still accepts those.
+"""
+
+import struct
+import time
+
+MAGIC = b'EC'
+VERSION = 1
+
+ENCODING_FLOAT32 = 0
+ENCODING_DELTA = 1
+ENCODINGS = {'float32': ENCODING_FLOAT32, 'delta': ENCODING_DELTA}
+
+HEADER = struct.Struct('<2sBBHIfdH')
+DELTA_HEADER = struct.Struct('<ffh')
+LEGACY_SIZE = 4
+
+# Keep datagrams below a typical 1500 byte MTU so Wi-Fi never fragments them
+MAX_DATAGRAM = 1400
+MAX_SAMPLES_PER_PACKET = (MAX_DATAGRAM - HEADER.size) // 4
+
+# Largest datagram the receiver should ask recvfrom() for
+RECV_SIZE = 65535
+
+
+class Packet:
+    """Decoded UDP packet"""
+
+    __slots__ = ('device_id', 'seq', 'sample_rate', 't0', 'voltages', 'encoding', 'gain',
+                 'scale')
+
+    def __init__(self, device_id, seq, sample_rate, t0, voltages, encoding=ENCODING_FLOAT32,
+                 gain=None, scale=None):
+        self.device_id = device_id
+        self.seq = seq
+        self.sample_rate = sample_rate
+        self.t0 = t0
+        self.voltages = voltages
+        self.encoding = encoding
+        self.gain = gain        # ADC gain and volts per code, delta packets only
+        self.scale = scale
+
+    @property
+    def legacy(self):
+        return self.seq is None
+
+    def __len__(self):
+        return len(self.voltages)
+
+
+class ProtocolError(ValueError):
+    """Raised when a datagram is not a valid ECG packet"""
+
+
+def encode_packet(voltages, seq, t0, sample_rate, device_id=0, encoding=ENCODING_FLOAT32,
+                  gain=1, scale=None):
+    """
+    Pack a batch of samples into a single datagram: volts for float32,
+    int16 ADC codes at `scale` volts per code for ENCODING_DELTA
+    """
+    count = len(voltages)
+    if count > MAX_SAMPLES_PER_PACKET:
+        raise ProtocolError(f"Too many samples for one packet: {count} > {MAX_SAMPLES_PER_PACKET}")
+    header = HEADER.pack(MAGIC, VERSION, encoding, device_id,
+                         seq & 0xFFFFFFFF, sample_rate, t0, count)
+    if encoding == ENCODING_DELTA:
+        from ecg_codec import encode_deltas
+
+        first, deltas = encode_deltas(voltages)
+        return header + DELTA_HEADER.pack(gain, scale, first) + deltas
+    if encoding != ENCODING_FLOAT32:
+        raise ProtocolError(f"Unsupported payload encoding {encoding}")
+    return header + struct.pack(f'<{count}f', *voltages)
+
+
+def decode_packet(data):
+    """Decode a datagram into a Packet with a float32 numpy array of voltages"""
+    # Imported here so the constants and encoders load without numpy; the sender
+    # scripts still pull it in through ecg_pipeline
+    import numpy as np
+
+    if len(data) == LEGACY_SIZE:
+        voltages = np.frombuffer(data, dtype='<f4')
+        return Packet(None, None, 0.0, None, voltages)
+
+    if len(data) < HEADER.size:
+        raise ProtocolError(f"Short packet ({len(data)} bytes)")
+
+    magic, version, encoding, device_id, seq, sample_rate, t0, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad magic {magic!r}")
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    if encoding == ENCODING_DELTA:
+        return _decode_delta(data, device_id, seq, sample_rate, t0, count)
+    if encoding != ENCODING_FLOAT32:
+        raise ProtocolError(f"Unsupported payload encoding {encoding}")
+
+    expected = HEADER.size + count * 4
+    if len(data) != expected:
+        raise ProtocolError(f"Length mismatch: got {len(data)} bytes, expected {expected}")
+
+    # One vectorized unpack for the whole batch
+    voltages = np.frombuffer(data, dtype='<f4', count=count, offset=HEADER.size)
+    return Packet(device_id, seq, sample_rate, t0, voltages)
+
+
+def _decode_delta(data, device_id, seq, sample_rate, t0, count):
+    import numpy as np
+    from ecg_codec import decode_deltas, CodecError
+
+    if len(data) < HEADER.size + DELTA_HEADER.size:
+        raise ProtocolError(f"Short delta packet ({len(data)} bytes)")
+    gain, scale, first = DELTA_HEADER.unpack_from(data, HEADER.size)
+    try:
+        codes = decode_deltas(first, data[HEADER.size + DELTA_HEADER.size:], count)
+    except CodecError as e:
+        raise ProtocolError(str(e)) from None
+    voltages = codes.astype(np.float32) * np.float32(scale)
+    return Packet(device_id, seq, sample_rate, t0, voltages, ENCODING_DELTA, gain, scale)
+
+
+class PacketBatcher:
+    """
+    Collects samples on the sender side and hands back a datagram when
+    either batch_size samples are queued or flush_interval seconds have
+    passed since the first queued sample.
+
+    With encoding=ENCODING_DELTA samples are int16 ADC codes (AnalogIn.value,
+    or Pipeline(raw=True)) taken at `gain`, `scale` volts per code.
+    """
+
+    def __init__(self, sample_rate, batch_size=25, flush_interval=0.05, device_id=0,
+                 encoding=ENCODING_FLOAT32, gain=1, scale=None):
+        if encoding == ENCODING_DELTA and scale is None:
+            raise ValueError("Delta encoding needs the ADC scale (volts per code)")
+        self.sample_rate = float(sample_rate)
+        self.batch_size = max(1, min(int(batch_size), MAX_SAMPLES_PER_PACKET))
+        self.flush_interval = flush_interval
+        self.device_id = device_id
+        self.encoding = encoding
+        self.gain = gain
+        self.scale = scale
+        self.seq = 0
+        self._voltages = []
+        self._t0 = None
+        self._opened = None
+
+    def add(self, voltage, timestamp=None):
+        """Queue one sample. Returns packet bytes when a batch is ready, else None"""
+        now = time.monotonic()
+        if not self._voltages:
+            self._t0 = time.time() if timestamp is None else timestamp
+            self._opened = now
+        self._voltages.append(voltage)
+
+        if len(self._voltages) >= self.batch_size:
+            return self.flush()
+        if self.flush_interval is not None and now - self._opened >= self.flush_interval:
+            return self.flush()
+        return None
+
+    def pack(self, timestamps, voltages):
+        """Packets for a whole block of samples at once, batch_size samples per packet"""
+        packets = []
+        for pos in range(0, len(voltages), self.batch_size):
+            packets.append(encode_packet(voltages[pos:pos + self.batch_size], self.seq,
+                                         float(timestamps[pos]), self.sample_rate, self.device_id,
+                                         self.encoding, self.gain, self.scale))
+            self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return packets
+
+    def flush(self):
+        """Return whatever is queued as a packet, or None if nothing is queued"""
+        if not self._voltages:
+            return None
+        packet = encode_packet(self._voltages, self.seq, self._t0, self.sample_rate,
+                               self.device_id, self.encoding, self.gain, self.scale)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        self._voltages = []
+        self._t0 = None
+        return packet
+
+
+# --- Binary /data response format -------------------------------------------
+#
+#    magic        4s   b'ECGD'
+#    version      B    format version (1)
+#    columns      B    number of float32 columns after the time column
+#    reserved     H
+#    first_seq    Q    sequence number of the first sample in the body
+#    next_seq     Q    cursor to pass as ?since= on the next request
+#    count        I    number of samples
+#    t_base       d    time of the first sample (seconds), times are offsets from it
+#    body         count * float32 time offsets, then count * float32 per column
+
+DATA_MAGIC = b'ECGD'
+DATA_VERSION = 1
+DATA_HEADER = struct.Struct('<4sBBHQQId')
+DATA_CONTENT_TYPE = 'application/x-ecg-data'
+
+
+def encode_data_frame(first_seq, next_seq, times, *columns):
+    """Encode a /data snapshot as little-endian float32 columns with a small header"""
+    import numpy as np
+
+    count = len(times)
+    t_base = float(times[0]) if count else 0.0
+    header = DATA_HEADER.pack(DATA_MAGIC, DATA_VERSION, len(columns), 0,
+                              first_seq, next_seq, count, t_base)
+    parts = [header, (np.asarray(times, dtype=np.float64) - t_base).astype('<f4').tobytes()]
+    parts.extend(np.asarray(c).astype('<f4', copy=False).tobytes() for c in columns)
+    return b''.join(parts)
+
+
+def decode_data_frame(data):
+    """Inverse of encode_data_frame: returns (first_seq, next_seq, times, [columns])"""
+    import numpy as np
+
+    magic, version, ncols, _, first_seq, next_seq, count, t_base = DATA_HEADER.unpack_from(data)
+    if magic != DATA_MAGIC or version != DATA_VERSION:
+        raise ProtocolError("Not an ECG data frame")
+    body = np.frombuffer(data, dtype='<f4', offset=DATA_HEADER.size, count=count * (ncols + 1))
+    times = body[:count].astype(np.float64) + t_base
+    columns = [body[(i + 1) * count:(i + 2) * count] for i in range(ncols)]
+    return first_seq, next_seq, times, columns
+
+
+# --- TCP stream framing -------------------------------------------------------
+#
+#    length       I    bytes in the body that follows
+#    body              server -> client: an ECGD data frame (above)
+#                      client -> server: a UTF-8 JSON request, e.g. {"device": "1"}
+#
+# TCP is a byte stream: one recv() can return part of a frame or several
+# frames, so the receiver must reassemble them (FrameDecoder).
+
+FRAME_HEADER = struct.Struct('<I')
+MAX_FRAME = 1 << 24
+
+
+def encode_frame(body):
+    """Length-prefix a frame body for the TCP feed"""
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+class FrameDecoder:
+    """Reassembles length-prefixed frames from a byte stream, however it was split"""
+
+    def __init__(self, max_frame=MAX_FRAME):
+        self.max_frame = max_frame
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes; returns the list of frame bodies now complete"""
+        self._buffer += data
+        frames = []
+        pos = 0
+        while len(self._buffer) - pos >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(self._buffer, pos)
+            if length > self.max_frame:
+                raise ProtocolError(f"Frame of {length} bytes exceeds {self.max_frame}")
+            end = pos + FRAME_HEADER.size + length
+            if end > len(self._buffer):
+                break
+            frames.append(bytes(self._buffer[pos + FRAME_HEADER.size:end]))
+            pos = end
+        del self._buffer[:pos]
+        return frames
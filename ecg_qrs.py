@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+ECG QRS Detector
+Incremental Pan-Tompkins style R-peak detection over streaming batches
+
+Stages (all vectorized per batch, state carried between batches):
+    5-15 Hz bandpass -> derivative -> squaring -> 150 ms moving window integration
+
+Peaks of the integrated signal are classified as QRS or noise against
+adaptive thresholds (SPKI / NPKI), with a 200 ms refractory period and a
+search-back for missed beats when the RR interval gets too long.
+Only candidate peaks are looked at in Python, so the per-sample cost
+stays in NumPy and each beat costs O(1).
+"""
+
+from collections import deque
+
+import numpy as np
+from scipy import signal
+
+QRS_BAND = (5.0, 15.0)
+INTEGRATION_WINDOW = 0.150  # seconds
+REFRACTORY = 0.200          # seconds, no two beats closer than this
+LEARNING_PERIOD = 2.0       # seconds used to seed the thresholds
+SEARCHBACK_FACTOR = 1.66    # search back when RR exceeds this many average RRs
+RR_HISTORY = 8              # beats averaged for the smoothed BPM
+HISTORY_SECONDS = 0.5       # raw signal kept to locate the R peak
+
+
+class Beat:
+    """One detected heartbeat"""
+
+    __slots__ = ('time', 'rr', 'bpm', 'amplitude')
+
+    def __init__(self, time, rr, bpm, amplitude):
+        self.time = time
+        self.rr = rr
+        self.bpm = bpm
+        self.amplitude = amplitude
+
+    def to_dict(self):
+        return {'time': self.time, 'rr': self.rr, 'bpm': self.bpm, 'amplitude': self.amplitude}
+
+
+class QRSDetector:
+    """
+    Streaming R-peak detector for one channel.
+
+    process() takes each batch of (times, voltages) as it arrives and
+    returns the beats confirmed in it. Detection lags the R peak by about
+    half the integration window plus one sample.
+    """
+
+    def __init__(self):
+        self.sample_rate = None
+        self.heart_rate = None
+        self.last_beat = None
+        self._rr = deque(maxlen=RR_HISTORY)
+
+    def _setup(self, sample_rate):
+        fs = self.sample_rate = sample_rate
+        high = min(QRS_BAND[1], fs / 2 * 0.9)
+        self._sos = signal.butter(2, [QRS_BAND[0], high], btype='band', output='sos', fs=fs)
+        self._sos_zi = None
+        # Five-point derivative from the original paper
+        self._deriv = np.array([1, 2, 0, -2, -1]) * fs / 8.0
+        self._deriv_zi = np.zeros(len(self._deriv) - 1)
+        width = max(1, int(round(INTEGRATION_WINDOW * fs)))
+        self._mwi = np.ones(width) / width
+        self._mwi_zi = np.zeros(width - 1)
+        self._delay = (width - 1) / 2.0 / fs + 2.0 / fs
+
+        self._refractory = REFRACTORY
+        self._history_len = int(HISTORY_SECONDS * fs)
+        self._hist_t = np.zeros(0)
+        self._hist_x = np.zeros(0)
+
+        # Local maximum search needs one sample of look-back and look-ahead
+        self._prev = None           # (time, value) of the sample before the pending one
+        self._pending = None        # last sample of the previous batch, not yet classified
+
+        self._learning_until = None
+        self._learn_max = 0.0
+        self._learn_sum = 0.0
+        self._learn_n = 0
+        self._spki = None
+        self._npki = None
+        self._noise_peaks = deque(maxlen=32)   # candidates since the last beat, for search-back
+        self.last_beat = None
+        self.heart_rate = None
+        self._rr.clear()
+
+    def process(self, times, voltages, sample_rate):
+        """Feed one batch, returns a list of Beat objects detected in it"""
+        if len(voltages) == 0:
+            return []
+        if sample_rate != self.sample_rate:
+            self._setup(sample_rate)
+
+        x = np.asarray(voltages, dtype=np.float64)
+        if self._sos_zi is None:
+            self._sos_zi = signal.sosfilt_zi(self._sos) * x[0]
+        bp, self._sos_zi = signal.sosfilt(self._sos, x, zi=self._sos_zi)
+        d, self._deriv_zi = signal.lfilter(self._deriv, 1.0, bp, zi=self._deriv_zi)
+        mwi, self._mwi_zi = signal.lfilter(self._mwi, 1.0, d * d, zi=self._mwi_zi)
+
+        times = np.asarray(times, dtype=np.float64)
+        # Held for the whole batch, plus HISTORY_SECONDS before it for peaks near
+        # its start; trimmed back to HISTORY_SECONDS once the batch is done
+        self._hist_t = np.concatenate((self._hist_t, times))
+        self._hist_x = np.concatenate((self._hist_x, x))
+
+        if self._learning_until is None:
+            self._learning_until = times[0] + LEARNING_PERIOD
+        beats = []
+        if self._spki is None:
+            # Only what comes after the learning period is classified
+            learned = self._learn(times, mwi)
+            times, mwi = times[learned:], mwi[learned:]
+        if self._spki is not None and len(mwi):
+            beats = [beat for beat in self._candidates(times, mwi) if beat is not None]
+
+        self._hist_t = self._hist_t[-self._history_len:]
+        self._hist_x = self._hist_x[-self._history_len:]
+        return beats
+
+    def _learn(self, times, mwi):
+        """
+        Seed SPKI / NPKI from the first LEARNING_PERIOD seconds, however
+        they are batched; returns how many samples of the batch it took
+        """
+        end = int(np.searchsorted(times, self._learning_until))
+        if end:
+            self._learn_max = max(self._learn_max, float(mwi[:end].max()))
+            self._learn_sum += float(mwi[:end].sum())
+            self._learn_n += end
+        if end < len(times):
+            self._spki = 0.25 * self._learn_max
+            self._npki = 0.5 * self._learn_sum / self._learn_n
+            self._prev = self._pending = None
+        return end
+
+    def _candidates(self, times, mwi):
+        """Classify every local maximum of the integrated signal in this batch"""
+        t = times
+        v = mwi
+        carried = [s for s in (self._prev, self._pending) if s is not None]
+        if carried:
+            t = np.concatenate(([s[0] for s in carried], t))
+            v = np.concatenate(([s[1] for s in carried], v))
+        # Carried over even when there are too few samples to hold a peak yet:
+        # legacy senders deliver one sample per packet
+        self._prev = (t[-2], v[-2]) if len(v) >= 2 else None
+        self._pending = (t[-1], v[-1])
+        if len(v) < 3:
+            return []
+        peaks = np.flatnonzero((v[1:-1] > v[:-2]) & (v[1:-1] >= v[2:])) + 1
+        return [self._classify(t[i], v[i]) for i in peaks]
+
+    def _threshold(self):
+        return self._npki + 0.25 * (self._spki - self._npki)
+
+    def _classify(self, t, peak):
+        """Adaptive threshold decision for one integrated-signal peak"""
+        threshold = self._threshold()
+        since_last = None if self.last_beat is None else t - self.last_beat
+
+        if since_last is not None and since_last < self._refractory:
+            return None
+
+        if peak > threshold:
+            self._spki = 0.125 * peak + 0.875 * self._spki
+            return self._beat(t, peak)
+
+        self._npki = 0.125 * peak + 0.875 * self._npki
+        self._noise_peaks.append((t, peak))
+
+        # Search back: too long without a beat, take the best missed candidate
+        if self._rr and since_last is not None and \
+                since_last > SEARCHBACK_FACTOR * (sum(self._rr) / len(self._rr)):
+            best = max(self._noise_peaks, key=lambda p: p[1])
+            if best[1] > 0.5 * threshold:
+                self._spki = 0.25 * best[1] + 0.75 * self._spki
+                return self._beat(best[0], best[1])
+        return None
+
+    def _beat(self, t, peak):
+        """Record a confirmed beat, locate the R peak and update the heart rate"""
+        # The integrated peak lags the R wave; take the largest excursion from
+        # the local baseline in the integration window that ends at the MWI peak
+        # (HISTORY_SECONDS up to it), so the cost per beat doesn't grow with the batch
+        r_time = t - self._delay
+        hist_t = self._hist_t
+        lo = np.searchsorted(hist_t, t - INTEGRATION_WINDOW - self._delay)
+        hi = np.searchsorted(hist_t, t, side='right')
+        if hi > lo:
+            base = np.searchsorted(hist_t, t - HISTORY_SECONDS)
+            baseline = np.median(self._hist_x[base:hi])
+            excursion = np.abs(self._hist_x[lo:hi] - baseline)
+            r_time = float(hist_t[lo + np.argmax(excursion)])
+
+        rr = None
+        if self.last_beat is not None:
+            rr = r_time - self.last_beat
+            if rr < self._refractory:
+                return None
+            self._rr.append(rr)
+            self.heart_rate = 60.0 / (sum(self._rr) / len(self._rr))
+        self.last_beat = r_time
+        self._noise_peaks.clear()
+        return Beat(r_time, rr, self.heart_rate, float(peak))
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+ECG Binary Recording Format
+Compact, append-friendly alternative to the ecg_data.txt text format
+
+File layout (little-endian):
+    header  64 bytes
+        magic        4s   b'ECGR'
+        version      B    format version (1)
+        dtype        B    0 = float32 volts, 1 = int16 ADC codes,
+                          2 = delta/varint packed int16 ADC codes
+        channel      B    ADC input channel
+        reserved     B
+        chunk_size   I    samples per chunk
+        sample_rate  d    nominal sample rate (Hz)
+        gain         f    ADS1115 gain setting
+        scale        d    volts per code (int16/delta files), 1.0 for float32
+        start_time   d    unix time of the first sample
+        count        Q    total samples written (0 if the writer never closed)
+        padding      to 64 bytes
+    chunks, each:
+        t0           d    seconds since start_time of the chunk's first sample
+        samples      chunk_size * float32 or int16
+
+Chunks are fixed size so any time range can be located and memory mapped
+without reading the rest of the file. The last chunk is zero padded;
+`count` says how many samples are real.
+
+Delta files (dtype 2) store each chunk's codes as the first code plus
+zigzag/varint differences (ecg_codec.py), typically 1-2 bytes per sample
+instead of 2 or 4, so chunks vary in size:
+    chunks, each:
+        t0           d    seconds since start_time of the chunk's first sample
+        count        I    samples in this chunk (chunk_size except the last)
+        nbytes       I    length of the packed differences
+        first        h    first code
+        deltas       nbytes
+The reader indexes a delta file by hopping from chunk header to chunk
+header and only decodes the chunks a read touches.
+
+Usage as a converter:
+    python3 ecg_recording.py to-binary ecg_data.txt ecg_data.ecg [--int16 | --delta]
+    python3 ecg_recording.py to-text ecg_data.ecg ecg_data.txt
+"""
+
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from ecg_codec import encode_deltas, decode_deltas, to_codes
+from ecg_loader import load, read_header, header_sample_rate
+
+MAGIC = b'ECGR'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBIdfddQ')
+HEADER_SIZE = 64
+
+DTYPE_FLOAT32 = 0
+DTYPE_INT16 = 1
+DTYPE_DELTA = 2
+DTYPES = {DTYPE_FLOAT32: np.dtype('<f4'), DTYPE_INT16: np.dtype('<i2'),
+          DTYPE_DELTA: np.dtype('<i2')}
+DTYPE_NAMES = {'float32': DTYPE_FLOAT32, 'int16': DTYPE_INT16, 'delta': DTYPE_DELTA}
+CODE_DTYPES = (DTYPE_INT16, DTYPE_DELTA)    # files that store ADC codes
+
+DELTA_CHUNK = struct.Struct('<dIIh')
+
+DEFAULT_CHUNK_SIZE = 1024
+
+# ADS1115 full-scale range (volts) per gain setting
+ADS1115_FULL_SCALE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+
+
+def ads1115_scale(gain):
+    """Volts per ADC code for an ADS1115 gain setting"""
+    return ADS1115_FULL_SCALE[gain] / 32768.0
+
+
+def chunk_dtype(sample_dtype, chunk_size):
+    return np.dtype([('t0', '<f8'), ('samples', sample_dtype, (chunk_size,))])
+
+
+class RecordingWriter:
+    """
+    Buffers samples in memory and writes them a whole chunk at a time.
+
+    For int16 and delta files pass raw ADC codes (e.g. AnalogIn.value) or
+    volts with volts=True and they are converted using `scale`.
+    """
+
+    def __init__(self, path, sample_rate, gain=1, channel=0, dtype=DTYPE_FLOAT32,
+                 scale=None, chunk_size=DEFAULT_CHUNK_SIZE, start_time=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown sample dtype {dtype}")
+        if scale is None:
+            scale = ads1115_scale(gain) if dtype in CODE_DTYPES else 1.0
+        self.path = path
+        self.sample_rate = float(sample_rate)
+        self.gain = gain
+        self.channel = channel
+        self.dtype = dtype
+        self.scale = scale
+        self.chunk_size = chunk_size
+        self.start_time = time.time() if start_time is None else start_time
+        self.count = 0
+
+        self._chunk = np.zeros(1, dtype=chunk_dtype(DTYPES[dtype], chunk_size))
+        self._fill = 0
+        self._file = open(path, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        header = HEADER.pack(MAGIC, VERSION, self.dtype, self.channel, 0, self.chunk_size,
+                             self.sample_rate, self.gain, self.scale, self.start_time, self.count)
+        self._file.seek(0)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+    def write(self, elapsed, value, volts=False):
+        """Append one sample taken `elapsed` seconds after start_time"""
+        if self._fill == 0:
+            self._chunk['t0'][0] = elapsed
+        if volts and self.dtype in CODE_DTYPES:
+            # Out-of-range volts saturate like the ADC instead of wrapping
+            value = to_codes(value, self.scale)
+        self._chunk['samples'][0, self._fill] = value
+        self._fill += 1
+        self.count += 1
+        if self._fill == self.chunk_size:
+            self._flush_chunk()
+
+    def write_block(self, t0, values, volts=False):
+        """Append a block of evenly spaced samples, the first taken at t0"""
+        times = t0 + np.arange(len(values)) / self.sample_rate
+        self.write_samples(times, values, volts)
+
+    def write_samples(self, times, values, volts=False):
+        """Append a block of samples with their acquisition times, a chunk at a time"""
+        values = np.asarray(values)
+        if volts and self.dtype in CODE_DTYPES:
+            values = to_codes(values, self.scale)
+        pos = 0
+        while pos < len(values):
+            if self._fill == 0:
+                self._chunk['t0'][0] = times[pos]
+            take = min(self.chunk_size - self._fill, len(values) - pos)
+            self._chunk['samples'][0, self._fill:self._fill + take] = values[pos:pos + take]
+            self._fill += take
+            pos += take
+            if self._fill == self.chunk_size:
+                self._flush_chunk()
+        self.count += len(values)
+
+    def _flush_chunk(self):
+        # Flushed right away so memory-mapped readers see every full chunk
+        if self.dtype == DTYPE_DELTA:
+            first, deltas = encode_deltas(self._chunk['samples'][0, :self._fill])
+            self._file.write(DELTA_CHUNK.pack(float(self._chunk['t0'][0]), self._fill,
+                                              len(deltas), first))
+            self._file.write(deltas)
+        else:
+            self._file.write(self._chunk.tobytes())
+        self._file.flush()
+        self._chunk['samples'][0] = 0
+        self._fill = 0
+
+    def close(self):
+        """Write the final (padded) chunk and the total sample count"""
+        if self._file.closed:
+            return
+        if self._fill:
+            self._flush_chunk()
+        self._write_header()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordingReader:
+    """Memory-mapped access to a binary recording (chunk-indexed reads for delta files)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"{path} is not an ECG binary recording")
+        (magic, version, self.dtype, self.channel, _, self.chunk_size, self.sample_rate,
+         self.gain, self.scale, self.start_time, count) = HEADER.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an ECG binary recording")
+        if version != VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+
+        if self.dtype == DTYPE_DELTA:
+            self._chunks = None
+            self._t0, self._offsets, counts = self._index_chunks()
+            available = int(counts.sum())
+        else:
+            dtype = chunk_dtype(DTYPES[self.dtype], self.chunk_size)
+            chunks = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+            self._chunks = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE,
+                                     shape=(chunks,))
+            self._t0 = self._chunks['t0']
+            available = chunks * self.chunk_size
+        if count == 0:
+            # Writer never closed (crash, power loss): keep the complete chunks
+            count = available
+        self.count = min(count, available)
+
+    def _index_chunks(self):
+        """Start time, file offset and sample count of every complete delta chunk"""
+        t0s, offsets, counts = [], [], []
+        size = os.path.getsize(self.path)
+        pos = HEADER_SIZE
+        with open(self.path, 'rb') as f:
+            while pos + DELTA_CHUNK.size <= size:
+                f.seek(pos)
+                t0, count, nbytes, _ = DELTA_CHUNK.unpack(f.read(DELTA_CHUNK.size))
+                end = pos + DELTA_CHUNK.size + nbytes
+                if end > size:
+                    break
+                t0s.append(t0)
+                offsets.append(pos)
+                counts.append(count)
+                pos = end
+        return np.array(t0s), np.array(offsets, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+    def _decode_chunks(self, first, last):
+        """Codes of delta chunks first..last, concatenated"""
+        parts = []
+        with open(self.path, 'rb') as f:
+            for offset in self._offsets[first:last + 1]:
+                f.seek(offset)
+                _, count, nbytes, code = DELTA_CHUNK.unpack(f.read(DELTA_CHUNK.size))
+                parts.append(decode_deltas(code, f.read(nbytes), count))
+        return np.concatenate(parts)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def duration(self):
+        if self.count == 0:
+            return 0.0
+        last = (self.count - 1) // self.chunk_size
+        return float(self._t0[last]) + ((self.count - 1) % self.chunk_size) / self.sample_rate
+
+    def _to_volts(self, samples):
+        if self.dtype in CODE_DTYPES:
+            return samples.astype(np.float32) * np.float32(self.scale)
+        return np.asarray(samples, dtype=np.float32)
+
+    def read_samples(self, start=0, stop=None):
+        """Samples [start, stop) as (times, volts); only the chunks touched are paged in"""
+        stop = self.count if stop is None else min(stop, self.count)
+        start = max(0, start)
+        if stop <= start:
+            return np.zeros(0), np.zeros(0, dtype=np.float32)
+        first, last = start // self.chunk_size, (stop - 1) // self.chunk_size
+        if self._chunks is not None:
+            block = self._chunks[first:last + 1]
+            samples = block['samples'].reshape(-1)
+        else:
+            samples = self._decode_chunks(first, last)
+        offsets = np.arange(self.chunk_size) / self.sample_rate
+        times = (self._t0[first:last + 1, None] + offsets).ravel()
+        lo = start - first * self.chunk_size
+        hi = stop - first * self.chunk_size
+        return times[lo:hi], self._to_volts(samples[lo:hi])
+
+    def read_time_range(self, start_s, end_s):
+        """Samples with start_s <= time < end_s (seconds since start_time)"""
+        t0 = self._t0
+        nchunks = -(-self.count // self.chunk_size)
+        first = max(0, int(np.searchsorted(t0[:nchunks], start_s, side='right')) - 1)
+        last = int(np.searchsorted(t0[:nchunks], end_s, side='left'))
+        times, volts = self.read_samples(first * self.chunk_size, last * self.chunk_size)
+        keep = (times >= start_s) & (times < end_s)
+        return times[keep], volts[keep]
+
+    def read_all(self):
+        return self.read_samples(0, self.count)
+
+
+def text_to_binary(src, dest, dtype=DTYPE_FLOAT32, gain=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Convert an ecg_data.txt recording to the binary format"""
+    _, times, volts = load(src, use_cache=False)
+    if len(times) > 1:
+        sample_rate = (len(times) - 1) / (times[-1] - times[0])
+    else:
+        sample_rate = header_sample_rate(read_header(src)) or 100.0
+
+    with RecordingWriter(dest, sample_rate, gain=gain, dtype=dtype, chunk_size=chunk_size,
+                         start_time=os.path.getmtime(src) - (times[-1] if len(times) else 0)) as writer:
+        for pos in range(0, len(volts), chunk_size):
+            writer.write_block(times[pos], volts[pos:pos + chunk_size], volts=True)
+    return len(volts)
+
+
+def binary_to_text(src, dest):
+    """Convert a binary recording back to the ecg_data.txt text format"""
+    reader = RecordingReader(src)
+    times, volts = reader.read_all()
+    with open(dest, 'w') as f:
+        f.write("# ECG Data Recording\n")
+        f.write("# Format: sample_number,time(s),voltage(V)\n")
+        f.write(f"# Sample rate: ~{reader.sample_rate:.0f} Hz\n")
+        f.write(f"# Duration: {reader.duration:.3f} seconds\n")
+        data = np.column_stack((np.arange(len(times)), times, volts))
+        np.savetxt(f, data, fmt=('%d', '%.6f', '%.6f'), delimiter=',')
+    return len(times)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ('to-binary', 'to-text'):
+        print(__doc__[__doc__.index('Usage'):])
+        sys.exit(1)
+    command, src, dest = sys.argv[1:4]
+    if command == 'to-binary':
+        dtype = DTYPE_FLOAT32
+        if '--int16' in sys.argv[4:]:
+            dtype = DTYPE_INT16
+        elif '--delta' in sys.argv[4:]:
+            dtype = DTYPE_DELTA
+        count = text_to_binary(src, dest, dtype=dtype)
+    else:
+        count = binary_to_text(src, dest)
+    print(f"Converted {count} samples: {src} -> {dest}")
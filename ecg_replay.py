@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+ECG Recording Replay
+Sends recorded sessions back to realtime_server.py over UDP, at their
+original timing or N times faster
+
+Text (ecg_data.txt) and binary (.ecg) recordings are read in blocks
+(ecg_loader.iter_blocks, RecordingReader.read_samples), never loaded
+whole, and cut into ECG packets of BATCH_SIZE samples. A packet never
+spans a dropout in the recording: the next one starts at the sample
+after the hole, so the server's jitter buffer sees the same gap the
+recording has. Packet timestamps and the sample rate in the header are
+the recording's own, so the server's filters, QRS detector and spectrum
+see the signal as recorded whatever the speed; only the link jitter it
+reports grows with the speed, since the sender clock then runs fast.
+
+Each packet is due when its last sample was recorded, divided by SPEED,
+counted from the start of the replay. The deadlines are absolute, so
+sleep overshoot never accumulates, and packets due within BURST seconds
+of each other go out together rather than sleeping between them, which
+keeps 100x and faster accurate at thousands of packets per second.
+SPEED = 0 sends as fast as the socket takes them.
+
+Several files are replayed at once as devices DEVICE_ID, DEVICE_ID + 1,
+...; their packets are merged by deadline into one send loop. LOOPS
+plays each file that many times back to back (0 for ever), continuing
+its timestamps and sequence numbers, so the server sees one long
+session: hours of data in minutes for soak tests.
+
+Usage:
+    python3 ecg_replay.py session1.ecg [session2.txt ...]
+    python3 ecg.py replay sessions/*.ecg --speed 60 --loops 0 --target-ip 192.168.0.10
+"""
+
+import heapq
+import socket
+import sys
+import time
+
+import numpy as np
+
+from ecg_codec import to_codes
+from ecg_loader import iter_blocks, read_header, header_sample_rate
+from ecg_protocol import PacketBatcher, ENCODINGS, ENCODING_DELTA, MAX_SAMPLES_PER_PACKET
+from ecg_recording import RecordingReader, ads1115_scale, CODE_DTYPES
+
+# UDP configuration
+UDP_PORT = 5006
+TARGET_IP = "127.0.0.1"  # localhost
+
+# Replay
+SPEED = 1.0             # 1 = original timing, 10 = ten times faster, 0 = as fast as possible
+LOOPS = 1               # plays of each file, 0 loops until Ctrl+C
+BATCH_SIZE = 25         # samples per UDP packet
+DEVICE_ID = 0           # file k is sent as device DEVICE_ID + k
+ENCODING = "float32"    # "delta": ADC codes, delta/varint packed like a Pi sending raw codes
+GAIN = 1                # ADS1115 gain text recordings are quantized at (delta only)
+
+BURST = 0.001           # packets due within this many seconds are sent without sleeping
+REPORT_SECONDS = 5.0    # progress line interval, None for none
+GAP_TOLERANCE = 1.5     # sample periods between timestamps before it is a dropout
+BLOCK_BYTES = 1 << 16   # text recordings are parsed this much at a time (~2500 samples)
+BLOCK_SAMPLES = 4096    # binary recordings are read this many samples at a time
+
+
+class RecordingSource:
+    """
+    One recording as a lazy stream of (offset, datagram) pairs, offset
+    being the recorded time of the packet's last sample in seconds since
+    the first sample, growing on across loops. Timestamps in the packets
+    are start_time + the recorded time of their first sample.
+    """
+
+    def __init__(self, path, start_time, device_id=DEVICE_ID, batch_size=BATCH_SIZE,
+                 loops=LOOPS, encoding=ENCODING, gain=GAIN):
+        self.path = path
+        self.start_time = start_time
+        self.device_id = device_id
+        self.batch_size = min(batch_size, MAX_SAMPLES_PER_PACKET)
+        self.loops = loops
+        self.encoding = ENCODINGS[encoding]
+        self.gain = gain
+        self.scale = ads1115_scale(gain)
+        self.sample_rate = None
+        self.binary = path.endswith('.ecg')
+        self.batcher = None
+        self.plays = 0              # completed passes through the file
+        self.samples = 0
+        self.packets = 0
+        self.gaps = 0
+
+    def _blocks(self):
+        """(times, volts) blocks of one pass; also sets sample_rate from the first one"""
+        if self.binary:
+            reader = RecordingReader(self.path)
+            self.sample_rate = reader.sample_rate
+            if reader.dtype in CODE_DTYPES:
+                # Codes go out at the gain and scale they were recorded at
+                self.gain, self.scale = reader.gain, reader.scale
+            for start in range(0, len(reader), BLOCK_SAMPLES):
+                yield reader.read_samples(start, start + BLOCK_SAMPLES)
+            return
+
+        for _, times, volts in iter_blocks(self.path, BLOCK_BYTES):
+            if self.sample_rate is None:
+                # Recorded timestamps are measured, the header rate is only nominal
+                steps = np.diff(times)
+                steps = steps[steps > 0]
+                self.sample_rate = (1.0 / float(np.median(steps)) if len(steps)
+                                    else header_sample_rate(read_header(self.path)) or 100.0)
+            yield times, volts
+
+    def __iter__(self):
+        origin = None       # recorded time of the first sample
+        base = 0.0          # offset of the current pass
+        # Samples short of a full packet wait for the next block (or pass)
+        tail = np.zeros(0), np.zeros(0)
+        while self.loops == 0 or self.plays < self.loops:
+            last = None
+            for times, volts in self._blocks():
+                if len(times) == 0:
+                    continue
+                if origin is None:
+                    origin = float(times[0])
+                    self.batcher = PacketBatcher(self.sample_rate, batch_size=self.batch_size,
+                                                 device_id=self.device_id, encoding=self.encoding,
+                                                 gain=self.gain, scale=self.scale)
+                if self.encoding == ENCODING_DELTA:
+                    volts = to_codes(volts, self.scale)
+                offsets = np.asarray(times, dtype=np.float64) - origin + base
+                last = float(offsets[-1])
+                tail = yield from self._packets(np.concatenate((tail[0], offsets)),
+                                                np.concatenate((tail[1], volts)))
+            if last is None:
+                break       # an empty recording
+            self.plays += 1
+            base = last + 1.0 / self.sample_rate
+        if len(tail[0]):
+            yield from self._packets(*tail, final=True)
+
+    def _packets(self, offsets, volts, final=False):
+        """
+        Packets of a block, cut at every dropout; returns the (offsets,
+        volts) left over after the last full packet unless final
+        """
+        tolerance = GAP_TOLERANCE / self.sample_rate
+        cuts = np.flatnonzero(np.diff(offsets) > tolerance) + 1
+        self.gaps += len(cuts)
+        bounds = [0, *cuts.tolist(), len(offsets)]
+        stamps = self.start_time + offsets
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if not final and b == len(offsets):
+                # The last run may go on in the next block
+                b -= (b - a) % self.batch_size
+            # One packet per pull, so encoding is spread between the sends
+            for pos in range(a, b, self.batch_size):
+                end = min(pos + self.batch_size, b)
+                packet, = self.batcher.pack(stamps[pos:end], volts[pos:end])
+                self.packets += 1
+                self.samples += end - pos
+                yield float(offsets[end - 1]), packet
+        return offsets[b:], volts[b:]
+
+    def stats(self):
+        return {'file': self.path, 'device_id': self.device_id, 'sample_rate': self.sample_rate,
+                'plays': self.plays, 'samples': self.samples, 'packets': self.packets,
+                'gaps': self.gaps}
+
+
+def replay(paths, address, speed=SPEED, loops=LOOPS, batch_size=BATCH_SIZE, device_id=DEVICE_ID,
+           encoding=ENCODING, gain=GAIN, sock=None, stop=None, report_seconds=REPORT_SECONDS):
+    """
+    Send the recordings until every one has played `loops` times, stop()
+    returns True, or KeyboardInterrupt. Returns a stats dict with one
+    entry per file under 'files'.
+    """
+    own_socket = sock is None
+    if own_socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_time = time.time()
+    sources = [RecordingSource(path, start_time, device_id + k, batch_size, loops, encoding, gain)
+               for k, path in enumerate(paths)]
+
+    stats = {'packets': 0, 'bytes': 0, 'signal_seconds': 0.0, 'max_late_ms': 0.0}
+    start = report_at = None
+    offset = 0.0
+    try:
+        for offset, message in heapq.merge(*sources, key=lambda item: item[0]):
+            now = time.perf_counter()
+            if start is None:
+                # The clock starts once the files are open and the first blocks read
+                start = now
+                report_at = start + report_seconds if report_seconds else None
+            if speed:
+                deadline = start + offset / speed
+                if deadline - now > BURST:
+                    time.sleep(deadline - now)
+                    now = time.perf_counter()
+                stats['max_late_ms'] = max(stats['max_late_ms'], (now - deadline) * 1000)
+            sock.sendto(message, address)
+            stats['packets'] += 1
+            stats['bytes'] += len(message)
+
+            if report_at is not None and now >= report_at:
+                report_at = now + report_seconds
+                elapsed = now - start
+                print(f"{offset:.0f}s of signal in {elapsed:.1f}s ({offset / elapsed:.1f}x), "
+                      f"{stats['packets'] / elapsed:.0f} packets/s")
+                if stop is not None and stop():
+                    break
+            elif stop is not None and stats['packets'] % 256 == 0 and stop():
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if own_socket:
+            sock.close()
+
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    stats['signal_seconds'] = offset
+    stats['elapsed'] = elapsed
+    stats['speed'] = offset / elapsed if elapsed > 0 else 0.0
+    stats['max_late_ms'] = round(stats['max_late_ms'], 3)
+    stats['files'] = [source.stats() for source in sources]
+    return stats
+
+
+def main(files, target_ip=TARGET_IP, udp_port=UDP_PORT, speed=SPEED, loops=LOOPS,
+         batch_size=BATCH_SIZE, device_id=DEVICE_ID, encoding=ENCODING, gain=GAIN,
+         report_seconds=REPORT_SECONDS):
+    """`ecg replay`: replay() the files and print a summary"""
+    pace = f"at {speed:g}x" if speed else "as fast as possible"
+    print(f"Replaying {len(files)} recording(s) to {target_ip}:{udp_port} {pace}, "
+          f"{'looping' if loops == 0 else f'{loops} play(s) each'}")
+    print("Press Ctrl+C to stop")
+
+    stats = replay(files, (target_ip, udp_port), speed, loops, batch_size, device_id, encoding,
+                   gain, report_seconds=report_seconds)
+
+    for entry in stats['files']:
+        print(f"  device {entry['device_id']}: {entry['file']}, {entry['plays']} play(s), "
+              f"{entry['samples']} samples in {entry['packets']} packets, "
+              f"{entry['gaps']} dropouts kept")
+    print(f"Sent {stats['signal_seconds']:.1f}s of signal in {stats['packets']} packets "
+          f"({stats['bytes']} bytes) over {stats['elapsed']:.2f}s ({stats['speed']:.1f}x), "
+          f"max late {stats['max_late_ms']} ms")
+    return stats
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__[__doc__.index('Usage'):])
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+ECG Streaming Spectrum
+Rolling Welch power spectrum and spectrogram of the live signal, one segment at a time
+
+Samples are collected into Hann-windowed segments of about
+`segment_seconds` (rounded to a power of two) that overlap by `overlap`.
+Each completed segment is transformed once, as soon as it is complete:
+
+    - its one-sided PSD goes into a ring of the last `average_seconds` of
+      segments; a running sum of the ring gives the Welch average, so
+      adding a segment costs one rfft and one add/subtract, not a
+      recomputation over the window
+    - its PSD in dB goes into a ring of the last `history_seconds` of
+      segments, the spectrogram
+
+At 500 Hz with the defaults (1024-sample segments, 50% overlap) that is
+one 1024-point rfft every 1.02 s, whatever the batch size, and a fixed
+amount of memory. The PSD is scaled like scipy.signal.welch (V^2/Hz,
+mean removed per segment), so it matches plot_ecg.py's offline analysis.
+
+The raw (unfiltered) signal is used, since mains interference and
+high-frequency electrode noise are what the bandpass hides.
+"""
+
+import math
+import threading
+
+import numpy as np
+from scipy import signal
+
+DEFAULT_SEGMENT = 2.0       # seconds per FFT segment (rounded to a power of two in samples)
+DEFAULT_OVERLAP = 0.5
+DEFAULT_AVERAGE = 30.0      # seconds of segments in the Welch average
+DEFAULT_HISTORY = 60.0      # seconds of spectrogram kept
+
+ECG_BAND = (0.5, 40.0)
+MAINS = (50.0, 60.0)
+MAINS_WIDTH = 1.0           # Hz either side of a mains line counted as the line
+DB_FLOOR = 1e-20            # V^2/Hz, keeps log10 finite for an all-zero segment
+
+
+def band_power(freqs, psd, low, high):
+    """Power (V^2) between low and high Hz, integrated over the PSD"""
+    mask = (freqs >= low) & (freqs < high)
+    if len(freqs) < 2:
+        return 0.0
+    return float(psd[mask].sum() * (freqs[1] - freqs[0]))
+
+
+class StreamingSpectrum:
+    """
+    One channel's rolling PSD and spectrogram.
+
+    update(times, samples, sample_rate) is called with every batch;
+    psd() and spectrogram() return copies and may be called from other
+    threads. The segment length is fixed for the first sample rate seen
+    and everything restarts if the rate changes.
+    """
+
+    def __init__(self, segment_seconds=DEFAULT_SEGMENT, overlap=DEFAULT_OVERLAP,
+                 average_seconds=DEFAULT_AVERAGE, history_seconds=DEFAULT_HISTORY):
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        self.segment_seconds = segment_seconds
+        self.overlap = overlap
+        self.average_seconds = average_seconds
+        self.history_seconds = history_seconds
+        self.sample_rate = None
+        self.segments = 0           # segments transformed since the last reset
+        self._lock = threading.Lock()
+
+    def _design(self, sample_rate):
+        self.sample_rate = sample_rate
+        n = 2 ** max(4, int(round(math.log2(self.segment_seconds * sample_rate))))
+        self.nperseg = n
+        self.hop = max(1, int(n * (1 - self.overlap)))
+        window = signal.get_window('hann', n)
+        self._window = window
+        self._scale = 1.0 / (sample_rate * (window ** 2).sum())
+        self.freqs = np.fft.rfftfreq(n, 1.0 / sample_rate)
+        hop_seconds = self.hop / sample_rate
+        average = max(1, int(round((self.average_seconds - n / sample_rate) / hop_seconds)) + 1)
+        history = max(1, int(math.ceil(self.history_seconds / hop_seconds)))
+
+        bins = len(self.freqs)
+        # Incoming samples; a segment is transformed whenever n are waiting
+        self._samples = np.zeros(2 * n)
+        self._times = np.zeros(2 * n)
+        self._fill = 0
+        self._average = np.zeros((average, bins))
+        self._sum = np.zeros(bins)
+        self._history = np.zeros((history, bins), dtype=np.float32)
+        self._history_times = np.zeros(history)
+        self.segments = 0
+
+    def update(self, times, samples, sample_rate):
+        """Add a batch; transforms every segment it completes"""
+        if len(samples) == 0 or sample_rate <= 0:
+            return
+        if sample_rate != self.sample_rate:
+            with self._lock:
+                self._design(sample_rate)
+        times = np.asarray(times, dtype=np.float64)
+        samples = np.asarray(samples, dtype=np.float64)
+        n = self.nperseg
+        while len(samples):
+            take = min(len(samples), len(self._samples) - self._fill)
+            self._samples[self._fill:self._fill + take] = samples[:take]
+            self._times[self._fill:self._fill + take] = times[:take]
+            self._fill += take
+            samples, times = samples[take:], times[take:]
+            while self._fill >= n:
+                self._add_segment(self._samples[:n], self._times[n // 2])
+                # Keep the overlap for the next segment
+                rest = self._fill - self.hop
+                self._samples[:rest] = self._samples[self.hop:self._fill]
+                self._times[:rest] = self._times[self.hop:self._fill]
+                self._fill = rest
+
+    def _add_segment(self, segment, center_time):
+        spectrum = np.fft.rfft((segment - segment.mean()) * self._window)
+        psd = (spectrum.real ** 2 + spectrum.imag ** 2) * self._scale
+        # One-sided: fold the negative frequencies in, except DC and Nyquist
+        psd[1:-1 if self.nperseg % 2 == 0 else None] *= 2
+
+        with self._lock:
+            slot = self.segments % len(self._average)
+            self._sum += psd - self._average[slot]
+            self._average[slot] = psd
+            row = self.segments % len(self._history)
+            self._history[row] = 10 * np.log10(np.maximum(psd, DB_FLOOR))
+            self._history_times[row] = center_time
+            self.segments += 1
+            if slot == len(self._average) - 1:
+                # Re-add from scratch once per lap so rounding never accumulates
+                self._sum = self._average.sum(axis=0)
+
+    @property
+    def frames(self):
+        """Segments in the current Welch average"""
+        if self.sample_rate is None:
+            return 0
+        return min(self.segments, len(self._average))
+
+    def psd(self):
+        """(freqs, Welch PSD in V^2/Hz) over the last average_seconds, or None"""
+        with self._lock:
+            frames = self.frames
+            if frames == 0:
+                return None
+            return self.freqs.copy(), self._sum / frames
+
+    def spectrogram(self):
+        """(segment center times, dB rows oldest first) for the kept history, or None"""
+        with self._lock:
+            if self.sample_rate is None or self.segments == 0:
+                return None
+            rows = min(self.segments, len(self._history))
+            order = (np.arange(rows) + self.segments - rows) % len(self._history)
+            return self._history_times[order], self._history[order]
+
+    def summary(self, freqs, psd):
+        """Power in the bands that matter for lead quality, and mains lines relative to the ECG"""
+        ecg = band_power(freqs, psd, *ECG_BAND)
+        nyquist = self.sample_rate / 2
+        high = band_power(freqs, psd, ECG_BAND[1], nyquist + 1)
+        mains = {}
+        for line in MAINS:
+            if line + MAINS_WIDTH >= nyquist:
+                continue
+            power = band_power(freqs, psd, line - MAINS_WIDTH, line + MAINS_WIDTH)
+            if line - MAINS_WIDTH >= ECG_BAND[1]:
+                high -= power
+            mains[f'{line:g}'] = {
+                'power': power,
+                'db': round(10 * math.log10(max(power, DB_FLOOR) / max(ecg, DB_FLOOR)), 1)
+            }
+        return {
+            'baseline': band_power(freqs, psd, 0.0, ECG_BAND[0]),
+            'ecg': ecg,
+            'high': max(high, 0.0),
+            'mains': mains
+        }
+
+    def to_dict(self, max_freq=None, spectrogram=False):
+        """
+        JSON-ready PSD (dB re 1 V^2/Hz) and band summary, bins up to
+        max_freq only; with spectrogram the kept history as well. None
+        until the first segment is complete.
+        """
+        result = self.psd()
+        if result is None:
+            return None
+        freqs, psd = result
+        keep = freqs <= max_freq if max_freq else np.ones(len(freqs), dtype=bool)
+        payload = {
+            'sample_rate': self.sample_rate,
+            'nperseg': self.nperseg,
+            'resolution': round(self.sample_rate / self.nperseg, 4),
+            'frames': self.frames,
+            'freqs': np.round(freqs[keep], 3).tolist(),
+            'psd_db': np.round(10 * np.log10(np.maximum(psd[keep], DB_FLOOR)), 2).tolist()
+        }
+        payload.update(self.summary(freqs, psd))
+        if spectrogram:
+            times, db = self.spectrogram()
+            payload['spectrogram'] = {
+                'times': np.round(times, 3).tolist(),
+                'db': np.round(db[:, keep], 1).tolist()
+            }
+        return payload
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+ECG Signal Synthesizer
+Vectorized, multi-channel ECG generator for simulators, recorders and load tests
+
+    synth = ECGSynth(sample_rate=2000, channels=3, hrv=0.05, mains=0.02)
+    times, volts = synth.generate(500)     # times (500,), volts (3, 500)
+
+Each beat has the same P / QRS / T shape as the old per-sample
+generate_ecg_sample(), but whole blocks are computed with NumPy, so any
+rate up to 10 kHz and any number of channels is cheap. Beat-to-beat RR
+intervals are drawn with `hrv` relative spread; the beat is compressed
+with sqrt(RR) (Bazett) so fast rates still fit. Baseline wander and
+mains interference are shared by all channels, noise is independent per
+channel and every channel sees the same beats scaled by its lead gain.
+
+Streaming over UDP (see ecg_udp_simulator.py):
+
+    stream(synth, ("127.0.0.1", 5006), realtime=False, duration=10)
+"""
+
+import socket
+import time
+
+import numpy as np
+
+from ecg_codec import to_codes
+from ecg_protocol import PacketBatcher, MAX_SAMPLES_PER_PACKET, ENCODING_FLOAT32, ENCODING_DELTA
+from ecg_recording import ads1115_scale
+
+MAX_SAMPLE_RATE = 10000
+
+# Beat layout at the reference RR (75 BPM), as fractions of the cycle:
+# (start, end, amplitude) of each half-sine wave
+REFERENCE_RR = 0.8
+WAVES = ((0.00, 0.15, 0.1),    # P
+         (0.25, 0.35, 0.8),    # QRS
+         (0.45, 0.65, 0.2))    # T
+
+# Relative amplitude of each simulated lead, cycled for more channels
+LEAD_GAINS = (1.0, 0.6, 0.8, -0.5, 0.4, 1.2)
+
+# Seconds of signal generated per block when streaming
+STREAM_BLOCK = 0.02
+
+
+class ECGSynth:
+    """
+    Block generator with continuous state: consecutive generate() calls
+    continue the same signal, beats included.
+    """
+
+    def __init__(self, sample_rate=500, channels=1, heart_rate=75, hrv=0.05,
+                 baseline=1.5, wander=0.1, wander_hz=0.05, mains=0.0, mains_hz=50,
+                 noise=0.01, lead_gains=LEAD_GAINS, seed=None):
+        if not 0 < sample_rate <= MAX_SAMPLE_RATE:
+            raise ValueError(f"sample_rate must be in (0, {MAX_SAMPLE_RATE}] Hz")
+        if channels < 1:
+            raise ValueError("channels must be at least 1")
+        self.sample_rate = float(sample_rate)
+        self.channels = int(channels)
+        self.heart_rate = heart_rate
+        self.hrv = hrv
+        self.baseline = baseline
+        self.wander = wander
+        self.wander_hz = wander_hz
+        self.mains = mains
+        self.mains_hz = mains_hz
+        self.noise = noise
+        self.gains = np.resize(np.asarray(lead_gains, dtype=np.float64), self.channels)[:, None]
+        self.count = 0  # samples generated so far
+        self._rng = np.random.default_rng(seed)
+        # Beat onsets (s) and their RR intervals, extended as time advances
+        self._onsets = np.zeros(1)
+        self._rr = self._draw_rr(1)
+
+    def _draw_rr(self, count):
+        mean = 60.0 / self.heart_rate
+        rr = mean * (1 + self.hrv * self._rng.standard_normal(count))
+        # Keep pathological draws physiological
+        return np.clip(rr, 0.5 * mean, 1.5 * mean)
+
+    def _extend_beats(self, until):
+        while self._onsets[-1] + self._rr[-1] <= until:
+            count = int((until - self._onsets[-1]) * self.heart_rate / 60.0) + 2
+            rr = self._draw_rr(count)
+            onsets = self._onsets[-1] + self._rr[-1] + np.concatenate(([0.0], np.cumsum(rr[:-1])))
+            self._onsets = np.concatenate((self._onsets, onsets))
+            self._rr = np.concatenate((self._rr, rr))
+
+    def beats(self, times):
+        """Noise-free single-lead beat waveform at nondecreasing `times` (s)"""
+        times = np.asarray(times, dtype=np.float64)
+        if len(times) == 0:
+            return np.zeros(0)
+        self._extend_beats(times[-1])
+        idx = np.maximum(np.searchsorted(self._onsets, times, side='right') - 1, 0)
+        rr = self._rr[idx]
+        phase = (times - self._onsets[idx]) / (np.sqrt(rr / REFERENCE_RR) * REFERENCE_RR)
+
+        signal = np.zeros(len(times))
+        for start, end, amplitude in WAVES:
+            inside = (phase >= start) & (phase < end)
+            signal[inside] = amplitude * np.sin((phase[inside] - start) / (end - start) * np.pi)
+
+        # Earlier beats are never needed again
+        keep = int(idx[-1])
+        if keep:
+            self._onsets = self._onsets[keep:]
+            self._rr = self._rr[keep:]
+        return signal
+
+    def evaluate(self, times):
+        """All channels at nondecreasing `times` (s) as a (channels, n) float32 array"""
+        times = np.asarray(times, dtype=np.float64)
+        common = self.baseline + self.wander * np.sin(2 * np.pi * self.wander_hz * times)
+        if self.mains:
+            common = common + self.mains * np.sin(2 * np.pi * self.mains_hz * times)
+        out = common + self.gains * self.beats(times)
+        if self.noise:
+            out += self._rng.normal(0.0, self.noise, out.shape)
+        return out.astype(np.float32)
+
+    def generate(self, count):
+        """The next `count` samples: (times, volts) with volts shaped (channels, count)"""
+        times = (self.count + np.arange(count)) / self.sample_rate
+        self.count += count
+        return times, self.evaluate(times)
+
+    def at(self, t):
+        """Channel 0 at a single time; a waveform(t) for SimulatedADC"""
+        return float(self.evaluate(np.array([t]))[0, 0])
+
+
+def stream(synth, address, batch_size=25, realtime=True, duration=None, device_id=0,
+           sock=None, stop=None, encoding=ENCODING_FLOAT32, gain=1):
+    """
+    Send the synthesizer's output as ECG packets until `duration` seconds
+    of signal have been sent, stop() returns True, or KeyboardInterrupt.
+
+    Channel k goes out as device id `device_id + k`. With realtime=True each
+    packet leaves at its deadline (start + time of its last sample), otherwise
+    as fast as the socket takes them. Packet timestamps are always the
+    signal's own time base, starting at the wall-clock time of the call.
+    With encoding=ENCODING_DELTA the signal is quantized to ADS1115 codes at
+    `gain` and sent delta/varint packed, like a Pi sending raw codes.
+    Returns a stats dict.
+    """
+    batch_size = min(batch_size, MAX_SAMPLES_PER_PACKET)
+    own_socket = sock is None
+    if own_socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    scale = ads1115_scale(gain)
+    batchers = [PacketBatcher(synth.sample_rate, batch_size=batch_size, device_id=device_id + k,
+                              encoding=encoding, gain=gain, scale=scale)
+                for k in range(synth.channels)]
+    block = batch_size * max(1, int(round(STREAM_BLOCK * synth.sample_rate / batch_size)))
+    total = None if duration is None else int(round(duration * synth.sample_rate))
+
+    stats = {'samples': 0, 'packets': 0, 'bytes': 0, 'max_late_ms': 0.0}
+    wall_start = time.time()
+    start = time.perf_counter()
+    signal_start = synth.count / synth.sample_rate
+    try:
+        while total is None or stats['samples'] < total:
+            if stop is not None and stop():
+                break
+            count = block if total is None else min(block, total - stats['samples'])
+            times, volts = synth.generate(count)
+            offsets = times - signal_start
+            stamps = wall_start + offsets
+            if encoding == ENCODING_DELTA:
+                volts = to_codes(volts, scale)
+            packets = [b.pack(stamps, v) for b, v in zip(batchers, volts)]
+
+            for i, pos in enumerate(range(0, count, batch_size)):
+                if realtime:
+                    # A packet can only leave once its last sample exists
+                    deadline = start + offsets[min(pos + batch_size, count) - 1]
+                    late = time.perf_counter() - deadline
+                    if late < 0:
+                        time.sleep(-late)
+                    else:
+                        stats['max_late_ms'] = max(stats['max_late_ms'], float(late) * 1000)
+                for channel_packets in packets:
+                    message = channel_packets[i]
+                    sock.sendto(message, address)
+                    stats['packets'] += 1
+                    stats['bytes'] += len(message)
+            stats['samples'] += count
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if own_socket:
+            sock.close()
+
+    elapsed = time.perf_counter() - start
+    stats['start_time'] = wall_start
+    stats['elapsed'] = elapsed
+    stats['rate_hz'] = stats['samples'] / elapsed if elapsed > 0 else 0.0
+    stats['max_late_ms'] = round(stats['max_late_ms'], 3)
+    return stats
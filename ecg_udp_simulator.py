@@ -2,82 +2,62 @@
 """
 ECG UDP Simulator
 Generates simulated ECG data and sends via UDP to the realtime server
+
+Signal blocks come from ecg_synth.ECGSynth, so rates up to 10 kHz and
+several channels are cheap. With REALTIME = False packets are sent as
+fast as possible, for load testing the server. Also `python3 ecg.py
+simulate`, which takes every constant below as an option.
 """
 
-import time
-import socket
-import struct
-import math
-import random
+from ecg_synth import ECGSynth, stream
+from ecg_protocol import ENCODINGS
 
 # UDP configuration
 UDP_PORT = 5006
 TARGET_IP = "127.0.0.1"  # localhost
 
-# Create UDP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# Sampling and batching
+SAMPLE_RATE = 100       # Hz, up to 10000
+CHANNELS = 1            # channel k is sent as device DEVICE_ID + k
+BATCH_SIZE = 25         # samples per UDP packet
+DEVICE_ID = 0
+REALTIME = True         # False: send as fast as possible
+DURATION = None         # seconds of signal to send, None runs until Ctrl+C
+ENCODING = "float32"    # "delta": ADC codes at GAIN, delta/varint packed like a Pi sending raw codes
+GAIN = 1                # ADS1115 gain the codes are quantized at (delta only)
+
+# Signal
+HEART_RATE = 75         # BPM
+HRV = 0.05              # beat-to-beat RR spread (fraction of RR)
+WANDER = 0.1            # baseline wander amplitude (V)
+MAINS = 0.0             # mains interference amplitude (V), e.g. 0.02
+MAINS_HZ = 50
+NOISE = 0.01            # white noise standard deviation (V)
+
+
+def main(target_ip=TARGET_IP, udp_port=UDP_PORT, sample_rate=SAMPLE_RATE, channels=CHANNELS,
+         batch_size=BATCH_SIZE, device_id=DEVICE_ID, realtime=REALTIME, duration=DURATION,
+         encoding=ENCODING, gain=GAIN, heart_rate=HEART_RATE, hrv=HRV, wander=WANDER,
+         mains=MAINS, mains_hz=MAINS_HZ, noise=NOISE):
+    """`ecg simulate`: stream a synthetic ECG; returns ecg_synth.stream()'s statistics"""
+    synth = ECGSynth(sample_rate, channels=channels, heart_rate=heart_rate, hrv=hrv,
+                     wander=wander, mains=mains, mains_hz=mains_hz, noise=noise)
+
+    print(f"Streaming simulated ECG data to {target_ip}:{udp_port}")
+    print(f"Sample rate: {sample_rate} Hz, {channels} channel(s)")
+    print(f"Batch size: {batch_size} samples, {encoding} encoding, "
+          f"{'real-time' if realtime else 'as fast as possible'}")
+    print("Press Ctrl+C to stop")
 
-def generate_ecg_sample(t):
-    """Generate a simulated ECG waveform"""
-    # Simple simulated ECG with P, QRS, and T waves
-    heart_rate = 75  # BPM
-    frequency = heart_rate / 60.0  # Hz
-    
-    # Baseline with slight drift
-    baseline = 1.5 + 0.1 * math.sin(0.1 * t)
-    
-    # ECG waveform (simplified)
-    phase = (t * frequency) % 1.0
-    
-    if phase < 0.15:  # P wave
-        signal = 0.1 * math.sin(phase / 0.15 * math.pi)
-    elif phase < 0.25:  # PR segment
-        signal = 0
-    elif phase < 0.35:  # QRS complex
-        signal = 0.8 * math.sin((phase - 0.25) / 0.1 * math.pi)
-    elif phase < 0.45:  # ST segment
-        signal = 0
-    elif phase < 0.65:  # T wave
-        signal = 0.2 * math.sin((phase - 0.45) / 0.2 * math.pi)
-    else:  # Rest
-        signal = 0
-    
-    # Add small noise
-    noise = random.gauss(0, 0.01)
-    
-    return baseline + signal + noise
+    stats = stream(synth, (target_ip, udp_port), batch_size=batch_size, realtime=realtime,
+                   duration=duration, device_id=device_id, encoding=ENCODINGS[encoding],
+                   gain=gain)
 
-print(f"Streaming simulated ECG data to {TARGET_IP}:{UDP_PORT}")
-print(f"Sample rate: ~{1/0.01:.0f} Hz")
-print("Press Ctrl+C to stop")
+    print(f"\nSent {stats['samples']} samples per channel in {stats['packets']} packets "
+          f"({stats['bytes']} bytes) over {stats['elapsed']:.2f}s, {stats['rate_hz']:.0f} Hz, "
+          f"max late {stats['max_late_ms']} ms")
+    return stats
 
-try:
-    start_time = time.time()
-    sample_count = 0
-    
-    while True:
-        elapsed = time.time() - start_time
-        
-        # Generate voltage
-        voltage = generate_ecg_sample(elapsed)
-        
-        # Send as binary float (4 bytes) via UDP
-        message = struct.pack('f', voltage)
-        sock.sendto(message, (TARGET_IP, UDP_PORT))
-        
-        sample_count += 1
-        
-        # Print progress
-        if sample_count % 100 == 0:
-            print(f"Sent {sample_count} samples ({elapsed:.1f}s)")
-        
-        # Adjust sleep time for desired sample rate:
-        # 0.01 = ~100 Hz
-        # 0.005 = ~200 Hz
-        # 0.002 = ~500 Hz
-        time.sleep(0.01)
 
-except KeyboardInterrupt:
-    print(f"\nStopped. Sent {sample_count} samples")
-finally:
-    sock.close()
+if __name__ == '__main__':
+    main()
@@ -1,84 +1,295 @@
+import atexit
 import socket
-import struct
+import sys
 import threading
 import json
-from flask import Flask, render_template, Response, jsonify, send_from_directory
+from flask import Flask, render_template, Response, jsonify, request, send_from_directory, g
 from flask_cors import CORS
 from flask_socketio import SocketIO
-from collections import deque
 import time
 import os
 
+from ecg_protocol import decode_packet, ProtocolError, RECV_SIZE
+from ecg_devices import DeviceRegistry
+from ecg_feed import FeedServer
+from ecg_api import (devices_view, data_view, heart_rate_view, history_view, clients_view,
+                     metrics_view, spectrum_view)
+from ecg_metrics import Metrics
+
 # Serve React build folder
 app = Flask(__name__, static_folder='build', static_url_path='')
 app.config['SECRET_KEY'] = 'ecg_secret'
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
+_imported = set(globals())
+
 # UDP configuration
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5006
 
-# Data storage - 10 second window
-MAX_POINTS = 5000  # Adjust based on sample rate
-ecg_data = {
-    'timestamps': deque(maxlen=MAX_POINTS),
-    'voltages': deque(maxlen=MAX_POINTS)
-}
-start_time = None
-data_lock = threading.Lock()
+# Web server
+HTTP_PORT = 5001
+
+# TCP feed for desktop viewers (client.py), None turns it off
+TCP_PORT = 5000
+FEED_HZ = 30            # frames per second per viewer
+
+# Socket.IO broadcast
+BROADCAST_HZ = 30       # batched 'ecg_batch' messages per second
+EMIT_MODE = 'batch'     # 'batch', 'sample' (legacy per-sample 'ecg_data') or 'both'
+
+# Per-viewer send queues - a slow browser only ever holds up itself (see ecg_clients.py)
+CLIENT_QUEUE = 32               # messages queued per viewer, about a second of batches
+CLIENT_POLICY = 'drop-oldest'   # when it is full: 'drop-oldest', 'decimate' or 'disconnect'
+CLIENT_WINDOW = 4               # messages a viewer's connection may have unsent at once
+
+# Devices - each sender gets its own buffer, clock origin and Socket.IO subscribers
+DEVICE_KEY = 'id'       # 'id': packet device_id, 'address': sender IP
+MAX_DEVICES = 16        # packets from further devices are dropped
+DEFAULT_DEVICE = '0'    # served by /data and joined by clients that don't subscribe
+
+# Data storage - preallocated live window per device
+BUFFER_SECONDS = 10     # length of the live window
+MAX_SAMPLE_RATE = 500   # buffers hold BUFFER_SECONDS at max(this, device rate)
+
+# Live filtering - causal bandpass plus optional mains notch
+FILTER_BAND = (0.5, 40.0)   # Hz
+NOTCH_HZ = None             # 50 or 60 to remove mains interference
+FILTER_ORDER = 2
+LEGACY_SAMPLE_RATE = 100    # assumed rate for legacy 4-byte packets (no rate in header)
+
+# Timing - samples are placed on the sender's clock, reordered by sequence number
+JITTER_DELAY = 0.05         # seconds a packet waits for a missing earlier one
+GAP_FILL = 'interpolate'    # 'interpolate' lost samples or leave a gap ('none')
+MAX_GAP_FILL = 1.0          # longer gaps are never interpolated (seconds)
+
+# History - every sample is also archived to disk with min/max/mean rollups
+ARCHIVE_DIR = 'archive'             # None turns history off
+ROLLUP_SECONDS = (1, 10, 60)        # rollup tiers for /history
+ARCHIVE_SEGMENT_SECONDS = 3600      # raw samples go to a new file every hour
+
+# Spectrum - rolling Welch PSD and spectrogram of the raw signal (see ecg_spectrum.py)
+SPECTRUM_SEGMENT = 2.0          # seconds per FFT segment, None turns the spectrum off
+SPECTRUM_AVERAGE = 30.0         # seconds of segments averaged for /spectrum
+SPECTROGRAM_SECONDS = 60.0      # spectrogram history
+SPECTRUM_HZ = 1.0               # 'ecg_spectrum' events per second, 0 for none
+SPECTRUM_EVENT_MAX_HZ = 100.0   # the event carries bins up to this frequency
+
+# Metrics - Prometheus text at /metrics (see ecg_metrics.py)
+METRICS = True              # False leaves only a few flag checks on the hot path
+METRICS_LOG_SECONDS = None  # e.g. 60 to also print a summary line that often
+
+# Server mode: 'threading' (Flask-SocketIO, receiver thread) or 'asyncio'
+# (one event loop for UDP, HTTP and Socket.IO, see ecg_async_server.py)
+SERVER_MODE = 'threading'
+
+# Everything above can be overridden with configure()
+SETTINGS = {name for name in list(globals()) if name.isupper() and name not in _imported}
+
+# Created by run(), so the settings above can still be changed after import
+metrics = None
+devices = None
+
+def configure(**options):
+    """
+    Override settings above by their lower-case names (udp_port=5007, ...);
+    `ecg serve` passes its options here
+    """
+    for name, value in options.items():
+        if name.upper() not in SETTINGS:
+            raise TypeError(f"Unknown server setting {name!r}")
+        globals()[name.upper()] = value
+
+def registry_options():
+    """DeviceRegistry settings, shared by both server modes"""
+    return dict(key=DEVICE_KEY, max_devices=MAX_DEVICES, default=DEFAULT_DEVICE,
+                legacy_sample_rate=LEGACY_SAMPLE_RATE, buffer_seconds=BUFFER_SECONDS,
+                min_sample_rate=MAX_SAMPLE_RATE, filter_band=FILTER_BAND, notch=NOTCH_HZ,
+                filter_order=FILTER_ORDER, broadcast_hz=BROADCAST_HZ, emit_mode=EMIT_MODE,
+                archive_dir=ARCHIVE_DIR, archive_tiers=ROLLUP_SECONDS,
+                archive_segment_seconds=ARCHIVE_SEGMENT_SECONDS, jitter_delay=JITTER_DELAY,
+                gap_fill=GAP_FILL, max_gap_fill=MAX_GAP_FILL, client_queue=CLIENT_QUEUE,
+                client_policy=CLIENT_POLICY, client_window=CLIENT_WINDOW, metrics=metrics,
+                spectrum_segment=SPECTRUM_SEGMENT, spectrum_average=SPECTRUM_AVERAGE,
+                spectrogram_seconds=SPECTROGRAM_SECONDS, spectrum_hz=SPECTRUM_HZ,
+                spectrum_event_max_hz=SPECTRUM_EVENT_MAX_HZ)
 
 def udp_receiver():
     """Background thread to receive UDP data"""
-    global start_time
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((UDP_IP, UDP_PORT))
+    # Wake up now and then to release packets held by the jitter buffers
+    poll_interval = max(JITTER_DELAY / 2, 0.01)
+    sock.settimeout(poll_interval)
+    last_poll = time.time()
     print(f"UDP receiver listening on {UDP_IP}:{UDP_PORT}")
     
-    start_time = time.time()
-    
     while True:
+        now = time.time()
+        if now - last_poll >= poll_interval:
+            last_poll = now
+            try:
+                for device, beats in devices.poll(now):
+                    for event in beats:
+                        devices.clients.publish(device.name, 'ecg_beat', event)
+            except Exception as e:
+                print(f"Error handling packet: {e}")
+
         try:
-            data, addr = sock.recvfrom(4)
-            voltage = struct.unpack('f', data)[0]
-            current_time = time.time() - start_time
-            
-            with data_lock:
-                ecg_data['timestamps'].append(current_time)
-                ecg_data['voltages'].append(voltage)
-            
-            # Emit to all connected clients
-            socketio.emit('ecg_data', {
-                'time': current_time,
-                'voltage': voltage
-            })
-            
+            data, addr = sock.recvfrom(RECV_SIZE)
+            packet = decode_packet(data)
+        except socket.timeout:
+            continue
+        except ProtocolError as e:
+            metrics.decode_errors.inc()
+            print(f"Dropping bad packet from {addr[0]}: {e}")
+            continue
         except Exception as e:
             print(f"Error receiving data: {e}")
+            continue
+
+        try:
+            device, beats = devices.ingest(packet, addr)
+            # Beats are rare (~1/s), queue each one straight away
+            for event in beats:
+                devices.clients.publish(device.name, 'ecg_beat', event)
+
+        except Exception as e:
+            print(f"Error handling packet: {e}")
+
+@socketio.on('connect')
+def on_connect():
+    # Until a client subscribes it gets the default device
+    devices.clients.add(request.sid, devices.subscription({}))
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    devices.clients.remove(request.sid)
+
+@socketio.on('subscribe')
+def on_subscribe(data):
+    """
+    {'devices': ['0', '1']} or {'device': '0'}: receive only these devices'
+    events from now on; {} goes back to the default device. Returns the
+    device ids subscribed to.
+    """
+    wanted = devices.subscription(data)
+    devices.clients.subscribe(request.sid, wanted)
+    return wanted
 
 @app.route('/')
 def index():
     return send_from_directory(app.static_folder, 'index.html')
 
+def to_flask(result):
+    """Flask response for an ecg_api.ApiResponse"""
+    response = Response(result.body, status=result.status, mimetype=result.content_type)
+    if result.etag:
+        response.set_etag(result.etag)
+    response.headers.update(result.headers)
+    return response
+
+@app.route('/devices')
+def get_devices():
+    """Every device heard from, with its sample rate, counters and BPM"""
+    return to_flask(devices_view(devices))
+
 @app.route('/data')
-def get_data():
-    """Get current buffered data"""
-    with data_lock:
-        return jsonify({
-            'timestamps': list(ecg_data['timestamps']),
-            'voltages': list(ecg_data['voltages'])
-        })
+@app.route('/data/<device>')
+def get_data(device=None):
+    """Buffered data for one device (the default device for /data), see ecg_api.data_view"""
+    return to_flask(data_view(devices, device, request.args,
+                              request.headers.get('Accept'), request.headers.get('If-None-Match')))
+
+@app.route('/heart_rate')
+@app.route('/heart_rate/<device>')
+def get_heart_rate(device=None):
+    """Smoothed BPM and the most recent beats from a device's QRS detector"""
+    return to_flask(heart_rate_view(devices, device))
+
+@app.route('/history')
+@app.route('/history/<device>')
+def get_history(device=None):
+    """Archived min/max/mean history, see ecg_api.history_view"""
+    return to_flask(history_view(devices, device, request.args))
+
+@app.route('/spectrum')
+@app.route('/spectrum/<device>')
+def get_spectrum(device=None):
+    """Rolling Welch PSD (and spectrogram) of the raw signal, see ecg_api.spectrum_view"""
+    return to_flask(spectrum_view(devices, device, request.args))
+
+@app.route('/clients')
+def get_clients():
+    """Every Socket.IO client's send queue, lag and drop counters"""
+    return to_flask(clients_view(devices))
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text format counters, histograms and gauges"""
+    return to_flask(metrics_view(metrics))
+
+def start_timer():
+    g.request_start = time.perf_counter()
+
+def record_time(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'other'
+        metrics.request_seconds.labels(route).observe(time.perf_counter() - start)
+    return response
 
 @app.errorhandler(404)
 def not_found(e):
     # Serve index.html for React Router
     return send_from_directory(app.static_folder, 'index.html')
 
-if __name__ == '__main__':
+def run_asyncio():
+    """Same routes and events from one asyncio event loop (needs aiohttp)"""
+    from ecg_async_server import AsyncECGServer
+
+    if EMIT_MODE != 'batch':
+        print(f"EMIT_MODE {EMIT_MODE!r} is not supported in asyncio mode, using 'batch'")
+    options = registry_options()
+    options.pop('emit_mode')
+    server = AsyncECGServer(static_folder=app.static_folder, **options)
+    if TCP_PORT:
+        FeedServer(server.devices, UDP_IP, TCP_PORT, FEED_HZ).start()
+    server.run('0.0.0.0', HTTP_PORT, UDP_IP, UDP_PORT)
+
+def run():
+    """Start the UDP receiver, then serve HTTP/Socket.IO (blocks)"""
+    global metrics, devices
+    metrics = Metrics(METRICS)
+    metrics.start_logging(METRICS_LOG_SECONDS)
+    if SERVER_MODE == 'asyncio':
+        run_asyncio()
+        return
+
+    devices = DeviceRegistry(socketio, **registry_options())
+    # Write out partial archive chunks on exit
+    atexit.register(devices.close)
+    if METRICS:
+        app.before_request(start_timer)
+        app.after_request(record_time)
+
     # Start UDP receiver in background thread
     receiver_thread = threading.Thread(target=udp_receiver, daemon=True)
     receiver_thread.start()
+    if TCP_PORT:
+        FeedServer(devices, UDP_IP, TCP_PORT, FEED_HZ).start()
     
-    print("Starting web server on http://localhost:5001")
-    print("UDP receiver listening on port 5005")
-    socketio.run(app, host='0.0.0.0', port=5001, debug=False, allow_unsafe_werkzeug=True)
+    print(f"Starting web server on http://localhost:{HTTP_PORT}")
+    socketio.run(app, host='0.0.0.0', port=HTTP_PORT, debug=False, allow_unsafe_werkzeug=True)
+
+def main(**options):
+    """`ecg serve`: configure(**options), then run()"""
+    configure(**options)
+    run()
+
+if __name__ == '__main__':
+    if '--asyncio' in sys.argv[1:]:
+        main(server_mode='asyncio')
+    else:
+        main()
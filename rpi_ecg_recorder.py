@@ -2,104 +2,165 @@
 """
 Raspberry Pi ECG Data Recorder
 Reads ECG data from ADS1115 ADC and saves to file for offline plotting
+
+Also `python3 ecg.py record`, which takes every constant below as an
+option. Importing this module opens nothing: the I2C libraries are only
+loaded when main() opens the ADC, and record() works with any ADC object
+(rpi_ecg_recorder_simulator.py passes a simulated one).
 """
 
-import time
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
+from ecg_recording import RecordingWriter, DTYPE_NAMES, CODE_DTYPES
+from ecg_pipeline import Pipeline
+from ecg_acquisition import SampleScheduler, open_ads1115
 
 # Recording configuration
 OUTPUT_FILE = "ecg_data.txt"
 DURATION = 10  # seconds to record
-SAMPLE_RATE = 0.005  # 0.01 = ~100 Hz, 0.005 = ~200 Hz, 0.002 = ~500 Hz
-
-# Create the I2C bus
-i2c = busio.I2C(board.SCL, board.SDA)
-
-# Create the ADC object using the I2C bus with address
-# Default address is 0x48
-try:
-    ads = ADS.ADS1115(i2c, address=0x48)
-    print(f"ADS1115 connected at address 0x48")
-except Exception as e:
-    print(f"Error connecting to ADS1115: {e}")
-    print("Make sure the ADS1115 is properly connected:")
-    print("  VDD → 3.3V")
-    print("  GND → GND")
-    print("  SCL → GPIO 3 (Pin 5)")
-    print("  SDA → GPIO 2 (Pin 3)")
-    exit(1)
-
-# Optional: Set gain for better sensitivity
-# ads.gain = 16  # ±0.256V range (most sensitive for small ECG signals)
-# ads.gain = 8   # ±0.512V range
-# ads.gain = 4   # ±1.024V range (default)
-# ads.gain = 2   # ±2.048V range
-# ads.gain = 1   # ±4.096V range
-
-# Create single-ended input on channel 0
-try:
-    chan0 = AnalogIn(ads, 0)
-    print(f"Reading from channel A0")
-except Exception as e:
-    print(f"Error setting up analog input: {e}")
-    exit(1)
-
-# For differential mode (recommended for ECG):
-# Uncomment the following line and comment out the chan0 line above
-# chan_diff = AnalogIn(ads, 0, 1)  # Differential between A0 and A1
-
-print(f"Recording ECG data to {OUTPUT_FILE}")
-print(f"Duration: {DURATION} seconds")
-print(f"Sample rate: ~{1/SAMPLE_RATE:.0f} Hz")
-print("Press Ctrl+C to stop early")
-
-try:
-    with open(OUTPUT_FILE, 'w') as f:
-        # Write header
-        f.write("# ECG Data Recording\n")
-        f.write("# Format: sample_number,time(s),voltage(V)\n")
-        f.write(f"# Sample rate: ~{1/SAMPLE_RATE:.0f} Hz\n")
-        f.write(f"# Target duration: {DURATION} seconds\n")
-        
-        sample_count = 0
-        start_time = time.time()
-        
-        while True:
-            current_time = time.time()
-            elapsed_time = current_time - start_time
-            
-            # Check if recording duration reached
-            if elapsed_time >= DURATION:
-                break
-            
-            # Read voltage
-            voltage = chan0.voltage  # in volts
-            
-            # For differential mode, use:
-            # voltage = chan.voltage
-            
-            # Write to file: sample_number,time,voltage
-            f.write(f"{sample_count},{elapsed_time:.6f},{voltage:.6f}\n")
-            
-            sample_count += 1
-            
+SAMPLE_RATE = 200  # Hz (ADS1115 maximum is 860)
+
+# Output format: "text" writes OUTPUT_FILE as CSV lines, "binary" writes
+# BINARY_FILE in the chunked format from ecg_recording.py (much smaller and
+# cheaper to write; convert with `python3 ecg_recording.py to-text ...`)
+OUTPUT_FORMAT = "text"
+BINARY_FILE = "ecg_data.ecg"
+BINARY_DTYPE = "int16"  # "int16" stores raw ADC codes, "delta" packs them as
+                        # varint differences (smallest), "float32" stores volts
+
+# ADC input
+ADS_ADDRESS = 0x48
+CHANNEL = 0             # A0
+NEGATIVE = None         # e.g. 1 for A0-A1 differential (recommended for ECG)
+GAIN = 1                # 1 = ±4.096V, 2 = ±2.048V, 4 = ±1.024V, 8 = ±0.512V, 16 = ±0.256V
+
+# Pipeline: samples wait in a BUFFER_SECONDS ring between the acquisition
+# thread and the writer, which flushes every WRITE_INTERVAL seconds
+BUFFER_SECONDS = 5
+WRITE_INTERVAL = 0.25
+SPIN_MARGIN = None      # seconds busy-waited before each read, None = 0.5 ms, 0 on one core
+
+
+def open_adc(channel=CHANNEL, negative=NEGATIVE, gain=GAIN, address=ADS_ADDRESS):
+    """The ADS1115 input, or exit with the wiring to check"""
+    try:
+        adc = open_ads1115(channel, negative, gain, address)
+    except Exception as e:
+        print(f"Error connecting to ADS1115: {e}")
+        print("Make sure the ADS1115 is properly connected:")
+        print("  VDD → 3.3V")
+        print("  GND → GND")
+        print("  SCL → GPIO 3 (Pin 5)")
+        print("  SDA → GPIO 2 (Pin 3)")
+        raise SystemExit(1)
+    print(f"ADS1115 connected at address {address:#x}, reading from "
+          f"{f'A{channel}-A{negative}' if negative is not None else f'A{channel}'}")
+    return adc
+
+
+def text_writer(f, scheduler):
+    """Writer stage: sample_number,time,voltage lines, one write() per batch"""
+    count = 0
+
+    def write(times, voltages):
+        nonlocal count
+        elapsed = (times - scheduler.start_time).tolist()
+        f.write(''.join(f"{n},{t:.6f},{v:.6f}\n" for n, t, v in
+                        zip(range(count, count + len(elapsed)), elapsed, voltages.tolist())))
+        count += len(elapsed)
+    return write
+
+
+def binary_writer(writer, scheduler):
+    """Writer stage: whole batches into the chunked binary format"""
+    def write(times, values):
+        writer.write_samples(times - scheduler.start_time, values)
+    return write
+
+
+def open_output(scheduler, output_file, output_format, binary_file, binary_dtype, gain,
+                duration, title, channel=CHANNEL):
+    """
+    Open the output file once the scheduler has started, so a binary header
+    gets its start time; returns (writer stage handler, file object to close)
+    """
+    if output_format == "binary":
+        writer = RecordingWriter(binary_file, scheduler.sample_rate, gain=gain, channel=channel,
+                                 dtype=DTYPE_NAMES[binary_dtype], start_time=scheduler.start_time)
+        return binary_writer(writer, scheduler), writer
+
+    f = open(output_file, 'w')
+    f.write(f"# {title}\n")
+    f.write("# Format: sample_number,time(s),voltage(V)\n")
+    f.write(f"# Sample rate: ~{scheduler.sample_rate:.0f} Hz\n")
+    f.write(f"# Target duration: {duration} seconds\n")
+    return text_writer(f, scheduler), f
+
+
+def record(adc, output_file=OUTPUT_FILE, duration=DURATION, sample_rate=SAMPLE_RATE,
+           output_format=OUTPUT_FORMAT, binary_file=BINARY_FILE, binary_dtype=BINARY_DTYPE,
+           gain=GAIN, buffer_seconds=BUFFER_SECONDS, write_interval=WRITE_INTERVAL,
+           title="ECG Data Recording", spin_margin=SPIN_MARGIN, channel=CHANNEL):
+    """Record adc (.voltage/.value) for duration seconds or until Ctrl+C; returns the scheduler"""
+    output_path = binary_file if output_format == "binary" else output_file
+
+    print(f"Recording to {output_path}")
+    print(f"Duration: {duration} seconds")
+    print(f"Sample rate: {sample_rate:.0f} Hz")
+    print("Press Ctrl+C to stop early")
+
+    # The acquisition thread only reads the ADC at its deadlines; the file is
+    # written by a separate stage so a slow write never delays a read
+    scheduler = SampleScheduler(sample_rate, spin_margin)
+    # Raw 16-bit codes for int16 files, volts otherwise
+    raw = output_format == "binary" and DTYPE_NAMES[binary_dtype] in CODE_DTYPES
+    pipeline = Pipeline(scheduler, adc, buffer_seconds=buffer_seconds, raw=raw,
+                        duration=duration)
+    pipeline.start()
+    # The output is opened once acquisition has its start time; the ring holds
+    # the first samples until the writer stage catches up
+    scheduler.started.wait()
+    try:
+        handler, output = open_output(scheduler, output_file, output_format, binary_file,
+                                      binary_dtype, gain, duration, title, channel)
+    except OSError:
+        pipeline.stop()
+        raise
+    writer_stage = pipeline.add_stage('writer', handler, interval=write_interval)
+
+    try:
+        while not pipeline.wait(1.0):
             # Progress indicator
-            if sample_count % 100 == 0:
-                print(f"Recording... {elapsed_time:.1f}s / {DURATION}s ({sample_count} samples)")
-            
-            # Sleep for desired sample rate
-            time.sleep(SAMPLE_RATE)
-    
-    print(f"\nRecording complete!")
-    print(f"Total samples: {sample_count}")
-    print(f"Actual duration: {elapsed_time:.3f} seconds")
-    print(f"Actual sample rate: {sample_count/elapsed_time:.2f} Hz")
-    print(f"Data saved to: {OUTPUT_FILE}")
-    print(f"\nRun 'python3 rpi_plot_ecg.py' to visualize the data")
-
-except KeyboardInterrupt:
-    print(f"\nRecording stopped by user")
-    print(f"Partial data saved to: {OUTPUT_FILE}")
+            print(f"Recording... {scheduler.elapsed:.1f}s / {duration}s ({scheduler.count} samples, "
+                  f"writer {writer_stage.depth} behind)")
+        pipeline.stop()
+        output.close()
+
+        print(f"\nRecording complete!")
+        print(f"Total samples: {scheduler.count}")
+        print(f"Actual duration: {scheduler.elapsed:.3f} seconds")
+        print(f"Actual sample rate: {scheduler.actual_rate:.2f} Hz")
+        print(f"Timing: {pipeline.report()}")
+        print(f"Data saved to: {output_path}")
+        print(f"\nRun 'python3 ecg.py plot {output_path}' to visualize the data")
+
+    except KeyboardInterrupt:
+        pipeline.stop()
+        output.close()
+        print(f"\nRecording stopped by user")
+        print(f"Timing: {pipeline.report()}")
+        print(f"Partial data saved to: {output_path}")
+    return scheduler
+
+
+def main(output_file=OUTPUT_FILE, duration=DURATION, sample_rate=SAMPLE_RATE,
+         output_format=OUTPUT_FORMAT, binary_file=BINARY_FILE, binary_dtype=BINARY_DTYPE,
+         channel=CHANNEL, negative=NEGATIVE, gain=GAIN, ads_address=ADS_ADDRESS,
+         buffer_seconds=BUFFER_SECONDS, write_interval=WRITE_INTERVAL, spin_margin=SPIN_MARGIN):
+    """`ecg record`: open the ADS1115 and record() it"""
+    adc = open_adc(channel, negative, gain, ads_address)
+    return record(adc, output_file, duration, sample_rate, output_format, binary_file,
+                  binary_dtype, gain, buffer_seconds, write_interval, spin_margin=spin_margin,
+                  channel=channel)
+
+
+if __name__ == '__main__':
+    main()
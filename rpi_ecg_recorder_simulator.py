@@ -3,93 +3,55 @@
 ECG Data Recorder Simulator
 Generates simulated ECG data and saves to file for testing with rpi_plot_ecg.py
 Use this for testing without actual hardware
+
+Same recorder as rpi_ecg_recorder.py with a simulated ADC in place of the
+ADS1115; also `python3 ecg.py record --simulate`.
 """
 
-import time
-import math
-import random
+from ecg_recording import ADS1115_FULL_SCALE
+from ecg_acquisition import SimulatedADC
+from ecg_synth import ECGSynth
+from rpi_ecg_recorder import record
 
 # Recording configuration
 OUTPUT_FILE = "ecg_data.txt"
 DURATION = 10  # seconds to record
-SAMPLE_RATE = 0.01  # 0.01 = ~100 Hz
+SAMPLE_RATE = 100  # Hz
+
+# Output format: "text" writes OUTPUT_FILE as CSV lines, "binary" writes
+# BINARY_FILE in the chunked format from ecg_recording.py (much smaller and
+# cheaper to write; convert with `python3 ecg_recording.py to-text ...`)
+OUTPUT_FORMAT = "text"
+BINARY_FILE = "ecg_data.ecg"
+BINARY_DTYPE = "float32"  # "float32" stores volts, "int16" codes at BINARY_GAIN,
+                          # "delta" delta/varint packed codes (smallest)
+BINARY_GAIN = 1
+
+# Signal, see ecg_synth.py
+HEART_RATE = 75  # BPM
+HRV = 0.05       # beat-to-beat RR spread (fraction of RR)
+MAINS = 0.0      # mains interference amplitude (V)
+NOISE = 0.01     # white noise standard deviation (V)
+
+# Pipeline: samples wait in a BUFFER_SECONDS ring between the acquisition
+# thread and the writer, which flushes every WRITE_INTERVAL seconds
+BUFFER_SECONDS = 5
+WRITE_INTERVAL = 0.25
+SPIN_MARGIN = None      # seconds busy-waited before each read, None = 0.5 ms, 0 on one core
 
-def generate_ecg_sample(t):
-    """Generate a simulated ECG waveform"""
-    # Simple simulated ECG with P, QRS, and T waves
-    heart_rate = 75  # BPM
-    frequency = heart_rate / 60.0  # Hz
-    
-    # Baseline with slight drift
-    baseline = 1.5 + 0.1 * math.sin(0.1 * t)
-    
-    # ECG waveform (simplified)
-    phase = (t * frequency) % 1.0
-    
-    if phase < 0.15:  # P wave
-        signal = 0.1 * math.sin(phase / 0.15 * math.pi)
-    elif phase < 0.25:  # PR segment
-        signal = 0
-    elif phase < 0.35:  # QRS complex
-        signal = 0.8 * math.sin((phase - 0.25) / 0.1 * math.pi)
-    elif phase < 0.45:  # ST segment
-        signal = 0
-    elif phase < 0.65:  # T wave
-        signal = 0.2 * math.sin((phase - 0.45) / 0.2 * math.pi)
-    else:  # Rest
-        signal = 0
-    
-    # Add small noise
-    noise = random.gauss(0, 0.01)
-    
-    return baseline + signal + noise
 
-print(f"Recording simulated ECG data to {OUTPUT_FILE}")
-print(f"Duration: {DURATION} seconds")
-print(f"Sample rate: ~{1/SAMPLE_RATE:.0f} Hz")
-print("Press Ctrl+C to stop early")
+def main(output_file=OUTPUT_FILE, duration=DURATION, sample_rate=SAMPLE_RATE,
+         output_format=OUTPUT_FORMAT, binary_file=BINARY_FILE, binary_dtype=BINARY_DTYPE,
+         binary_gain=BINARY_GAIN, heart_rate=HEART_RATE, hrv=HRV, mains=MAINS, noise=NOISE,
+         buffer_seconds=BUFFER_SECONDS, write_interval=WRITE_INTERVAL, spin_margin=SPIN_MARGIN):
+    """`ecg record --simulate`: record a synthetic ECG through a simulated ADC"""
+    # Simulated ADC with the same .voltage / .value interface as AnalogIn
+    synth = ECGSynth(sample_rate, heart_rate=heart_rate, hrv=hrv, mains=mains, noise=noise)
+    adc = SimulatedADC(synth.at, full_scale=ADS1115_FULL_SCALE[binary_gain])
+    return record(adc, output_file, duration, sample_rate, output_format, binary_file,
+                  binary_dtype, binary_gain, buffer_seconds, write_interval,
+                  title="ECG Data Recording (Simulated)", spin_margin=spin_margin)
 
-try:
-    with open(OUTPUT_FILE, 'w') as f:
-        # Write header
-        f.write("# ECG Data Recording (Simulated)\n")
-        f.write("# Format: sample_number,time(s),voltage(V)\n")
-        f.write(f"# Sample rate: ~{1/SAMPLE_RATE:.0f} Hz\n")
-        f.write(f"# Target duration: {DURATION} seconds\n")
-        
-        sample_count = 0
-        start_time = time.time()
-        
-        while True:
-            current_time = time.time()
-            elapsed_time = current_time - start_time
-            
-            # Check if recording duration reached
-            if elapsed_time >= DURATION:
-                break
-            
-            # Generate simulated voltage
-            voltage = generate_ecg_sample(elapsed_time)
-            
-            # Write to file: sample_number,time,voltage
-            f.write(f"{sample_count},{elapsed_time:.6f},{voltage:.6f}\n")
-            
-            sample_count += 1
-            
-            # Progress indicator
-            if sample_count % 100 == 0:
-                print(f"Recording... {elapsed_time:.1f}s / {DURATION}s ({sample_count} samples)")
-            
-            # Sleep for desired sample rate
-            time.sleep(SAMPLE_RATE)
-    
-    print(f"\nRecording complete!")
-    print(f"Total samples: {sample_count}")
-    print(f"Actual duration: {elapsed_time:.3f} seconds")
-    print(f"Actual sample rate: {sample_count/elapsed_time:.2f} Hz")
-    print(f"Data saved to: {OUTPUT_FILE}")
-    print(f"\nRun 'python3 rpi_plot_ecg.py' to visualize the data")
 
-except KeyboardInterrupt:
-    print(f"\nRecording stopped by user")
-    print(f"Partial data saved to: {OUTPUT_FILE}")
+if __name__ == '__main__':
+    main()
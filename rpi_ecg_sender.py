@@ -2,82 +2,93 @@
 """
 Raspberry Pi ECG Data Sender
 Reads ECG data from ADS1115 ADC and streams via UDP to a remote server
+
+Also `python3 ecg.py send`, which takes every constant below as an
+option. Nothing is opened at import; main() opens the ADC and the socket.
 """
 
-import time
 import socket
-import struct
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
+
+from ecg_protocol import PacketBatcher, ENCODINGS, ENCODING_DELTA
+from ecg_recording import ads1115_scale
+from ecg_pipeline import Pipeline
+from ecg_acquisition import SampleScheduler
+from rpi_ecg_recorder import open_adc
 
 # UDP configuration
 UDP_PORT = 5006
 TARGET_IP = "127.0.0.1"  # localhost
 
-# Create UDP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-# Create the I2C bus
-i2c = busio.I2C(board.SCL, board.SDA)
-
-# Create the ADC object using the I2C bus with address
-# Default address is 0x48
-try:
-    ads = ADS.ADS1115(i2c, address=0x48)
-    print(f"ADS1115 connected at address 0x48")
-except Exception as e:
-    print(f"Error connecting to ADS1115: {e}")
-    print("Make sure the ADS1115 is properly connected")
-    exit(1)
-
-# Optional: Set gain for better sensitivity
-# ads.gain = 16  # ±0.256V range (most sensitive for small ECG signals)
-# ads.gain = 8   # ±0.512V range
-# ads.gain = 4   # ±1.024V range (default)
-# ads.gain = 2   # ±2.048V range
-# ads.gain = 1   # ±4.096V range
-
-# Create single-ended input on channel 0
-try:
-    chan0 = AnalogIn(ads, 0)
-    print(f"Reading from channel A0")
-except Exception as e:
-    print(f"Error setting up analog input: {e}")
-    exit(1)
-
-# For differential mode (recommended for ECG):
-# Uncomment the following line and comment out the chan0 line above
-# chan_diff = AnalogIn(ads, 0, 1)  # Differential between A0 and A1
-
-print(f"Streaming ECG data to {TARGET_IP}:{UDP_PORT}")
-print(f"Sample rate: ~{1/0.01:.0f} Hz")
-print("Press Ctrl+C to stop")
-
-try:
-    while True:
-        # Read voltage
-        voltage = chan0.voltage  # in volts
-        
-        # For differential mode, use:
-        # voltage = chan.voltage
-
-        # Send as binary float (4 bytes) via UDP
-        message = struct.pack('f', voltage)
-        sock.sendto(message, (TARGET_IP, UDP_PORT))
-
-        # Optional: Print to console (uncomment to debug)
-        # print(f"{voltage:.6f}V")
-
-        # Adjust sleep time for desired sample rate:
-        # 0.01 = ~100 Hz
-        # 0.005 = ~200 Hz
-        # 0.002 = ~500 Hz (recommended)
-        # 0.001 = ~1000 Hz
-        time.sleep(0.01)
-
-except KeyboardInterrupt:
-    print("\nStopped by user")
-finally:
-    sock.close()
+# Sampling and batching
+SAMPLE_RATE = 100       # Hz, 500 recommended (ADS1115 maximum is 860)
+BATCH_SIZE = 25         # samples per UDP packet
+FLUSH_INTERVAL = 0.05   # seconds, send a partial batch after this long
+BUFFER_SECONDS = 5      # samples held between acquisition and the sender
+DEVICE_ID = 0           # give each Pi its own id
+SPIN_MARGIN = None      # seconds busy-waited before each read, None = 0.5 ms, 0 on one core
+ENCODING = "float32"    # "delta" sends raw ADC codes delta/varint packed, ~2-3x less data
+
+# ADC input
+ADS_ADDRESS = 0x48
+CHANNEL = 0             # A0
+NEGATIVE = None         # e.g. 1 for A0-A1 differential (recommended for ECG)
+GAIN = 1                # 1 = ±4.096V, 2 = ±2.048V, 4 = ±1.024V, 8 = ±0.512V, 16 = ±0.256V
+
+
+def send(adc, target_ip=TARGET_IP, udp_port=UDP_PORT, sample_rate=SAMPLE_RATE,
+         batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, buffer_seconds=BUFFER_SECONDS,
+         device_id=DEVICE_ID, encoding=ENCODING, gain=GAIN, spin_margin=SPIN_MARGIN):
+    """Stream adc (.voltage/.value) until Ctrl+C; returns the pipeline"""
+    print(f"Streaming ECG data to {target_ip}:{udp_port}")
+    print(f"Sample rate: {sample_rate} Hz")
+    print(f"Batch size: {batch_size} samples (flush every {flush_interval}s), {encoding} encoding")
+    print("Press Ctrl+C to stop")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    code = ENCODINGS[encoding]
+    raw = code == ENCODING_DELTA
+    batcher = PacketBatcher(sample_rate, batch_size=batch_size, flush_interval=flush_interval,
+                            device_id=device_id, encoding=code, gain=gain,
+                            scale=ads1115_scale(gain))
+    scheduler = SampleScheduler(sample_rate, spin_margin)
+
+    def send_batches(times, values):
+        """Sender stage: everything acquired since the last pass, batch_size samples per packet"""
+        for message in batcher.pack(times, values):
+            sock.sendto(message, (target_ip, udp_port))
+
+    # Reads happen at absolute deadlines in the acquisition thread; packets go
+    # out from a separate stage so a slow sendto never delays a read.
+    # Delta encoding sends ADC codes, so the pipeline reads chan.value instead of volts
+    pipeline = Pipeline(scheduler, adc, buffer_seconds=buffer_seconds, raw=raw)
+    pipeline.add_stage('sender', send_batches, interval=flush_interval)
+    pipeline.start()
+
+    try:
+        while not pipeline.wait(1.0):
+            # Optional: Print pipeline stats (uncomment to debug)
+            # print(pipeline.report())
+            pass
+
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+    finally:
+        # Stopping drains the ring, so the last partial batch is still sent
+        pipeline.stop()
+        print(pipeline.report())
+        sock.close()
+    return pipeline
+
+
+def main(target_ip=TARGET_IP, udp_port=UDP_PORT, sample_rate=SAMPLE_RATE, batch_size=BATCH_SIZE,
+         flush_interval=FLUSH_INTERVAL, buffer_seconds=BUFFER_SECONDS, device_id=DEVICE_ID,
+         encoding=ENCODING, channel=CHANNEL, negative=NEGATIVE, gain=GAIN,
+         ads_address=ADS_ADDRESS, spin_margin=SPIN_MARGIN):
+    """`ecg send`: open the ADS1115 and send() it"""
+    adc = open_adc(channel, negative, gain, ads_address)
+    return send(adc, target_ip, udp_port, sample_rate, batch_size, flush_interval,
+                buffer_seconds, device_id, encoding, gain, spin_margin)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,74 +2,98 @@
 """
 ECG Data Plotter for Raspberry Pi
 Reads ECG data from file and creates visualizations
+
+Also `python3 ecg.py plot [file]`, which takes every constant below as an
+option. matplotlib is imported when plot() runs, not at import.
 """
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-# Read data from file
-data = []
-with open('ecg_data.txt', 'r') as f:
-    for line in f:
-        # Skip comment lines
-        if line.startswith('#'):
-            continue
-        # Parse CSV: sample_number,time(s),voltage(V)
-        parts = line.strip().split(',')
-        if len(parts) == 3:
-            sample_num = int(parts[0])
-            time = float(parts[1])
-            voltage = float(parts[2])
-            data.append([sample_num, time, voltage])
-
-# Convert to numpy arrays
-data = np.array(data)
-sample_numbers = data[:, 0]
-time = data[:, 1]
-voltage = data[:, 2]
-
-# Create figure with subplots
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10))
-
-# Plot 1: Full ECG trace
-ax1.plot(time, voltage, linewidth=0.5, color='blue')
-ax1.set_xlabel('Time (seconds)', fontsize=12)
-ax1.set_ylabel('Voltage (V)', fontsize=12)
-ax1.set_title('ECG Signal - Full Recording (10 seconds)', fontsize=14, fontweight='bold')
-ax1.grid(True, alpha=0.3)
-ax1.set_xlim([time[0], time[-1]])
-
-# Plot 2: Zoomed view (first 2 seconds)
-zoom_end = 2.0  # seconds
-zoom_indices = time <= zoom_end
-ax2.plot(time[zoom_indices], voltage[zoom_indices], linewidth=1, color='red')
-ax2.set_xlabel('Time (seconds)', fontsize=12)
-ax2.set_ylabel('Voltage (V)', fontsize=12)
-ax2.set_title('ECG Signal - Zoomed View (First 2 seconds)', fontsize=14, fontweight='bold')
-ax2.grid(True, alpha=0.3)
-ax2.set_xlim([0, zoom_end])
-
-# Add statistics
-mean_voltage = np.mean(voltage)
-std_voltage = np.std(voltage)
-min_voltage = np.min(voltage)
-max_voltage = np.max(voltage)
-
-stats_text = f'Statistics:\nMean: {mean_voltage:.6f} V\nStd Dev: {std_voltage:.6f} V\nMin: {min_voltage:.6f} V\nMax: {max_voltage:.6f} V\nSamples: {len(voltage)}'
-
-fig.text(0.02, 0.02, stats_text, fontsize=10, family='monospace',
-         bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-
-plt.tight_layout(rect=[0, 0.08, 1, 1])
-plt.savefig('ecg_plot.png', dpi=150, bbox_inches='tight')
-print(f"Plot saved to: ecg_plot.png")
-print(f"\nStatistics:")
-print(f"  Total samples: {len(voltage)}")
-print(f"  Duration: {time[-1]:.3f} seconds")
-print(f"  Sample rate: {len(voltage)/time[-1]:.2f} Hz")
-print(f"  Mean voltage: {mean_voltage:.6f} V")
-print(f"  Std deviation: {std_voltage:.6f} V")
-print(f"  Min voltage: {min_voltage:.6f} V")
-print(f"  Max voltage: {max_voltage:.6f} V")
-
-plt.show()
+# Recording to plot: ecg_data.txt (text) or a .ecg binary recording
+INPUT_FILE = 'ecg_data.txt'
+OUTPUT_IMAGE = 'ecg_plot.png'
+ZOOM_SECONDS = 2.0  # length of the close-up from the start of the recording
+DPI = 150
+SHOW = True         # False only saves the image (no display needed)
+
+
+def load_recording(input_file):
+    """(sample numbers, times, volts) of a text or binary recording"""
+    if input_file.endswith('.ecg'):
+        # Binary recording, memory mapped
+        from ecg_recording import RecordingReader
+        time, voltage = RecordingReader(input_file).read_all()
+        return np.arange(len(time)), time, voltage
+    # Text recording, parsed in large vectorized blocks and cached
+    # next to the file, so plotting it again loads almost instantly
+    from ecg_loader import load
+    return load(input_file)
+
+
+def main(input_file=INPUT_FILE, output_image=OUTPUT_IMAGE, zoom_seconds=ZOOM_SECONDS, dpi=DPI,
+         show=SHOW):
+    """`ecg plot`: full trace, close-up and statistics of a recording, saved to output_image"""
+    import matplotlib
+    if not show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    sample_numbers, time, voltage = load_recording(input_file)
+    if len(time) == 0:
+        print(f"No samples in {input_file}, nothing to plot")
+        return
+    duration = time[-1] - time[0]
+
+    # Create figure with subplots
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10))
+
+    # Plot 1: Full ECG trace
+    ax1.plot(time, voltage, linewidth=0.5, color='blue')
+    ax1.set_xlabel('Time (seconds)', fontsize=12)
+    ax1.set_ylabel('Voltage (V)', fontsize=12)
+    ax1.set_title(f'ECG Signal - Full Recording ({duration:.0f} seconds)', fontsize=14,
+                  fontweight='bold')
+    ax1.grid(True, alpha=0.3)
+    ax1.set_xlim([time[0], time[-1]])
+
+    # Plot 2: Zoomed view (first zoom_seconds)
+    zoom_end = time[0] + zoom_seconds
+    zoom_indices = time <= zoom_end
+    ax2.plot(time[zoom_indices], voltage[zoom_indices], linewidth=1, color='red')
+    ax2.set_xlabel('Time (seconds)', fontsize=12)
+    ax2.set_ylabel('Voltage (V)', fontsize=12)
+    ax2.set_title(f'ECG Signal - Zoomed View (First {zoom_seconds:g} seconds)', fontsize=14,
+                  fontweight='bold')
+    ax2.grid(True, alpha=0.3)
+    ax2.set_xlim([time[0], zoom_end])
+
+    # Add statistics
+    mean_voltage = np.mean(voltage)
+    std_voltage = np.std(voltage)
+    min_voltage = np.min(voltage)
+    max_voltage = np.max(voltage)
+
+    stats_text = f'Statistics:\nMean: {mean_voltage:.6f} V\nStd Dev: {std_voltage:.6f} V\nMin: {min_voltage:.6f} V\nMax: {max_voltage:.6f} V\nSamples: {len(voltage)}'
+
+    fig.text(0.02, 0.02, stats_text, fontsize=10, family='monospace',
+             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+
+    plt.tight_layout(rect=[0, 0.08, 1, 1])
+    plt.savefig(output_image, dpi=dpi, bbox_inches='tight')
+    print(f"Plot saved to: {output_image}")
+    print(f"\nStatistics:")
+    print(f"  Total samples: {len(voltage)}")
+    print(f"  Duration: {duration:.3f} seconds")
+    print(f"  Sample rate: {(len(voltage) - 1) / duration if duration > 0 else 0:.2f} Hz")
+    print(f"  Mean voltage: {mean_voltage:.6f} V")
+    print(f"  Std deviation: {std_voltage:.6f} V")
+    print(f"  Min voltage: {min_voltage:.6f} V")
+    print(f"  Max voltage: {max_voltage:.6f} V")
+
+    if show:
+        plt.show()
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,28 +10,36 @@ function App() {
     currentVoltage: 0,
     totalSamples: 0,
     bpm: 0,
+    link: null,
+    mains: null,
     connected: false
   });
-  const [threshold, setThreshold] = useState(0.002);
+  // Device to show; null follows the server's default device
+  const [device, setDevice] = useState(
+    new URLSearchParams(window.location.search).get('device'));
+  const [devices, setDevices] = useState([]);
   
   const socketRef = useRef(null);
+  const deviceRef = useRef(device);
   const sampleCounterRef = useRef(0);
   const lastUpdateRef = useRef(Date.now());
   const totalSamplesRef = useRef(0);
-  const peakTimesRef = useRef([]);
-  const lastVoltageRef = useRef(0);
   
   const WINDOW_SIZE = 10; // seconds
   const MAX_POINTS = 5000;
+  // Connect to Socket.IO server - use window.location.hostname to work across network
+  const serverUrl = `http://${window.location.hostname}:5001`;
 
   useEffect(() => {
-    // Connect to Socket.IO server - use window.location.hostname to work across network
-    const serverUrl = `http://${window.location.hostname}:5001`;
     socketRef.current = io(serverUrl);
     
     socketRef.current.on('connect', () => {
       console.log('Connected to server');
       setStats(prev => ({ ...prev, connected: true }));
+      // Only the chosen device's events are sent to this client
+      if (deviceRef.current !== null) {
+        socketRef.current.emit('subscribe', { device: deviceRef.current });
+      }
     });
     
     socketRef.current.on('disconnect', () => {
@@ -39,40 +47,29 @@ function App() {
       setStats(prev => ({ ...prev, connected: false }));
     });
     
-    // Load initial data
-    fetch(`${serverUrl}/data`)
-      .then(response => response.json())
-      .then(data => {
-        const initialData = data.timestamps.map((time, index) => ({
-          time: time,
-          voltage: data.voltages[index]
-        }));
-        setEcgData(initialData);
-      })
-      .catch(err => console.error('Error loading initial data:', err));
-    
-    // Listen for real-time ECG data
-    socketRef.current.on('ecg_data', (data) => {
-      totalSamplesRef.current++;
-      sampleCounterRef.current++;
+    // Listen for real-time ECG data (batched, one message per server tick).
+    // Acknowledging each batch lets the server pace this viewer's send queue
+    socketRef.current.on('ecg_batch', (batch, ack) => {
+      if (typeof ack === 'function') ack();
+      if (deviceRef.current !== null && batch.device !== deviceRef.current) return;
+      const times = batch.time;
+      const voltages = batch.voltage;
+      if (times.length === 0) return;
       
-      // Detect peaks for BPM calculation
-      if (data.voltage > threshold && lastVoltageRef.current <= threshold) {
-        // Peak detected (rising edge crossing threshold)
-        peakTimesRef.current.push(data.time);
-        
-        // Keep only last 5 peaks
-        if (peakTimesRef.current.length > 5) {
-          peakTimesRef.current.shift();
-        }
-      }
-      lastVoltageRef.current = data.voltage;
+      totalSamplesRef.current += times.length;
+      sampleCounterRef.current += times.length;
+      
+      const latestTime = times[times.length - 1];
+      const latestVoltage = voltages[voltages.length - 1];
       
       setEcgData(prev => {
-        const newData = [...prev, { time: data.time, voltage: data.voltage }];
+        const newData = prev.concat(times.map((time, index) => ({
+          time: time,
+          voltage: voltages[index]
+        })));
         
         // Keep only last 10 seconds
-        const filtered = newData.filter(point => data.time - point.time <= WINDOW_SIZE);
+        const filtered = newData.filter(point => latestTime - point.time <= WINDOW_SIZE);
         
         // Limit total points
         if (filtered.length > MAX_POINTS) {
@@ -81,44 +78,88 @@ function App() {
         return filtered;
       });
       
+      // Packet loss and jitter as measured by the server's jitter buffer
+      if (batch.link) {
+        setStats(prev => ({ ...prev, link: batch.link }));
+      }
+      
       // Update stats
       const now = Date.now();
       if (now - lastUpdateRef.current >= 1000) {
-        // Calculate BPM from last 5 peaks
-        let bpm = 0;
-        if (peakTimesRef.current.length >= 2) {
-          const intervals = [];
-          for (let i = 1; i < peakTimesRef.current.length; i++) {
-            intervals.push(peakTimesRef.current[i] - peakTimesRef.current[i - 1]);
-          }
-          const avgInterval = intervals.reduce((a, b) => a + b, 0) / intervals.length;
-          bpm = Math.round(60 / avgInterval);
-        }
-        
         setStats(prev => ({
           ...prev,
-          sampleRate: sampleCounterRef.current,
-          currentVoltage: data.voltage,
-          totalSamples: totalSamplesRef.current,
-          bpm: bpm
+          sampleRate: Math.round(sampleCounterRef.current * 1000 / (now - lastUpdateRef.current)),
+          currentVoltage: latestVoltage,
+          totalSamples: totalSamplesRef.current
         }));
         sampleCounterRef.current = 0;
         lastUpdateRef.current = now;
       } else {
         setStats(prev => ({
           ...prev,
-          currentVoltage: data.voltage,
+          currentVoltage: latestVoltage,
           totalSamples: totalSamplesRef.current
         }));
       }
     });
     
+    // Heart rate comes from the server-side QRS detector, one event per beat
+    socketRef.current.on('ecg_beat', (beat) => {
+      if (deviceRef.current !== null && beat.device !== deviceRef.current) return;
+      if (beat.bpm) {
+        setStats(prev => ({ ...prev, bpm: Math.round(beat.bpm) }));
+      }
+    });
+    
+    // Rolling spectrum, about once a second: show the stronger mains line
+    // relative to the ECG band
+    socketRef.current.on('ecg_spectrum', (spectrum) => {
+      if (deviceRef.current !== null && spectrum.device !== deviceRef.current) return;
+      const lines = Object.entries(spectrum.mains || {});
+      if (lines.length === 0) return;
+      const [freq, line] = lines.reduce((a, b) => (b[1].db > a[1].db ? b : a));
+      setStats(prev => ({ ...prev, mains: { freq, db: line.db } }));
+    });
+    
+    // Device list for the selector
+    const loadDevices = () => {
+      fetch(`${serverUrl}/devices`)
+        .then(response => response.json())
+        .then(data => setDevices(data.devices.map(d => d.id)))
+        .catch(err => console.error('Error loading devices:', err));
+    };
+    loadDevices();
+    const devicesTimer = setInterval(loadDevices, 5000);
+    
     return () => {
+      clearInterval(devicesTimer);
       if (socketRef.current) {
         socketRef.current.disconnect();
       }
     };
-  }, [threshold]);
+  }, [serverUrl]);
+  
+  useEffect(() => {
+    deviceRef.current = device;
+    setEcgData([]);
+    setStats(prev => ({ ...prev, bpm: 0, link: null }));
+    if (socketRef.current && socketRef.current.connected) {
+      socketRef.current.emit('subscribe', device === null ? {} : { device });
+    }
+    
+    // Load initial data, decimated on the server to about one point per pixel
+    const path = device === null ? '/data' : `/data/${encodeURIComponent(device)}`;
+    fetch(`${serverUrl}${path}?points=${window.innerWidth}`)
+      .then(response => response.json())
+      .then(data => {
+        const initialData = data.timestamps.map((time, index) => ({
+          time: time,
+          voltage: data.voltages[index]
+        }));
+        setEcgData(initialData);
+      })
+      .catch(err => console.error('Error loading initial data:', err));
+  }, [device, serverUrl]);
   
   // Calculate domain for x-axis (always show last 10 seconds)
   const xDomain = ecgData.length > 0 
@@ -131,25 +172,6 @@ function App() {
         <h1>🫀 Real-Time ECG Monitor</h1>
       </header>
       
-      <div className="controls-container">
-        <div className="control-box">
-          <label htmlFor="threshold-slider">
-            <span className="control-label">Peak Detection Threshold</span>
-            <span className="control-value">{threshold.toFixed(4)} V</span>
-          </label>
-          <input
-            id="threshold-slider"
-            type="range"
-            min="0"
-            max="0.02"
-            step="0.0001"
-            value={threshold}
-            onChange={(e) => setThreshold(parseFloat(e.target.value))}
-            className="threshold-slider"
-          />
-        </div>
-      </div>
-
       <div className="stats-container">
         <div className="stat-box">
           <div className="stat-label">Heart Rate</div>
@@ -169,6 +191,31 @@ function App() {
           <div className="stat-label">Total Samples</div>
           <div className="stat-value">{stats.totalSamples}</div>
         </div>
+        <div className="stat-box">
+          <div className="stat-label">Link</div>
+          <div className="stat-value">
+            {stats.link
+              ? `${(stats.link.loss * 100).toFixed(1)}% loss · ${stats.link.jitter_ms.toFixed(1)} ms`
+              : '--'}
+          </div>
+        </div>
+        <div className="stat-box">
+          <div className="stat-label">Mains</div>
+          <div className="stat-value">
+            {stats.mains ? `${stats.mains.freq} Hz ${stats.mains.db.toFixed(1)} dB` : '--'}
+          </div>
+        </div>
+        <div className="stat-box">
+          <div className="stat-label">Device</div>
+          <select
+            className="device-select"
+            value={device === null ? '' : device}
+            onChange={e => setDevice(e.target.value === '' ? null : e.target.value)}
+          >
+            <option value="">Default</option>
+            {devices.map(id => <option key={id} value={id}>{id}</option>)}
+          </select>
+        </div>
         <div className="stat-box">
           <div className="stat-label">Status</div>
           <div className={`stat-value ${stats.connected ? 'connected' : 'disconnected'}`}>
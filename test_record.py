@@ -1,4 +1,3 @@
-import time
 import board
 import busio
 import numpy as np
@@ -6,6 +5,8 @@ import matplotlib.pyplot as plt
 from adafruit_ads1x15.ads1115 import ADS1115
 from adafruit_ads1x15.analog_in import AnalogIn
 
+from ecg_acquisition import SampleScheduler
+
 # =====================
 # CONFIGURATION
 # =====================
@@ -26,25 +27,27 @@ chan = AnalogIn(ads, CHANNEL)
 # =====================
 # DATA ACQUISITION
 # =====================
-num_samples = FS * DURATION
 ecg_data = []
+sample_times = []
 
 print(f"Recording raw ECG for {DURATION} seconds at {FS} Hz...")
 
-while len(ecg_data) < num_samples:
-    v = chan.voltage
+# Reads at absolute deadlines, so the rate doesn't drift below FS
+scheduler = SampleScheduler(FS)
+for _, elapsed, v in scheduler.run(chan, duration=DURATION):
     ecg_data.append(v)
-    time.sleep(1 / FS)
+    sample_times.append(elapsed)
 
 print("Recording complete.")
+print(scheduler.report())
 
 # =====================
 # PLOT AND SAVE TO PNG
 # =====================
 plt.figure(figsize=(10, 4))
-plt.plot(ecg_data, lw=1)
+plt.plot(sample_times, ecg_data, lw=1)
 plt.title(f"Raw ECG ({DURATION}s, {FS} Hz)")
-plt.xlabel("Sample Number")
+plt.xlabel("Time (s)")
 plt.ylabel("Voltage (V)")
 plt.grid(True)
 plt.tight_layout()
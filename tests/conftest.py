@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from ecg_devices import DeviceRegistry
+from ecg_protocol import decode_packet, encode_packet
+
+
+class FakeSocketIO:
+    """Records emits; background tasks never start (registries use autostart=False)"""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, message, **kwargs):
+        self.events.append((event, message))
+
+    def start_background_task(self, target, *args):
+        raise AssertionError("tests drive the loops themselves")
+
+
+def packets(volts, sample_rate=250.0, batch_size=25, t0=1000.0, device_id=0, first_seq=0):
+    """Decoded packets for volts, as a sender would have batched them"""
+    out = []
+    for k, pos in enumerate(range(0, len(volts), batch_size)):
+        data = encode_packet(volts[pos:pos + batch_size], first_seq + k,
+                             t0 + pos / sample_rate, sample_rate, device_id)
+        out.append(decode_packet(data))
+    return out
+
+
+@pytest.fixture
+def socketio():
+    return FakeSocketIO()
+
+
+@pytest.fixture
+def registry(socketio):
+    registry = DeviceRegistry(socketio, autostart=False, jitter_delay=0.0, spectrum_segment=None)
+    yield registry
+    registry.close()
+
+
+def feed(registry, volts, sample_rate=250.0, device_id=0, arrival=2000.0, **kwargs):
+    """Ingest volts as consecutive packets arriving on time; returns the device"""
+    device = None
+    for packet in packets(np.asarray(volts, dtype=np.float32), sample_rate,
+                          device_id=device_id, **kwargs):
+        device, _ = registry.ingest(packet, ('127.0.0.1', 5000),
+                                    arrival + packet.t0 - kwargs.get('t0', 1000.0))
+    return device
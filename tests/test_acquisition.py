@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import ecg_acquisition
+from ecg_acquisition import SampleScheduler, SimulatedADC
+
+
+def test_rate_and_timestamps():
+    scheduler = SampleScheduler(200)
+    adc = SimulatedADC(lambda t: 1.0)
+    samples = list(scheduler.run(adc, duration=0.5))
+    assert len(samples) == pytest.approx(100, abs=2)
+    assert [index for index, _, _ in samples] == list(range(len(samples)))
+    elapsed = [e for _, e, _ in samples]
+    assert all(b > a for a, b in zip(elapsed, elapsed[1:]))
+    assert elapsed[-1] == pytest.approx(len(samples) / 200.0, abs=0.02)
+    assert scheduler.actual_rate == pytest.approx(200, rel=0.05)
+    assert 'target 200 Hz' in scheduler.report()
+
+
+def test_overruns_skip_slots():
+    scheduler = SampleScheduler(100)
+    adc = SimulatedADC(lambda t: 0.0)
+    for index, _, _ in scheduler.run(adc, duration=0.3):
+        if index == 5:
+            time.sleep(0.055)   # five and a half periods
+    assert scheduler.overruns >= 1
+    assert scheduler.missed >= 4
+    assert scheduler.count + scheduler.missed == pytest.approx(30, abs=2)
+
+
+def test_stop():
+    scheduler = SampleScheduler(1000)
+    adc = SimulatedADC(lambda t: 0.0)
+    for index, _, _ in scheduler.run(adc):
+        if index == 9:
+            scheduler.stop()
+    assert scheduler.count == 10
+
+
+def test_raw_codes():
+    adc = SimulatedADC(lambda t: 1.0, full_scale=4.096)
+    assert adc.value == 8000
+    assert SimulatedADC(lambda t: 10.0).value == 32767
+    _, _, value = next(SampleScheduler(100).run(adc, raw=True))
+    assert value == 8000
+
+
+def test_spin_margin():
+    assert SampleScheduler(100).spin_margin == ecg_acquisition.SPIN_MARGIN
+    scheduler = SampleScheduler(100, spin_margin=0)
+    start = time.perf_counter()
+    scheduler._wait_until(start + 0.01)
+    assert time.perf_counter() >= start + 0.01
+
@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+
+from conftest import feed
+from ecg_api import data_view, wants_binary
+from ecg_protocol import DATA_CONTENT_TYPE, decode_data_frame
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+def test_since_cursor(registry):
+    feed(registry, np.arange(100) / 100.0)
+    first = body(data_view(registry, None, {}))
+    assert first['start'] == 0
+    assert first['next'] == 100
+    assert len(first['timestamps']) == len(first['voltages']) == len(first['filtered']) == 100
+    assert first['device'] == '0'
+
+    feed(registry, np.arange(50) / 100.0, t0=1000.4, first_seq=4)
+    more = body(data_view(registry, None, {'since': str(first['next'])}))
+    assert more['start'] == 100
+    assert more['next'] == 150
+    assert len(more['voltages']) == 50
+
+    assert body(data_view(registry, None, {'since': '150'}))['voltages'] == []
+
+
+def test_cursor_past_end_starts_over(registry):
+    feed(registry, np.zeros(25))
+    assert body(data_view(registry, None, {'since': '9999'}))['start'] == 0
+
+
+def test_limit(registry):
+    feed(registry, np.arange(100, dtype=np.float32))
+    payload = body(data_view(registry, None, {'limit': '10'}))
+    assert payload['start'] == 90
+    assert payload['voltages'][-1] == 99
+
+
+def test_etag_not_modified(registry):
+    feed(registry, np.zeros(50))
+    response = data_view(registry, None, {'since': '0'})
+    assert response.status == 200
+    again = data_view(registry, None, {'since': '0'}, if_none_match=f'"{response.etag}"')
+    assert again.status == 304
+    assert again.body == b''
+
+    feed(registry, np.zeros(25), t0=1000.2, first_seq=2)
+    assert data_view(registry, None, {'since': '0'},
+                     if_none_match=f'"{response.etag}"').status == 200
+
+
+def test_binary_matches_json(registry):
+    feed(registry, np.linspace(-1, 1, 75))
+    response = data_view(registry, None, {'format': 'binary'})
+    assert response.content_type == DATA_CONTENT_TYPE
+    first, next_seq, times, (voltages, filtered) = decode_data_frame(response.body)
+    payload = body(data_view(registry, None, {}))
+    assert (first, next_seq) == (payload['start'], payload['next'])
+    np.testing.assert_allclose(times, payload['timestamps'], atol=1e-4)
+    np.testing.assert_allclose(voltages, payload['voltages'], rtol=1e-6)
+    np.testing.assert_allclose(filtered, payload['filtered'], rtol=1e-6)
+
+
+def test_no_device_yet(registry):
+    payload = body(data_view(registry, None, {}))
+    assert (payload['start'], payload['next'], payload['timestamps']) == (0, 0, [])
+
+
+def test_errors(registry):
+    assert data_view(registry, 'nope', {}).status == 404
+    feed(registry, np.zeros(25))
+    assert data_view(registry, None, {'method': 'bogus'}).status == 400
+    assert data_view(registry, None, {'channel': 'bogus'}).status == 400
+
+
+def test_wants_binary():
+    assert wants_binary({'format': 'binary'}, None)
+    assert not wants_binary({'format': 'json'}, DATA_CONTENT_TYPE)
+    assert wants_binary({}, DATA_CONTENT_TYPE)
+    assert not wants_binary({}, 'application/json, */*;q=0.1')
+    assert not wants_binary({}, None)
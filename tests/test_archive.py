@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from ecg_archive import (DeviceArchive, combine, device_directory, query, read_rollup,
+                         rollup_path, segments)
+from ecg_recording import ads1115_scale
+
+T0 = 1_800_000_000.0    # on a minute boundary
+RATE = 100
+
+
+def archive_signal(root, seconds, start=T0, block=37, **options):
+    """Archive a ramp repeating every second; returns the archive (closed) and the samples"""
+    times = start + np.arange(seconds * RATE) / RATE
+    volts = (np.arange(seconds * RATE) % RATE / RATE).astype(np.float32)
+    archive = DeviceArchive(root, 'pi-1', RATE, **options)
+    for pos in range(0, len(times), block):
+        archive.append(times[pos:pos + block], volts[pos:pos + block])
+    archive.close()
+    return archive, times, volts
+
+
+def test_rollups(tmp_path):
+    archive, times, volts = archive_signal(str(tmp_path), 125)
+    seconds = read_rollup(rollup_path(archive.directory, 1))
+    # Only complete buckets are written: the last second is still open
+    assert len(seconds) == 124
+    np.testing.assert_allclose(seconds['time'], T0 + np.arange(124))
+    np.testing.assert_allclose(seconds['min'], 0.0)
+    np.testing.assert_allclose(seconds['max'], 0.99, atol=1e-6)
+    np.testing.assert_allclose(seconds['mean'], volts[:100].mean(), atol=1e-6)
+    assert set(seconds['count']) == {100}
+
+    tens = read_rollup(rollup_path(archive.directory, 10))
+    assert len(tens) == 12
+    assert set(tens['count']) == {1000}
+    minutes = read_rollup(rollup_path(archive.directory, 60))
+    assert len(minutes) == 1
+    assert minutes['count'][0] == 6000
+
+
+def test_restart_never_rewrites_a_bucket(tmp_path):
+    archive, _, _ = archive_signal(str(tmp_path), 5)
+    # The next run picks up in the middle of the last written bucket
+    archive_signal(str(tmp_path), 5, start=T0 + 3.5)
+    seconds = read_rollup(rollup_path(archive.directory, 1))
+    assert np.all(np.diff(seconds['time']) > 0)
+    assert len(seconds) == 8
+
+
+def test_combine_never_reopens_a_bucket():
+    times = np.array([0.1, 0.9, 1.1, 0.95, 2.0])
+    ids, mins, maxs, sums, counts = combine(times, times, times, times, np.ones(5), 1.0)
+    np.testing.assert_array_equal(ids, [0, 1, 2])
+    np.testing.assert_array_equal(counts, [2, 2, 1])
+
+
+def test_query_tiers(tmp_path):
+    archive, times, volts = archive_signal(str(tmp_path), 125)
+    directory = archive.directory
+
+    overview = query(directory, T0, T0 + 120, points=12)
+    assert overview['tier'] == 10
+    assert overview['time'] == (T0 + np.arange(0, 120, 10)).tolist()
+    assert overview['min'] == [0.0] * 12
+    assert overview['count'] == [1000] * 12
+
+    detail = query(directory, T0, T0 + 100, points=100)
+    assert detail['tier'] == 1
+    assert len(detail['time']) == 100
+
+    # Coarser than the rollups can answer: merged down to the points asked for
+    merged = query(directory, T0, T0 + 120, points=7)
+    assert len(merged['time']) <= 7
+    assert sum(merged['count']) == 12000
+
+    raw = query(directory, T0 + 2, T0 + 3, points=1000)
+    assert raw['tier'] == 'raw'
+    np.testing.assert_allclose(raw['time'], times[200:300])
+    np.testing.assert_allclose(raw['min'], volts[200:300], atol=1e-6)
+
+
+def test_delta_segments_are_lossless(tmp_path):
+    scale = ads1115_scale(1)
+    archive = DeviceArchive(str(tmp_path), 7, RATE, scale=scale)
+    codes = np.arange(-500, 500)
+    times = T0 + np.arange(len(codes)) / RATE
+    archive.append(times, codes * scale)
+    archive.close()
+    raw = query(archive.directory, T0, T0 + 10, points=10000)
+    assert raw['tier'] == 'raw'
+    np.testing.assert_allclose(np.array(raw['min']) / scale, codes, atol=1e-3)
+
+
+def test_segments_roll_over(tmp_path):
+    archive, times, volts = archive_signal(str(tmp_path), 25, segment_seconds=10)
+    found = segments(archive.directory)
+    assert len(found) == 3
+    raw = query(archive.directory, T0, T0 + 25, points=10000)
+    assert len(raw['time']) == len(times)
+
+
+def test_device_directory():
+    assert device_directory('archive', '10.0.0.1') == os.path.join('archive', '10.0.0.1')
+    assert device_directory('archive', '../x y') == os.path.join('archive', '.._x_y')
+
+
+def test_missing_archive(tmp_path):
+    result = query(str(tmp_path / 'nothing'), T0, T0 + 60, points=100)
+    assert result['time'] == []
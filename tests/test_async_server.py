@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp.test_utils import TestClient, TestServer
+
+from ecg_api import data_view
+from ecg_async_server import AsyncECGServer
+from ecg_protocol import encode_packet
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'index.html').write_text('<html>app</html>')
+    (tmp_path / 'app.js').write_text('// app')
+    server = AsyncECGServer(static_folder=str(tmp_path), jitter_delay=0.0, spectrum_segment=None)
+    yield server
+    server.devices.close()
+
+
+def send(server, volts, device_id=0, batch_size=25, sample_rate=250.0):
+    for k, pos in enumerate(range(0, len(volts), batch_size)):
+        data = encode_packet(np.asarray(volts[pos:pos + batch_size], dtype=np.float32), k,
+                             1000.0 + pos / sample_rate, sample_rate, device_id)
+        server.handle_datagram(data, ('127.0.0.1', 5000))
+
+
+def fetch(server, *requests):
+    """(status, headers, body bytes) per GET path or (path, headers), all on one client"""
+    async def get():
+        results = []
+        async with TestClient(TestServer(server.app)) as client:
+            for item in requests:
+                path, headers = (item, None) if isinstance(item, str) else item
+                response = await client.get(path, headers=headers)
+                results.append((response.status, response.headers, await response.read()))
+        return results
+    return asyncio.run(get())
+
+
+def test_datagrams_reach_devices(server, capsys):
+    send(server, np.arange(100) / 100.0, device_id=3)
+    server.handle_datagram(b'\x01\x02\x03', ('127.0.0.1', 5000))
+    assert 'Dropping bad packet' in capsys.readouterr().out
+    device = server.devices.get('3')
+    assert device.buffer.end == 100
+
+
+def test_routes_match_the_shared_views(server):
+    send(server, np.arange(100) / 100.0)
+    expected = data_view(server.devices, '0', {'limit': '10'})
+    (status, headers, body), (data_status, data_headers, data), (cached, _, _), (missing, _, _) = \
+        fetch(server, '/devices', '/data/0?limit=10',
+              ('/data/0?limit=10', {'If-None-Match': f'"{expected.etag}"'}), '/data/9')
+    assert status == 200
+    assert [d['id'] for d in json.loads(body)['devices']] == ['0']
+    assert headers['Access-Control-Allow-Origin'] == '*'
+
+    assert data_status == 200
+    assert data == expected.body
+    assert data_headers['Content-Type'] == expected.content_type
+    assert cached == 304
+    assert missing == 404
+
+
+def test_static_files(server):
+    asset, route, outside = fetch(server, '/app.js', '/monitor/2', '/../../etc/passwd')
+    assert asset[2] == b'// app'
+    # React Router paths and anything outside the folder get index.html
+    assert route[2] == b'<html>app</html>'
+    assert outside[2] == b'<html>app</html>'
@@ -0,0 +1,117 @@
+import os
+import time
+from argparse import Namespace
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ecg_batch import (beat_stats, find_beats, find_recordings, report_name, run, signal_stats)
+from ecg_filters import DEFAULT_BAND
+from ecg_qrs import QRSDetector
+from ecg_recording import RecordingWriter
+from ecg_synth import ECGSynth
+
+
+def write_session(path, seconds, rate=250, heart_rate=75):
+    """A synthetic text recording in the ecg_data.txt format"""
+    times, volts = ECGSynth(rate, heart_rate=heart_rate, hrv=0.0, seed=1).generate(seconds * rate)
+    lines = [f"{k},{t:.6f},{v:.6f}" for k, (t, v) in enumerate(zip(times, volts[0]))]
+    path.write_text(f"# ECG Data Recording\n# Sample rate: ~{rate} Hz\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_find_recordings(tmp_path):
+    (tmp_path / 'a.txt').write_text('x' * 10)
+    (tmp_path / 'big.csv').write_text('x' * 100)
+    (tmp_path / 'notes.md').write_text('x')
+    (tmp_path / '.hidden.txt').write_text('x')
+    (tmp_path / '.cache').mkdir()
+    (tmp_path / '.cache' / 'c.txt').write_text('x')
+    (tmp_path / 'day2').mkdir()
+    (tmp_path / 'day2' / 's.ecg').write_bytes(b'x' * 50)
+    found = find_recordings(str(tmp_path))
+    assert [os.path.relpath(p, tmp_path) for p in found] == ['big.csv', os.path.join('day2', 's.ecg'),
+                                                             'a.txt']
+
+
+def test_find_recordings_skips_the_output(tmp_path):
+    (tmp_path / 'a.txt').write_text('x')
+    reports = tmp_path / 'reports'
+    reports.mkdir()
+    (reports / 'index.csv').write_text('file,status\n')
+    (reports / 'old.csv').write_text('x')
+    # The output given as a different spelling of the same directory
+    output = os.path.join(str(tmp_path), 'day2', '..', 'reports')
+    assert find_recordings(str(tmp_path), output) == [str(tmp_path / 'a.txt')]
+
+    # Reports written next to the recordings: only index.csv is skipped
+    (tmp_path / 'index.csv').write_text('file,status\n')
+    found = find_recordings(str(tmp_path), str(tmp_path))
+    assert str(tmp_path / 'a.txt') in found
+    assert str(tmp_path / 'index.csv') not in found
+
+
+def test_report_name():
+    assert report_name('/data', os.path.join('/data', 'day2', 's.ecg')) == 'day2__s.ecg'
+
+
+def test_signal_stats_dropouts():
+    times = np.concatenate((np.arange(100), np.arange(150, 200))) / 100.0
+    stats = signal_stats(times, np.ones(150))
+    assert stats['samples'] == 150
+    assert stats['sample_rate'] == 100.0
+    assert stats['dropouts'] == 1
+    assert stats['dropout_seconds'] == pytest.approx(0.5)
+
+
+def test_beat_stats():
+    beats = [SimpleNamespace(rr=rr) for rr in (None, 1.0, 0.5, 1.0)]
+    stats = beat_stats(beats)
+    assert stats['beats'] == 4
+    assert stats['bpm'] == 72.0
+    assert stats['bpm_min'] == 60.0 and stats['bpm_max'] == 120.0
+    assert stats['rmssd_ms'] == 500.0
+    assert beat_stats([])['bpm'] is None
+
+
+def test_find_beats_in_blocks():
+    times, volts = ECGSynth(250, heart_rate=75, hrv=0.05, seed=3).generate(250 * 600)
+    start = time.perf_counter()
+    beats = find_beats(times, volts[0], 250.0)
+    assert time.perf_counter() - start < 3.0
+    whole = QRSDetector().process(times, volts[0], 250.0)
+    assert len(beats) > 700
+    assert [beat.time for beat in beats] == [beat.time for beat in whole]
+
+
+def args(directory, output, force=False):
+    return Namespace(directory=directory, output=output, jobs=1, band=DEFAULT_BAND, notch=None,
+                     points=1000, force=force)
+
+
+def test_run_then_rerun_from_cache(tmp_path):
+    sessions = tmp_path / 'sessions'
+    sessions.mkdir()
+    write_session(sessions / 'rest.txt', 30, heart_rate=60)
+    writer = RecordingWriter(str(sessions / 'run.ecg'), 250)
+    times, volts = ECGSynth(250, heart_rate=120, hrv=0.0, seed=2).generate(250 * 30)
+    writer.write_samples(times, volts[0], volts=True)
+    writer.close()
+    (sessions / 'broken.txt').write_text('not,a,recording\n')
+    output = str(sessions / 'reports')
+
+    results = {r['file']: r for r in run(args(str(sessions), output))}
+    assert set(results) == {'rest.txt', 'run.ecg', 'broken.txt'}
+    assert results['rest.txt']['bpm'] == pytest.approx(60, abs=2)
+    assert results['run.ecg']['bpm'] == pytest.approx(120, abs=3)
+    assert results['broken.txt']['status'] == 'error'
+    for name in ('rest.txt', 'run.ecg'):
+        assert os.path.exists(os.path.join(output, name + '.png'))
+    assert os.path.exists(os.path.join(output, 'index.csv'))
+
+    # The reports' index.csv is not picked up as a recording on the next run
+    again = {r['file']: r for r in run(args(str(sessions), output))}
+    assert set(again) == set(results)
+    assert again['rest.txt']['status'] == 'cached'
+    assert run(args(str(sessions), output, force=True))[0]['status'] != 'cached'
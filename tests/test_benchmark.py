@@ -0,0 +1,94 @@
+import os
+import time
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+import ecg_benchmark
+from ecg_benchmark import CounterSignal, ProcessMonitor, analyze, percentiles
+
+
+def test_counter_signal_continues():
+    signal = CounterSignal(100, offset=1000)
+    times, values = signal.generate(5)
+    assert values.shape == (1, 5)
+    np.testing.assert_array_equal(values[0], [1000, 1001, 1002, 1003, 1004])
+    times, values = signal.generate(3)
+    np.testing.assert_allclose(times, [0.05, 0.06, 0.07])
+    np.testing.assert_array_equal(values[0], [1005, 1006, 1007])
+
+
+def test_percentiles():
+    assert percentiles([]) is None
+    summary = percentiles(np.arange(1, 1001) / 1000)
+    assert summary['count'] == 1000
+    assert summary['mean'] == 500.5
+    assert summary['p50'] == pytest.approx(500.5)
+    assert summary['max'] == 1000.0
+    assert summary['p90'] <= summary['p99'] <= summary['p99.9'] <= summary['max']
+
+
+def sender(index, samples, start_time):
+    return {'index': index, 'samples': samples, 'packets': samples // 25, 'bytes': samples * 4,
+            'max_late_ms': 0.5, 'start_time': start_time}
+
+
+def test_analyze_latency_and_loss():
+    args = Namespace(senders=2, value_span=1000, rate=100.0, flood=False)
+    senders = [sender(1, 100, 50.0), sender(0, 100, 10.0)]
+    # Consumer saw sender 0's first 100 values and half of sender 1's, 20 ms late
+    values = np.concatenate((np.arange(100), 1000 + np.arange(50))).astype(np.float64)
+    recv = np.where(values < 1000, 10.0 + values / 100, 50.0 + (values - 1000) / 100) + 0.02
+    consumers = [{'index': 0, 'events': 6, 'values': values, 'recv_times': recv},
+                 {'index': 1, 'error': 'connect failed'}]
+    result = analyze(args, senders, consumers, [], ingested=190, elapsed=2.0)
+
+    assert result['sent']['samples'] == 200
+    assert result['sent']['samples_per_s'] == 100.0
+    assert result['server']['loss'] == pytest.approx(0.05)
+    first, second = result['consumers']
+    assert first['samples'] == 150
+    assert first['loss'] == pytest.approx(0.25)
+    assert first['latency_ms']['p50'] == pytest.approx(20.0, abs=0.01)
+    assert second == {'index': 1, 'error': 'connect failed'}
+    assert 'data_endpoint' not in result
+    assert 'gap-filled' in result['server']['note']
+
+
+def test_analyze_flood_and_pollers():
+    args = Namespace(senders=1, value_span=1000, rate=100.0, flood=True)
+    consumers = [{'index': 0, 'events': 1, 'values': np.arange(10.0), 'recv_times': np.zeros(10)}]
+    pollers = [{'index': 0, 'requests': 10, 'errors': 1, 'bytes': 500}]
+    result = analyze(args, [sender(0, 10, 0.0)], consumers, pollers, ingested=10, elapsed=1.0)
+    assert result['consumers'][0]['latency_ms'] is None
+    assert result['data_endpoint']['requests_per_s'] == 10.0
+    assert result['data_endpoint']['errors'] == 1
+
+
+def test_process_monitor_samples_itself():
+    monitor = ProcessMonitor(os.getpid(), interval=0.05)
+    monitor.start()
+    time.sleep(0.3)
+    monitor.stop()
+    summary = monitor.summary()
+    assert summary is not None
+    assert summary['rss_mb_max'] > 0
+
+
+def test_server_archives_outside_the_tree(monkeypatch, tmp_path):
+    launched = []
+
+    class Server:
+        pid = 1
+
+        def __init__(self, argv, **kwargs):
+            launched.append(argv[-1])
+
+        def poll(self):
+            return None
+
+    monkeypatch.setattr(ecg_benchmark.subprocess, 'Popen', Server)
+    monkeypatch.setattr(ecg_benchmark, 'server_ingested', lambda port: 0)
+    ecg_benchmark.start_server(5007, 5000, None, str(tmp_path))
+    assert f"archive_dir={str(tmp_path)!r}" in launched[0]
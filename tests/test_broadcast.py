@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from ecg_broadcast import Broadcaster, MODE_BOTH, MODE_SAMPLE
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, message):
+        self.events.append((event, message))
+
+
+def arrays(*values):
+    return [np.asarray(v, dtype=np.float64) for v in values]
+
+
+def test_payload_coalesces_pushes():
+    broadcaster = Broadcaster(FakeSocketIO(), device='0', stats=lambda: {'loss': 0.0})
+    broadcaster.push(*arrays([1.0, 1.01], [0.5, 0.6], [0.0, 0.1]), arrival=100.0)
+    broadcaster.push(*arrays([1.02], [0.7], [0.2]), gaps=[{'start': 1.0}], arrival=101.0)
+
+    message = broadcaster.payload()
+    assert message['device'] == '0'
+    assert message['time'] == [1.0, 1.01, 1.02]
+    assert message['voltage'] == [0.5, 0.6, 0.7]
+    assert message['filtered'] == [0.0, 0.1, 0.2]
+    assert message['gaps'] == [{'start': 1.0}]
+    assert message['link'] == {'loss': 0.0}
+    assert broadcaster.arrival == 100.0
+    assert broadcaster.payload() is None
+
+
+def test_payload_rounds():
+    broadcaster = Broadcaster(FakeSocketIO(), time_decimals=2, voltage_decimals=3)
+    broadcaster.push(*arrays([1.23456], [0.123456], [0.98765]))
+    message = broadcaster.payload()
+    assert message['time'] == [1.23]
+    assert message['voltage'] == [0.123]
+    assert message['filtered'] == [0.988]
+    assert 'gaps' not in message
+
+
+def test_sample_mode_emits_per_sample():
+    socketio = FakeSocketIO()
+    broadcaster = Broadcaster(socketio, mode=MODE_SAMPLE, device='1')
+    broadcaster.push(*arrays([1.0, 2.0], [0.1, 0.2], [0.0, 0.0]))
+    assert [event for event, _ in socketio.events] == ['ecg_data', 'ecg_data']
+    assert socketio.events[1][1] == {'time': 2.0, 'voltage': 0.2, 'filtered': 0.0, 'device': '1'}
+    assert broadcaster.payload() is None
+
+
+def test_both_mode_also_batches():
+    socketio = FakeSocketIO()
+    broadcaster = Broadcaster(socketio, mode=MODE_BOTH)
+    broadcaster.push(*arrays([1.0], [0.1], [0.0]))
+    assert len(socketio.events) == 1
+    assert broadcaster.payload()['time'] == [1.0]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        Broadcaster(FakeSocketIO(), mode='bogus')
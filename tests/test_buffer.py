@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from ecg_buffer import RingBuffer
+
+
+def fill(buffer, start, stop):
+    values = np.arange(start, stop, dtype=np.float64)
+    buffer.extend(time=values, voltage=values)
+
+
+def test_cursors_before_wrap():
+    buffer = RingBuffer(10)
+    fill(buffer, 0, 4)
+    assert (buffer.start, buffer.end, len(buffer)) == (0, 4, 4)
+    first, data = buffer.snapshot()
+    assert first == 0
+    assert data['time'].tolist() == [0, 1, 2, 3]
+
+
+def test_wrap_keeps_newest():
+    buffer = RingBuffer(5)
+    fill(buffer, 0, 4)
+    fill(buffer, 4, 8)
+    assert (buffer.start, buffer.end, len(buffer)) == (3, 8, 5)
+    first, data = buffer.snapshot()
+    assert first == 3
+    assert data['time'].tolist() == [3, 4, 5, 6, 7]
+    assert data['voltage'].dtype == np.float32
+
+
+def test_extend_larger_than_capacity():
+    buffer = RingBuffer(4)
+    fill(buffer, 0, 1)
+    fill(buffer, 1, 11)
+    assert buffer.end == 11
+    assert buffer.snapshot()[1]['time'].tolist() == [7, 8, 9, 10]
+
+
+def test_since_cursor():
+    buffer = RingBuffer(5)
+    fill(buffer, 0, 8)
+    first, data = buffer.snapshot(since=6)
+    assert (first, data['time'].tolist()) == (6, [6, 7])
+    # Fell out of the window: start from the oldest sample held
+    first, data = buffer.snapshot(since=0)
+    assert (first, len(data['time'])) == (3, 5)
+    # Caught up (or ahead): nothing new
+    first, data = buffer.snapshot(since=20)
+    assert (first, len(data['time'])) == (8, 0)
+
+
+def test_limit_takes_newest():
+    buffer = RingBuffer(10)
+    fill(buffer, 0, 8)
+    first, data = buffer.snapshot(limit=3)
+    assert (first, data['time'].tolist()) == (5, [5, 6, 7])
+
+
+def test_append_single():
+    buffer = RingBuffer(2)
+    for i in range(3):
+        buffer.append(time=i, voltage=i * 0.5)
+    assert buffer.snapshot()[1]['voltage'].tolist() == [0.5, 1.0]
+
+
+def test_snapshot_is_a_copy():
+    buffer = RingBuffer(4)
+    fill(buffer, 0, 2)
+    _, data = buffer.snapshot()
+    data['time'][:] = -1
+    assert buffer.snapshot()[1]['time'].tolist() == [0, 1]
+
+
+def test_for_window_and_bad_capacity():
+    assert RingBuffer.for_window(2.5, 100).capacity == 250
+    with pytest.raises(ValueError):
+        RingBuffer(0)
@@ -0,0 +1,124 @@
+import json
+import types
+
+import numpy as np
+import pytest
+
+import ecg
+import rpi_ecg_recorder
+import rpi_plot_ecg
+from ecg_acquisition import SimulatedADC
+from ecg_recording import DTYPE_INT16, RecordingReader, RecordingWriter
+
+
+def parse(*argv):
+    return vars(ecg.build_parser().parse_args(argv))
+
+
+def test_options_default_to_the_scripts():
+    # Unset options are left out so the script's own defaults apply
+    assert parse('send') == {'config': None, 'import_time': False, 'command': 'send'}
+    args = parse('send', '--target-ip', '10.0.0.2', '--sample-rate', '500', '--negative', 'none',
+                 '--ads-address', '0x49', '--spin-margin', 'off')
+    assert args['target_ip'] == '10.0.0.2'
+    assert args['sample_rate'] == 500.0
+    assert args['negative'] is None
+    assert args['ads_address'] == 0x49
+    assert args['spin_margin'] is None
+    assert parse('replay', 'a.ecg', '--fast')['speed'] == 0
+
+
+def test_optional():
+    convert = ecg.optional(int)
+    assert convert('3') == 3
+    assert convert('None') is None and convert('off') is None
+    with pytest.raises(ValueError):
+        convert('x')
+
+
+def test_load_config(tmp_path):
+    path = tmp_path / 'pi.json'
+    path.write_text(json.dumps({'send': {'TARGET_IP': '10.0.0.3', 'device_id': 2}}))
+    parser = ecg.build_parser()
+    assert ecg.load_config(parser, str(path), 'send') == {'target_ip': '10.0.0.3', 'device_id': 2}
+    assert ecg.load_config(parser, str(path), 'record') == {}
+    path.write_text(json.dumps({'send': [1, 2]}))
+    with pytest.raises(SystemExit):
+        ecg.load_config(parser, str(path), 'send')
+    with pytest.raises(SystemExit):
+        ecg.load_config(parser, str(tmp_path / 'missing.json'), 'send')
+
+
+def test_script_for():
+    options = {'simulate': True, 'duration': 5}
+    assert ecg.script_for('record', options) == 'rpi_ecg_recorder_simulator'
+    assert options == {'duration': 5}
+    assert ecg.script_for('record', {}) == 'rpi_ecg_recorder'
+    assert ecg.script_for('serve', {}) == 'realtime_server'
+
+
+def test_check_options():
+    parser = ecg.build_parser()
+    module = types.SimpleNamespace(__name__='fake', main=lambda duration=1, gain=1: None)
+    ecg.check_options(parser, 'record', module, {'duration': 2})
+    with pytest.raises(SystemExit):
+        ecg.check_options(parser, 'record', module, {'heart_rate': 60})
+
+    # main(**options) scripts list what they take in SETTINGS
+    module = types.SimpleNamespace(__name__='server', main=lambda **options: None,
+                                   SETTINGS={'NOTCH_HZ': 50})
+    ecg.check_options(parser, 'serve', module, {'notch_hz': 60})
+    with pytest.raises(SystemExit):
+        ecg.check_options(parser, 'serve', module, {'buffer_seconds': 5})
+
+
+def test_main_runs_the_script(monkeypatch, tmp_path):
+    calls = []
+    module = types.ModuleType('fake_recorder')
+    module.main = lambda duration=1, channel=0: calls.append((duration, channel))
+    monkeypatch.setitem(__import__('sys').modules, 'fake_recorder', module)
+    monkeypatch.setitem(ecg.SCRIPTS, 'record', ('fake_recorder', None))
+    path = tmp_path / 'pi.json'
+    path.write_text(json.dumps({'record': {'duration': 3, 'channel': 1}}))
+    assert ecg.main(['--config', str(path), 'record', '--channel', '2']) == 0
+    assert calls == [(3, 2)]
+
+
+def test_recorder_writes_the_configured_channel(tmp_path):
+    path = str(tmp_path / 'a2.ecg')
+    adc = SimulatedADC(lambda t: 0.5)
+    scheduler = rpi_ecg_recorder.record(adc, duration=0.3, sample_rate=100, output_format='binary',
+                                        binary_file=path, binary_dtype='int16',
+                                        write_interval=0.05, channel=2)
+    reader = RecordingReader(path)
+    assert reader.channel == 2
+    assert reader.start_time == scheduler.start_time
+    assert reader.dtype == DTYPE_INT16
+    assert len(reader) == scheduler.count
+    _, volts = reader.read_all()
+    np.testing.assert_allclose(volts, 0.5, atol=reader.scale)
+
+
+def test_recorder_text_output(tmp_path):
+    path = tmp_path / 'ecg_data.txt'
+    rpi_ecg_recorder.record(SimulatedADC(lambda t: 1.25), output_file=str(path), duration=0.2,
+                            sample_rate=100, write_interval=0.05)
+    lines = path.read_text().splitlines()
+    assert lines[0] == '# ECG Data Recording'
+    assert lines[2] == '# Sample rate: ~100 Hz'
+    samples = [line.split(',') for line in lines if not line.startswith('#')]
+    assert [int(n) for n, _, _ in samples] == list(range(len(samples)))
+    assert {v for _, _, v in samples} == {'1.250000'}
+
+
+@pytest.mark.parametrize('name', ['empty.txt', 'empty.ecg'])
+def test_plot_empty_recording(tmp_path, capsys, name):
+    path = tmp_path / name
+    if name.endswith('.ecg'):
+        RecordingWriter(str(path), 250).close()
+    else:
+        path.write_text("# ECG Data Recording\n# Sample rate: ~250 Hz\n")
+    image = tmp_path / 'plot.png'
+    rpi_plot_ecg.main(str(path), str(image), show=False)
+    assert "No samples" in capsys.readouterr().out
+    assert not image.exists()
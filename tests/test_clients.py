@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from conftest import FakeSocketIO
+from ecg_clients import (ACK_TIMEOUT, BATCH_EVENT, POLICY_DECIMATE, POLICY_DISCONNECT,
+                         POLICY_DROP_OLDEST, ClientHub, ClientQueue, join_batches, merge_batches)
+
+
+def batch(start, count=8, device='0'):
+    values = list(range(start, start + count))
+    return {'device': device, 'time': [v / 100 for v in values], 'voltage': values,
+            'filtered': values}
+
+
+def queue(policy=POLICY_DROP_OLDEST, size=4):
+    return ClientQueue('sid', ['0', '1'], size, policy, now=0.0)
+
+
+def test_join_and_merge():
+    joined = join_batches(batch(0), batch(8))
+    assert joined['voltage'] == list(range(16))
+    merged = merge_batches(batch(0), batch(8))
+    assert merged['decimated']
+    assert len(merged['voltage']) < 16
+    assert {0, 15} <= set(merged['voltage'])
+    assert merged['time'] == [v / 100 for v in merged['voltage']]
+
+
+def test_batches_of_a_device_go_out_joined():
+    client = queue(size=10)
+    client.put(BATCH_EVENT, batch(0), 1.0)
+    client.put(BATCH_EVENT, batch(0, device='1'), 1.0)
+    client.put('ecg_beat', {'device': '0', 'bpm': 60}, 1.0)
+    client.put(BATCH_EVENT, batch(8), 1.1)
+    sends = client.take(window=4, backlog=0, now=1.2)
+    assert [(event, message['device']) for event, message, _, _ in sends] == \
+        [(BATCH_EVENT, '0'), (BATCH_EVENT, '1'), ('ecg_beat', '0')]
+    assert sends[0][1]['voltage'] == list(range(16))
+    assert [ack for _, _, ack, _ in sends] == [True, True, False]
+    assert client.stats(1.2, 0)['max_lag'] == pytest.approx(0.2)
+
+
+def test_window_paces_the_client():
+    client = queue(size=10)
+    client.put(BATCH_EVENT, batch(0), 1.0)
+    client.take(window=2, backlog=0, now=1.0)
+    client.acked(1.05)
+    assert client.acks is True
+    assert client.rtt == pytest.approx(0.05)
+    for k in range(1, 3):
+        client.put(BATCH_EVENT, batch(8 * k), 1.1)
+        assert len(client.take(window=2, backlog=0, now=1.1)) == 1
+    # Two batches unacknowledged: the window holds the next one back
+    client.put(BATCH_EVENT, batch(100), 1.2)
+    assert client.take(window=2, backlog=0, now=1.2) == []
+    client.acked(1.25)
+    assert len(client.take(window=2, backlog=0, now=1.3)) == 1
+
+
+def test_transport_paces_until_first_ack():
+    client = queue(size=10)
+    client.put(BATCH_EVENT, batch(0), 1.0)
+    assert client.take(window=2, backlog=2, now=1.0) == []
+    assert len(client.take(window=2, backlog=0, now=1.0)) == 1
+
+
+def test_clients_that_never_ack():
+    client = queue(size=10)
+    client.put(BATCH_EVENT, batch(0), 0.0)
+    client.take(window=4, backlog=0, now=0.0)
+    client.put(BATCH_EVENT, batch(8), ACK_TIMEOUT + 1)
+    (_, _, ack, _), = client.take(window=4, backlog=0, now=ACK_TIMEOUT + 1)
+    assert client.acks is False
+    assert not ack
+
+
+def test_drop_oldest():
+    client = queue(POLICY_DROP_OLDEST, size=2)
+    for k in range(4):
+        client.put(BATCH_EVENT, batch(8 * k), 1.0)
+    (_, message, _, _), = client.take(window=4, backlog=0, now=1.0)
+    assert message['voltage'] == list(range(16, 32))
+    assert client.dropped == 2
+
+
+def test_decimate_keeps_the_whole_span():
+    client = queue(POLICY_DECIMATE, size=2)
+    for k in range(4):
+        client.put(BATCH_EVENT, batch(8 * k), 1.0)
+    (_, message, _, _), = client.take(window=4, backlog=0, now=1.0)
+    assert client.dropped == 0
+    assert client.merged == 2
+    assert message['decimated']
+    assert message['voltage'][0] == 0 and message['voltage'][-1] == 31
+    assert message['voltage'] == sorted(message['voltage'])
+
+
+def test_decimate_falls_back_to_dropping():
+    # No two batches of one device to merge: beats only
+    client = queue(POLICY_DECIMATE, size=2)
+    for k in range(3):
+        client.put('ecg_beat', {'device': '0', 'n': k}, 1.0)
+    assert client.dropped == 1
+
+
+def test_disconnect_policy():
+    hub = ClientHub(FakeSocketIO(), queue_size=2, policy=POLICY_DISCONNECT)
+    hub.add('slow', ['0'])
+    for k in range(3):
+        hub.publish('0', BATCH_EVENT, batch(8 * k))
+    sends, overflowed = hub.drain()
+    assert sends == [] and overflowed == ['slow']
+    assert len(hub) == 0
+    assert hub.disconnected == 1
+
+
+def test_hub_routes_by_subscription():
+    hub = ClientHub(FakeSocketIO())
+    hub.add('a', ['0'])
+    hub.add('b', ['1'])
+    hub.publish('0', BATCH_EVENT, batch(0))
+    hub.subscribe('b', ['0', '1'])
+    hub.publish('0', BATCH_EVENT, batch(8))
+    sends, _ = hub.drain()
+    received = {sid: message['voltage'] for sid, _, message, _ in sends}
+    assert received == {'a': list(range(16)), 'b': list(range(8, 16))}
+    # Acknowledgements come back through the callback
+    callback = sends[0][3]
+    callback()
+    stats = {c['sid']: c for c in hub.stats()['clients']}
+    assert stats[sends[0][0]]['acks'] is True
+    hub.remove('a')
+    hub.remove('a')
+    assert len(hub) == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ClientHub(FakeSocketIO(), policy='block')
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ecg_codec import CodecError, decode_deltas, encode_deltas, to_codes, unzigzag, zigzag
+from ecg_protocol import (DELTA_HEADER, ENCODING_DELTA, HEADER, MAGIC, VERSION, ProtocolError,
+                          decode_packet, encode_packet)
+
+
+def test_zigzag():
+    values = np.array([0, -1, 1, -2, 2, 32767, -32768 * 2])
+    np.testing.assert_array_equal(zigzag(values)[:5], [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(unzigzag(zigzag(values)), values)
+
+
+@pytest.mark.parametrize('codes', [
+    [],
+    [1234],
+    [0, 1, -1, 63, -64, 64, 8191, -8192, 8192],
+    [-32768, 32767, -32768, 0],
+])
+def test_round_trip(codes):
+    first, data = encode_deltas(codes)
+    np.testing.assert_array_equal(decode_deltas(first, data, len(codes)), codes)
+
+
+def test_varint_sizes():
+    # Differences within +-63 take one byte, +-8191 two, anything else three
+    assert len(encode_deltas([0, 63, 0])[1]) == 2
+    assert len(encode_deltas([0, 64])[1]) == 2
+    assert len(encode_deltas([0, 8191])[1]) == 2
+    assert len(encode_deltas([0, 8192])[1]) == 3
+
+
+def test_random_walk_round_trip():
+    rng = np.random.default_rng(1)
+    codes = np.clip(np.cumsum(rng.integers(-300, 300, 5000)), -32768, 32767).astype(np.int16)
+    first, data = encode_deltas(codes)
+    assert len(data) < 2 * len(codes)
+    np.testing.assert_array_equal(decode_deltas(first, data, len(codes)), codes)
+
+
+@pytest.mark.parametrize('data, count', [
+    (b'\x80', 1),               # a lone continuation byte, no terminator at all
+    (b'\x01\x80', 2),           # truncated varint after a complete one
+    (b'\x01', 3),               # fewer varints than samples
+    (b'\x01\x01', 2),           # more varints than samples
+    (b'\x80\x80\x80\x01', 2),   # longer than an int16 difference can need
+])
+def test_malformed(data, count):
+    with pytest.raises(CodecError):
+        decode_deltas(0, data, count)
+
+
+def test_to_codes_saturates():
+    np.testing.assert_array_equal(to_codes([0.0, 1.0, -1.0, 1e9, -1e9], 0.001),
+                                  [0, 1000, -1000, 32767, -32768])
+
+
+def test_delta_packet_round_trip():
+    codes = np.array([100, 101, 99, -5000, 20000], dtype=np.int16)
+    packet = decode_packet(encode_packet(codes, 3, 1000.0, 250.0, encoding=ENCODING_DELTA,
+                                         gain=2, scale=0.5))
+    assert packet.encoding == ENCODING_DELTA
+    assert packet.gain == 2 and packet.scale == 0.5
+    np.testing.assert_array_equal(packet.voltages, codes * 0.5)
+
+
+def test_bad_delta_packet_is_a_protocol_error():
+    header = HEADER.pack(MAGIC, VERSION, ENCODING_DELTA, 0, 0, 100.0, 0.0, 1)
+    with pytest.raises(ProtocolError):
+        decode_packet(header + DELTA_HEADER.pack(1, 1, 0) + b'\x80')
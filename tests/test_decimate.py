@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from ecg_buffer import RingBuffer
+from ecg_decimate import (DecimationCache, MAX_POINTS, MIN_POINTS, lttb, minmax_decimate,
+                          quantize_points)
+
+
+def spiky(n, every=97):
+    values = np.sin(np.arange(n) / 50.0).astype(np.float32) * 0.1
+    values[::every] = 1.0
+    return np.arange(n, dtype=np.float64), values
+
+
+def test_quantize_points():
+    assert quantize_points(1) == MIN_POINTS
+    assert quantize_points(65) == 128
+    assert quantize_points(10 ** 6) == MAX_POINTS
+
+
+def test_minmax_keeps_extremes_in_order():
+    times, values = spiky(10000)
+    t, v = minmax_decimate(times, values, 100)
+    assert len(v) <= 202
+    assert np.all(np.diff(t) > 0)
+    assert v.max() == values.max()
+    assert v.min() == values.min()
+
+
+def test_minmax_short_input_untouched():
+    times, values = spiky(50)
+    t, v = minmax_decimate(times, values, 100)
+    assert t is times and v is values
+
+
+def test_lttb_keeps_ends_and_peak():
+    times, values = spiky(5000, every=2500)
+    t, v = lttb(times, values, 200)
+    assert len(t) == 200
+    assert (t[0], t[-1]) == (0, 4999)
+    assert np.all(np.diff(t) > 0)
+    assert 1.0 in v
+
+
+def test_incremental_view_follows_the_window():
+    buffer = RingBuffer(2000)
+    cache = DecimationCache(buffer)
+    times, values = spiky(7000)
+    for pos in range(0, 7000, 300):
+        buffer.extend(time=times[pos:pos + 300], voltage=values[pos:pos + 300])
+        t, v = cache.get(128)
+        held = buffer.snapshot()[1]
+        assert held['time'][0] <= t[0] and t[-1] <= held['time'][-1]
+        assert np.all(np.diff(t) >= 0)
+        assert len(t) <= 2 * 128 + 2
+        assert v.max() == held['voltage'].max()
+
+
+def test_lttb_cache_follows_writes():
+    buffer = RingBuffer(1000)
+    cache = DecimationCache(buffer)
+    times, values = spiky(1000)
+    buffer.extend(time=times[:500], voltage=values[:500])
+    first = cache.get(64, 'lttb')
+    assert cache.get(64, 'lttb') is first
+    buffer.extend(time=times[500:], voltage=values[500:])
+    assert cache.get(64, 'lttb')[0][-1] == 999
+
+
+def test_incremental_lttb_follows_the_window():
+    buffer = RingBuffer(2000)
+    cache = DecimationCache(buffer)
+    times, values = spiky(7000, every=331)
+    for pos in range(0, 7000, 100):
+        buffer.extend(time=times[pos:pos + 100], voltage=values[pos:pos + 100])
+        t, v = cache.get(128, 'lttb')
+        held = buffer.snapshot()[1]
+        assert held['time'][0] <= t[0]
+        assert t[-1] == held['time'][-1]
+        assert np.all(np.diff(t) > 0)
+        assert len(t) <= 128
+        # Every spike in a picked bucket survives
+        assert np.count_nonzero(v == 1.0) >= np.count_nonzero(held['voltage'] == 1.0) - 1
+
+
+def test_incremental_lttb_reads_only_new_samples():
+    buffer = RingBuffer(2000)
+    cache = DecimationCache(buffer)
+    times, values = spiky(4000)
+    buffer.extend(time=times[:2000], voltage=values[:2000])
+    cache.get(128, 'lttb')
+    read = []
+    snapshot = buffer.snapshot
+
+    def counting(*args, **kwargs):
+        first, cols = snapshot(*args, **kwargs)
+        read.append(len(cols['time']))
+        return first, cols
+    buffer.snapshot = counting
+    for pos in range(2000, 4000, 25):
+        buffer.extend(time=times[pos:pos + 25], voltage=values[pos:pos + 25])
+        cache.get(128, 'lttb')
+    # Two buckets of 16 plus the new samples, never the whole window
+    assert max(read) < 2 * 16 + 25
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        DecimationCache(RingBuffer(10)).get(64, 'bogus')
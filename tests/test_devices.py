@@ -0,0 +1,85 @@
+import struct
+
+import numpy as np
+import pytest
+
+from conftest import feed, packets
+from ecg_devices import DeviceRegistry, KEY_ADDRESS
+from ecg_protocol import decode_packet
+
+
+def test_demux_by_device_id(registry):
+    a = feed(registry, np.full(100, 1.0), device_id=1)
+    b = feed(registry, np.full(50, 2.0), device_id=2)
+    assert a is not b
+    assert len(registry) == 2
+    assert registry.get('1') is a and registry.get('2') is b
+    assert a.buffer.end == 100 and b.buffer.end == 50
+    assert set(a.buffer.snapshot()[1]['voltage']) == {1.0}
+    assert set(b.buffer.snapshot()[1]['voltage']) == {2.0}
+
+
+def test_demux_by_address(socketio):
+    registry = DeviceRegistry(socketio, key=KEY_ADDRESS, autostart=False, jitter_delay=0.0,
+                              spectrum_segment=None)
+    first, second = packets(np.ones(50, dtype=np.float32), device_id=7)
+    a, _ = registry.ingest(first, ('10.0.0.1', 5000), 2000.0)
+    b, _ = registry.ingest(second, ('10.0.0.2', 5000), 2000.1)
+    assert a.name == '10.0.0.1' and b.name == '10.0.0.2'
+    registry.close()
+
+
+def test_legacy_packets_keyed_by_address(registry):
+    legacy = decode_packet(struct.pack('<f', 1.25))
+    device, _ = registry.ingest(legacy, ('10.0.0.9', 5000), 2000.0)
+    assert device.name == '10.0.0.9'
+    assert device.sample_rate == registry.legacy_sample_rate
+
+
+def test_max_devices(socketio, capsys):
+    registry = DeviceRegistry(socketio, max_devices=1, autostart=False, jitter_delay=0.0,
+                              spectrum_segment=None)
+    assert feed(registry, np.ones(25), device_id=1) is not None
+    for _ in range(2):
+        packet, = packets(np.ones(25, dtype=np.float32), device_id=2)
+        assert registry.ingest(packet, ('127.0.0.1', 5000), 2000.0) == (None, [])
+    assert len(registry) == 1
+    # Rejections are logged once per device
+    assert capsys.readouterr().out.count('Ignoring device 2') == 1
+    registry.close()
+
+
+def test_default_device(socketio):
+    registry = DeviceRegistry(socketio, default='3', autostart=False, jitter_delay=0.0,
+                              spectrum_segment=None)
+    assert registry.default() is None
+    first = feed(registry, np.ones(25), device_id=1)
+    assert registry.default() is first
+    third = feed(registry, np.ones(25), device_id=3)
+    assert registry.default() is third
+    registry.close()
+
+
+def test_subscription(registry):
+    # No devices yet and no default configured: nothing to subscribe to
+    assert registry.subscription(None) == []
+    feed(registry, np.ones(25), device_id=5)
+    assert registry.subscription({}) == ['5']
+    assert registry.subscription({'device': 2}) == ['2']
+    assert registry.subscription({'devices': [1, None, '4']}) == ['1', '4']
+
+
+def test_info(registry):
+    device = feed(registry, np.ones(250), device_id=1)
+    info = device.info()
+    assert info['id'] == '1'
+    assert info['address'] == '127.0.0.1'
+    assert info['sample_rate'] == 250.0
+    assert info['samples'] == 250
+    assert info['packets'] == 10
+    assert info['link']['lost'] == 0
+
+
+def test_unknown_key(socketio):
+    with pytest.raises(ValueError):
+        DeviceRegistry(socketio, key='serial')
@@ -0,0 +1,85 @@
+import json
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from conftest import feed
+from ecg_feed import FeedServer
+from ecg_protocol import FrameDecoder, ProtocolError, decode_data_frame, encode_frame
+
+
+def test_frames_split_anywhere():
+    bodies = [b'', b'a', b'hello' * 100]
+    stream = b''.join(encode_frame(body) for body in bodies)
+    decoder = FrameDecoder()
+    received = []
+    for k in range(len(stream)):
+        received.extend(decoder.feed(stream[k:k + 1]))
+    assert received == bodies
+    # ... or several in one read
+    assert FrameDecoder().feed(stream) == bodies
+
+
+def test_frame_too_large():
+    with pytest.raises(ProtocolError):
+        FrameDecoder(max_frame=10).feed(encode_frame(b'x' * 11))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server(registry):
+    server = FeedServer(registry, '127.0.0.1', free_port(), rate=100)
+    server.start()
+    yield server
+    server.stop()
+
+
+def connect(server, request=None):
+    conn = socket.create_connection((server.host, server.port), timeout=2.0)
+    if request is not None:
+        conn.sendall(encode_frame(json.dumps(request).encode('utf-8')))
+    return conn
+
+
+def receive(conn, decoder, samples):
+    """Decoded frames until they add up to `samples`"""
+    frames = []
+    total = 0
+    while total < samples:
+        for body in decoder.feed(conn.recv(65536)):
+            frames.append(decode_data_frame(body))
+            total += len(frames[-1][2])
+    return frames
+
+
+def test_first_frame_is_the_window_then_increments(registry, server):
+    feed(registry, np.arange(250) / 250.0, device_id=1)
+    with connect(server, {'device': 1}) as conn:
+        decoder = FrameDecoder()
+        (first, next_seq, times, (raw, filtered)), = receive(conn, decoder, 250)
+        assert (first, next_seq) == (0, 250)
+        np.testing.assert_allclose(raw, np.arange(250) / 250.0, atol=1e-6)
+        assert len(filtered) == 250
+
+        feed(registry, np.full(50, 2.0), device_id=1, t0=1001.0, first_seq=10)
+        frames = receive(conn, decoder, 50)
+        assert frames[0][0] == 250
+        assert frames[-1][1] == 300
+        np.testing.assert_array_equal(np.concatenate([f[3][0] for f in frames]), 2.0)
+
+
+def test_default_device_without_request(registry, server):
+    feed(registry, np.ones(100), device_id=4)
+    with connect(server) as conn:
+        # No request frame: the server waits REQUEST_TIMEOUT and then sends the default
+        start = time.monotonic()
+        (first, next_seq, _, _), = receive(conn, FrameDecoder(), 100)
+        assert next_seq == 100
+        assert time.monotonic() - start < 3.0
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from ecg_filters import StreamingFilter, design_sos
+
+FS = 500.0
+
+
+def tone(hz, seconds=4.0, amplitude=1.0):
+    t = np.arange(int(seconds * FS)) / FS
+    return amplitude * np.sin(2 * np.pi * hz * t)
+
+
+def rms(x):
+    return float(np.sqrt(np.mean(np.square(x))))
+
+
+def test_batches_match_one_pass():
+    x = tone(10) + tone(0.1, amplitude=2.0) + 1.5
+    whole = StreamingFilter().process(x, FS)
+    f = StreamingFilter()
+    pieces = np.concatenate([f.process(x[i:i + 25], FS) for i in range(0, len(x), 25)])
+    np.testing.assert_allclose(pieces, whole, atol=1e-6)
+    assert pieces.dtype == np.float32
+
+
+def test_passband_and_stopband():
+    settle = int(FS)
+    assert rms(StreamingFilter().process(tone(10), FS)[settle:]) == pytest.approx(rms(tone(10)),
+                                                                                 rel=0.05)
+    assert rms(StreamingFilter().process(tone(0.05), FS)[settle:]) < 0.1
+    assert rms(StreamingFilter().process(tone(150), FS)[settle:]) < 0.1
+
+
+def test_no_step_transient_on_dc_offset():
+    y = StreamingFilter().process(np.full(100, 1.5), FS)
+    assert np.abs(y).max() < 1e-6
+
+
+def test_notch():
+    settle = int(FS)
+    plain = rms(StreamingFilter().process(tone(50), FS)[settle:])
+    notched = rms(StreamingFilter(notch=50).process(tone(50), FS)[settle:])
+    assert notched < 0.05 * plain
+
+
+def test_rate_change_redesigns():
+    f = StreamingFilter()
+    f.process(tone(10)[:100], FS)
+    f.process(tone(10)[:100], 250.0)
+    assert f.sample_rate == 250.0
+
+
+def test_band_clamped_below_nyquist():
+    sos = design_sos(60.0, band=(0.5, 40.0))
+    _, h = signal.sosfreqz(sos, worN=[10.0], fs=60.0)
+    assert abs(h[0]) > 0.5
+
+
+def test_unusable_band():
+    with pytest.raises(ValueError):
+        design_sos(FS, band=(0.0, 40.0))
+    assert len(StreamingFilter().process([], FS)) == 0
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from conftest import packets
+from ecg_jitter import FILL_NONE, JitterBuffer, SEQ_MODULO, seq_distance
+
+RATE = 100.0
+
+
+def stream(count=10, first_seq=0, t0=1000.0, start=0):
+    """count packets of 10 samples valued start, start + 1, ..."""
+    volts = np.arange(start, start + count * 10, dtype=np.float32)
+    return packets(volts, RATE, batch_size=10, t0=t0, first_seq=first_seq)
+
+
+def push_all(buffer, items, arrival=0.0):
+    """Push (packet, arrival) pairs; returns the released (times, voltages, gaps)"""
+    times, volts, gaps = [], [], []
+    for packet, at in items:
+        out = buffer.push(packet, at, RATE)
+        if out is not None:
+            times.append(out[0])
+            volts.append(out[1])
+            gaps.extend(out[2])
+    if not times:
+        return np.zeros(0), np.zeros(0), gaps
+    return np.concatenate(times), np.concatenate(volts), gaps
+
+
+def test_seq_distance_wraps():
+    assert seq_distance(5, 3) == 2
+    assert seq_distance(3, 5) == -2
+    assert seq_distance(1, SEQ_MODULO - 1) == 2
+    assert seq_distance(SEQ_MODULO - 1, 1) == -2
+
+
+def test_in_order_released_immediately():
+    buffer = JitterBuffer(delay=0.05)
+    times, volts, gaps = push_all(buffer, [(p, k * 0.1) for k, p in enumerate(stream())])
+    np.testing.assert_allclose(times, np.arange(100) / RATE)
+    np.testing.assert_array_equal(volts, np.arange(100))
+    assert gaps == []
+    assert buffer.held == 0
+
+
+def test_reorder_within_delay():
+    buffer = JitterBuffer(delay=0.05)
+    p = stream(4)
+    times, volts, _ = push_all(buffer, [(p[0], 0.0), (p[2], 0.2), (p[1], 0.21), (p[3], 0.3)])
+    np.testing.assert_array_equal(volts, np.arange(40))
+    stats = buffer.stats()
+    assert stats['reordered'] == 1
+    assert stats['lost'] == 0
+
+
+def test_loss_after_delay_is_a_filled_gap():
+    buffer = JitterBuffer(delay=0.05)
+    p = stream(4)
+    _, volts, _ = push_all(buffer, [(p[0], 0.0), (p[2], 0.2)])
+    assert len(volts) == 10 and buffer.held == 1
+    assert buffer.poll(0.22) is None
+    times, volts, gaps = buffer.poll(0.3)
+    assert buffer.stats()['lost'] == 1
+    assert gaps == [{'start': 0.1, 'end': 0.2, 'samples': 10, 'filled': True}]
+    # Interpolated from the last sample before the hole to the first after it
+    np.testing.assert_allclose(times, np.arange(10, 30) / RATE)
+    np.testing.assert_allclose(volts[:10], np.linspace(9, 20, 12)[1:-1], atol=1e-5)
+    np.testing.assert_array_equal(volts[10:], np.arange(20, 30))
+
+    # The missing packet arriving after all is late
+    assert buffer.push(p[1], 0.35, RATE) is None
+    assert buffer.stats()['late'] == 1
+
+
+def test_gap_left_open_without_fill():
+    buffer = JitterBuffer(delay=0.0, fill=FILL_NONE)
+    p = stream(3)
+    times, volts, gaps = push_all(buffer, [(p[0], 0.0), (p[2], 0.2)])
+    assert gaps[0]['filled'] is False
+    assert len(volts) == 20
+    np.testing.assert_allclose(times[10:], np.arange(20, 30) / RATE)
+
+
+def test_duplicates():
+    buffer = JitterBuffer(delay=0.05)
+    p = stream(3)
+    _, volts, _ = push_all(buffer, [(p[0], 0.0), (p[0], 0.01), (p[2], 0.2), (p[2], 0.21)])
+    assert len(volts) == 10
+    assert buffer.stats()['duplicates'] == 2
+
+
+def test_sender_restart_resyncs():
+    buffer = JitterBuffer(delay=0.05)
+    before = stream(3, first_seq=5000)
+    # Numbering starts over while the clock goes on
+    after = stream(3, first_seq=0, t0=1000.3, start=30)
+    times, volts, _ = push_all(buffer, [(p, 0.0) for p in before + after])
+    np.testing.assert_array_equal(volts, np.arange(60))
+    np.testing.assert_allclose(times, np.arange(60) / RATE)
+    assert buffer.stats()['resyncs'] == 1
+
+
+def test_clock_going_back_keeps_the_axis():
+    buffer = JitterBuffer(delay=0.05)
+    before = stream(3)
+    after = stream(3, first_seq=3, t0=900.0, start=30)
+    times, _, gaps = push_all(buffer, [(p, 0.0) for p in before + after])
+    np.testing.assert_allclose(times, np.arange(60) / RATE)
+    assert gaps == []
+    assert buffer.stats()['resyncs'] == 1
+
+
+def test_jitter():
+    steady = JitterBuffer()
+    push_all(steady, [(p, 5.0 + k * 0.1) for k, p in enumerate(stream())])
+    assert steady.jitter == pytest.approx(0.0, abs=1e-9)
+    bursty = JitterBuffer()
+    push_all(bursty, [(p, 5.0 + (k // 2) * 0.2) for k, p in enumerate(stream())])
+    assert bursty.jitter > 0.01
+
+
+def test_unknown_fill():
+    with pytest.raises(ValueError):
+        JitterBuffer(fill='zeros')
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+
+from ecg_loader import (_parse_block, cache_path, header_sample_rate, iter_blocks, load,
+                        read_header)
+
+HEADER = ("# ECG Data Recording\n"
+          "# Format: sample_number,time(s),voltage(V)\n"
+          "# Sample rate: ~200 Hz\n")
+
+
+def write_recording(path, n, header=HEADER, newline='\n'):
+    lines = [f"{k},{k / 200:.6f},{1.5 + 0.1 * np.sin(k / 7):.6f}" for k in range(n)]
+    path.write_text(header + newline.join(lines) + newline)
+    return path
+
+
+def test_parse_block():
+    data = _parse_block("0,0.1,1.0\n1,0.2,1.1\r\n")
+    assert data.tolist() == [[0, 0.1, 1.0], [1, 0.2, 1.1]]
+    assert _parse_block("").shape == (0, 3)
+    assert _parse_block("# only a comment\n").shape == (0, 3)
+
+
+@pytest.mark.parametrize('text', [
+    "0,0.1,1.0\n1,0.2,abc\n2,0.3,1.2",      # non-numeric field
+    "0,0.1,1.0\n1,0.2\n2,0.3,1.2",          # truncated line
+    "0,0.1,1.0\n1,0.2,1.1,9\n2,0.3,1.2",    # extra field
+])
+def test_malformed_lines_are_skipped(text):
+    assert _parse_block(text).tolist() == [[0, 0.1, 1.0], [2, 0.3, 1.2]]
+
+
+def test_header():
+    assert read_header(os.devnull) == {}
+    assert header_sample_rate({'sample rate': '~200 Hz'}) == 200.0
+    assert header_sample_rate({}) is None
+
+
+def test_iter_blocks_matches_load(tmp_path):
+    path = write_recording(tmp_path / 'ecg.txt', 5000)
+    blocks = list(iter_blocks(str(path), block_bytes=4096))
+    assert len(blocks) > 10
+    numbers = np.concatenate([b[0] for b in blocks])
+    assert numbers.tolist() == list(range(5000))
+    _, times, volts = load(str(path), use_cache=False)
+    np.testing.assert_array_equal(np.concatenate([b[1] for b in blocks]), times)
+    np.testing.assert_array_equal(np.concatenate([b[2] for b in blocks]), volts)
+    assert read_header(str(path))['sample rate'] == '~200 Hz'
+
+
+def test_crlf_and_truncated_last_line(tmp_path):
+    path = write_recording(tmp_path / 'ecg.txt', 100, newline='\r\n')
+    with open(path, 'a') as f:
+        f.write("100,0.5")
+    numbers, _, _ = load(str(path), use_cache=False)
+    assert numbers.tolist() == list(range(100))
+
+
+def test_corrupted_recording_loads(tmp_path):
+    path = write_recording(tmp_path / 'ecg.txt', 50)
+    text = path.read_text().replace("\n10,", "\n10,x")
+    path.write_text(text)
+    numbers, _, _ = load(str(path), use_cache=False)
+    assert len(numbers) == 49 and 10 not in numbers
+
+
+def test_cache(tmp_path):
+    path = write_recording(tmp_path / 'ecg.txt', 300)
+    first = load(str(path))
+    assert os.path.exists(cache_path(str(path)))
+    again = load(str(path))
+    for a, b in zip(first, again):
+        np.testing.assert_array_equal(a, b)
+
+    # A changed file invalidates the cache
+    write_recording(path, 10)
+    os.utime(path, ns=(1, 1))
+    assert len(load(str(path))[0]) == 10
+
+
+def test_empty_recording(tmp_path):
+    path = tmp_path / 'ecg.txt'
+    path.write_text(HEADER)
+    numbers, times, volts = load(str(path), use_cache=False)
+    assert len(numbers) == len(times) == len(volts) == 0
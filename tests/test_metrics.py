@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+
+from conftest import feed
+from ecg_devices import DeviceRegistry
+from ecg_metrics import DISABLED, NULL, Counter, Histogram, Metrics, TimedLock
+
+
+def test_counter():
+    counter = Counter('ecg_test_total', 'Test counter')
+    assert counter.render()[-1] == 'ecg_test_total 0'
+    counter.inc()
+    counter.inc(2)
+    assert counter.render() == ['# HELP ecg_test_total Test counter',
+                                '# TYPE ecg_test_total counter', 'ecg_test_total 3']
+
+    labelled = Counter('ecg_errors_total', 'Errors', ('route',))
+    assert labelled.render()[2:] == []
+    labelled.labels('/data').inc()
+    labelled.labels('say "hi"\n').inc()
+    assert labelled.render()[2:] == ['ecg_errors_total{route="/data"} 1',
+                                     'ecg_errors_total{route="say \\"hi\\"\\n"} 1']
+
+
+def test_histogram():
+    histogram = Histogram('ecg_wait_seconds', 'Waits', buckets=(0.1, 0.01, 1.0))
+    for value in (0.0625, 0.01, 0.0625, 0.5, 4.0):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert lines[2:] == [
+        'ecg_wait_seconds_bucket{le="0.01"} 1',
+        'ecg_wait_seconds_bucket{le="0.1"} 3',
+        'ecg_wait_seconds_bucket{le="1.0"} 4',
+        'ecg_wait_seconds_bucket{le="+Inf"} 5',
+        'ecg_wait_seconds_sum 4.635',
+        'ecg_wait_seconds_count 5',
+    ]
+    counts = histogram.counts()
+    assert counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.5, counts) == 0.1
+    assert histogram.quantile(0.99, counts) == float('inf')
+    assert histogram.quantile(0.5, [0, 0, 0, 0]) is None
+
+
+def test_labelled_histogram_sums_every_series():
+    histogram = Histogram('ecg_http_seconds', 'Requests', (1.0,), ('route',))
+    histogram.labels('/data').observe(0.5)
+    histogram.labels('/devices').observe(2.0)
+    assert histogram.counts() == [1, 1]
+    assert 'ecg_http_seconds_bucket{route="/data",le="1.0"} 1' in histogram.render()
+
+
+def test_timed_lock():
+    wait = Histogram('w', 'w', (1.0,))
+    hold = Histogram('h', 'h', (1.0,))
+    lock = TimedLock(wait, hold)
+    threads = [threading.Thread(target=lambda: [lock.__enter__(), lock.__exit__()])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with lock:
+        pass
+    assert sum(wait.counts()) == sum(hold.counts()) == 5
+
+
+def test_disabled_is_free():
+    assert not DISABLED.enabled
+    assert DISABLED.decode_errors is NULL
+    NULL.labels('x').inc()
+    NULL.observe(1.0)
+    assert type(DISABLED.lock()) is type(threading.Lock())
+    assert DISABLED.render().startswith('# HELP ecg_uptime_seconds')
+
+
+def test_render_reads_the_devices(socketio):
+    metrics = Metrics()
+    registry = DeviceRegistry(socketio, autostart=False, jitter_delay=0.0, spectrum_segment=None,
+                              metrics=metrics)
+    feed(registry, np.ones(250), device_id=2)
+    registry.clients.add('sid', ['2'])
+    metrics.decode_errors.inc()
+    text = metrics.render()
+    assert 'ecg_decode_errors_total 1\n' in text
+    assert 'ecg_packets_total{device="2"} 10\n' in text
+    assert 'ecg_samples_total{device="2"} 250\n' in text
+    assert 'ecg_clients 1\n' in text
+    # Ring buffer appends went through the timed lock
+    assert sum(metrics.lock_hold.counts()) > 0
+
+    summary = metrics.summary()
+    assert 'samples/s' in summary and '1 clients' in summary
+    # Rates are since the previous call
+    assert metrics.summary().split(',')[2].strip() == '0 lost'
+    registry.close()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from ecg_acquisition import SampleScheduler, SimulatedADC
+from ecg_buffer import RingBuffer
+from ecg_pipeline import PIPELINE_COLUMNS, Pipeline, Stage
+
+
+def test_every_sample_reaches_every_stage():
+    received = {'writer': [], 'sender': []}
+    pipeline = Pipeline(SampleScheduler(500), SimulatedADC(lambda t: t), duration=0.3)
+    for name in received:
+        pipeline.add_stage(name, lambda times, values, name=name: received[name].append(values),
+                           interval=0.02)
+    pipeline.start()
+    assert pipeline.wait(5.0)
+    pipeline.stop()
+
+    count = pipeline.scheduler.count
+    assert count > 100
+    for name, batches in received.items():
+        values = np.concatenate(batches)
+        assert len(values) == count
+        assert np.all(np.diff(values) > 0)
+        assert pipeline.stats()['stages'][name]['dropped'] == 0
+    assert 'writer' in pipeline.report()
+
+
+def test_stage_added_while_acquiring_catches_up():
+    received = []
+    pipeline = Pipeline(SampleScheduler(500), SimulatedADC(lambda t: t), duration=0.3)
+    pipeline.start()
+    assert pipeline.scheduler.started.wait(5.0)
+    pipeline.add_stage('writer', lambda times, values: received.append(values), interval=0.02)
+    assert pipeline.wait(5.0)
+    pipeline.stop()
+    assert len(np.concatenate(received)) == pipeline.scheduler.count
+
+
+def test_slow_stage_drops_oldest():
+    ring = RingBuffer(10, PIPELINE_COLUMNS)
+    seen = []
+    stage = Stage('slow', ring, lambda times, values: seen.extend(values.tolist()))
+    ring.extend(time=np.arange(25.0), value=np.arange(25.0))
+    assert stage.depth == 25
+    assert stage.drain() == 10
+    assert stage.dropped == 15
+    assert seen == list(range(15, 25))
+    assert stage.drain() == 0
+
+
+def test_handler_errors_are_counted():
+    ring = RingBuffer(10, PIPELINE_COLUMNS)
+
+    def fail(times, values):
+        raise RuntimeError("disk full")
+
+    stage = Stage('writer', ring, fail)
+    ring.extend(time=np.arange(3.0), value=np.zeros(3))
+    stage.drain()
+    assert stage.errors == 1
+    assert stage.cursor == 3
+
+
+def test_acquisition_error_is_kept():
+    class BrokenADC:
+        @property
+        def voltage(self):
+            raise OSError("I2C error")
+
+    pipeline = Pipeline(SampleScheduler(100), BrokenADC())
+    pipeline.start()
+    assert pipeline.wait(2.0)
+    pipeline.stop()
+    assert isinstance(pipeline.error, OSError)
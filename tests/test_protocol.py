@@ -0,0 +1,78 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ecg_protocol import (HEADER, MAX_SAMPLES_PER_PACKET, PacketBatcher, ProtocolError,
+                          decode_packet, encode_packet)
+
+
+def test_round_trip():
+    volts = np.linspace(-1.0, 1.0, 25, dtype=np.float32)
+    packet = decode_packet(encode_packet(volts, seq=7, t0=123.5, sample_rate=250.0, device_id=3))
+    assert packet.device_id == 3
+    assert packet.seq == 7
+    assert packet.t0 == 123.5
+    assert packet.sample_rate == 250.0
+    assert not packet.legacy
+    np.testing.assert_array_equal(packet.voltages, volts)
+
+
+def test_seq_wraps():
+    packet = decode_packet(encode_packet([0.5], seq=2 ** 32 + 5, t0=0.0, sample_rate=100.0))
+    assert packet.seq == 5
+
+
+def test_empty_packet():
+    packet = decode_packet(encode_packet([], seq=0, t0=0.0, sample_rate=100.0))
+    assert len(packet) == 0
+
+
+def test_legacy_float():
+    packet = decode_packet(struct.pack('<f', 1.25))
+    assert packet.legacy
+    assert packet.voltages.tolist() == [1.25]
+
+
+def test_too_many_samples():
+    with pytest.raises(ProtocolError):
+        encode_packet([0.0] * (MAX_SAMPLES_PER_PACKET + 1), seq=0, t0=0.0, sample_rate=100.0)
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'EC\x01',
+    HEADER.pack(b'XX', 1, 0, 0, 0, 100.0, 0.0, 0),
+    HEADER.pack(b'EC', 9, 0, 0, 0, 100.0, 0.0, 0),
+    HEADER.pack(b'EC', 1, 7, 0, 0, 100.0, 0.0, 0),
+    HEADER.pack(b'EC', 1, 0, 0, 0, 100.0, 0.0, 2) + struct.pack('<f', 1.0),
+])
+def test_malformed(data):
+    with pytest.raises(ProtocolError):
+        decode_packet(data)
+
+
+def test_batcher_add_and_flush():
+    batcher = PacketBatcher(100.0, batch_size=3, flush_interval=None, device_id=2)
+    assert batcher.add(0.1, timestamp=10.0) is None
+    assert batcher.add(0.2) is None
+    packet = decode_packet(batcher.add(0.3))
+    assert packet.t0 == 10.0
+    assert packet.seq == 0
+    assert packet.voltages.tolist() == pytest.approx([0.1, 0.2, 0.3])
+    assert batcher.flush() is None
+
+    batcher.add(0.4, timestamp=11.0)
+    packet = decode_packet(batcher.flush())
+    assert packet.seq == 1
+    assert len(packet) == 1
+
+
+def test_batcher_pack():
+    batcher = PacketBatcher(100.0, batch_size=4)
+    times = 5.0 + np.arange(10) / 100.0
+    packets = [decode_packet(p) for p in batcher.pack(times, np.arange(10, dtype=np.float32))]
+    assert [len(p) for p in packets] == [4, 4, 2]
+    assert [p.seq for p in packets] == [0, 1, 2]
+    assert [p.t0 for p in packets] == pytest.approx([5.0, 5.04, 5.08])
+    assert batcher.seq == 3
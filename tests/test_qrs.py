@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+from ecg_qrs import QRSDetector
+from ecg_synth import ECGSynth
+
+FS = 250.0
+
+
+def recording(seconds=60, heart_rate=75, hrv=0.0, seed=1):
+    synth = ECGSynth(FS, heart_rate=heart_rate, hrv=hrv, wander=0.05, noise=0.005, seed=seed)
+    times, volts = synth.generate(int(seconds * FS))
+    return times, volts[0]
+
+
+def detect(times, volts, batch):
+    detector = QRSDetector()
+    beats = []
+    for pos in range(0, len(times), batch):
+        beats.extend(detector.process(times[pos:pos + batch], volts[pos:pos + batch], FS))
+    return detector, beats
+
+
+@pytest.mark.parametrize('batch', [7, 25, 100, 250])
+def test_heart_rate(batch):
+    times, volts = recording(heart_rate=75)
+    detector, beats = detect(times, volts, batch)
+    # Every beat after the 2 s learning period, give or take the edges
+    assert 70 <= len(beats) <= 73
+    assert detector.heart_rate == pytest.approx(75, abs=1.5)
+    rr = np.diff([beat.time for beat in beats])
+    assert rr.min() > 0.7 and rr.max() < 0.9
+
+
+def test_batch_size_does_not_change_the_beats():
+    times, volts = recording(seconds=120, hrv=0.05)
+    _, whole = detect(times, volts, len(times))
+    expected = [beat.time for beat in whole]
+    assert len(expected) > 140
+    for batch in (25, 333):
+        assert [beat.time for beat in detect(times, volts, batch)[1]] == expected
+
+
+def test_one_large_batch_stays_linear():
+    # Each beat only looks at HISTORY_SECONDS of signal, however long the batch
+    times, volts = recording(seconds=1200)
+    start = time.perf_counter()
+    _, beats = detect(times, volts, len(times))
+    assert len(beats) > 1400
+    assert time.perf_counter() - start < 3.0
+
+
+def test_one_sample_per_batch():
+    # Legacy 4-byte senders deliver one sample per packet
+    times, volts = recording(seconds=20, heart_rate=60)
+    detector, beats = detect(times, volts, 1)
+    assert len(beats) >= 16
+    assert detector.heart_rate == pytest.approx(60, abs=1.5)
+
+
+@pytest.mark.parametrize('sizes', [(1, 2), (2, 1, 3), (2,)])
+def test_short_batches(sizes):
+    times, volts = recording(seconds=20, heart_rate=90)
+    detector = QRSDetector()
+    beats, pos, k = [], 0, 0
+    while pos < len(times):
+        n = sizes[k % len(sizes)]
+        beats.extend(detector.process(times[pos:pos + n], volts[pos:pos + n], FS))
+        pos, k = pos + n, k + 1
+    assert detector.heart_rate == pytest.approx(90, abs=2)
+
+
+def test_r_peak_located():
+    times, volts = recording(seconds=20)
+    _, beats = detect(times, volts, 25)
+    for beat in beats:
+        i = int(round(beat.time * FS))
+        window = volts[max(0, i - 10):i + 10]
+        assert volts[i] == pytest.approx(window.max(), abs=0.05)
+
+
+def test_beat_to_dict():
+    times, volts = recording(seconds=10)
+    _, beats = detect(times, volts, 25)
+    assert set(beats[-1].to_dict()) == {'time', 'rr', 'bpm', 'amplitude'}
+    assert beats[0].rr is None
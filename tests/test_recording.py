@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from ecg_recording import (DTYPE_DELTA, DTYPE_FLOAT32, DTYPE_INT16, RecordingReader,
+                           RecordingWriter, ads1115_scale, binary_to_text, text_to_binary)
+
+FS = 250.0
+
+
+def signal(n):
+    return (1.5 + 0.5 * np.sin(np.arange(n) / 20.0)).astype(np.float32)
+
+
+def write(path, volts, dtype, chunk_size=64, close=True):
+    writer = RecordingWriter(str(path), FS, gain=1, channel=2, dtype=dtype, chunk_size=chunk_size,
+                             start_time=1000.0)
+    writer.write_block(0.0, volts, volts=True)
+    if close:
+        writer.close()
+    return writer
+
+
+@pytest.mark.parametrize('dtype', [DTYPE_FLOAT32, DTYPE_INT16, DTYPE_DELTA])
+def test_round_trip(tmp_path, dtype):
+    volts = signal(1000)
+    write(tmp_path / 'r.ecg', volts, dtype)
+    reader = RecordingReader(str(tmp_path / 'r.ecg'))
+    assert len(reader) == 1000
+    assert (reader.sample_rate, reader.channel, reader.start_time) == (FS, 2, 1000.0)
+    times, read = reader.read_all()
+    np.testing.assert_allclose(times, np.arange(1000) / FS)
+    tolerance = 1e-7 if dtype == DTYPE_FLOAT32 else ads1115_scale(1) / 2 + 1e-7
+    np.testing.assert_allclose(read, volts, atol=tolerance)
+    assert reader.duration == pytest.approx(999 / FS)
+
+
+@pytest.mark.parametrize('dtype', [DTYPE_FLOAT32, DTYPE_DELTA])
+def test_partial_reads(tmp_path, dtype):
+    volts = signal(500)
+    write(tmp_path / 'r.ecg', volts, dtype)
+    reader = RecordingReader(str(tmp_path / 'r.ecg'))
+    _, everything = reader.read_all()
+    times, part = reader.read_samples(60, 130)
+    assert len(part) == 70
+    np.testing.assert_array_equal(part, everything[60:130])
+    assert times[0] == pytest.approx(60 / FS)
+    assert len(reader.read_samples(490, 900)[1]) == 10
+    assert len(reader.read_samples(300, 200)[1]) == 0
+
+    times, part = reader.read_time_range(1.0, 1.2)
+    assert times[0] >= 1.0 and times[-1] < 1.2
+    assert len(part) == 50
+
+
+@pytest.mark.parametrize('dtype', [DTYPE_INT16, DTYPE_DELTA])
+def test_out_of_range_volts_saturate(tmp_path, dtype):
+    volts = np.array([0.0, 5.0, -5.0, 4.0, 1.0], dtype=np.float32)
+    write(tmp_path / 'r.ecg', volts, dtype)
+    _, read = RecordingReader(str(tmp_path / 'r.ecg')).read_all()
+    scale = ads1115_scale(1)
+    np.testing.assert_allclose(read, [0.0, 32767 * scale, -32768 * scale, 4.0, 1.0],
+                               atol=scale)
+
+    writer = RecordingWriter(str(tmp_path / 's.ecg'), FS, dtype=dtype)
+    writer.write(0.0, 10.0, volts=True)
+    writer.close()
+    assert RecordingReader(str(tmp_path / 's.ecg')).read_all()[1][0] == pytest.approx(32767 * scale)
+
+
+@pytest.mark.parametrize('dtype', [DTYPE_INT16, DTYPE_DELTA])
+def test_unclosed_file_keeps_complete_chunks(tmp_path, dtype):
+    writer = write(tmp_path / 'r.ecg', signal(200), dtype, close=False)
+    assert len(RecordingReader(str(tmp_path / 'r.ecg'))) == 192
+    writer.close()
+
+
+def test_not_a_recording(tmp_path):
+    (tmp_path / 'x.ecg').write_bytes(b'nope' * 20)
+    with pytest.raises(ValueError):
+        RecordingReader(str(tmp_path / 'x.ecg'))
+
+
+def test_text_conversion_round_trip(tmp_path):
+    volts = signal(300)
+    write(tmp_path / 'r.ecg', volts, DTYPE_FLOAT32)
+    assert binary_to_text(str(tmp_path / 'r.ecg'), str(tmp_path / 'r.txt')) == 300
+    assert text_to_binary(str(tmp_path / 'r.txt'), str(tmp_path / 'b.ecg'), DTYPE_DELTA) == 300
+    reader = RecordingReader(str(tmp_path / 'b.ecg'))
+    assert reader.sample_rate == pytest.approx(FS)
+    np.testing.assert_allclose(reader.read_all()[1], volts, atol=ads1115_scale(1))
@@ -0,0 +1,141 @@
+import socket
+
+import numpy as np
+import pytest
+
+import ecg_replay
+from ecg_protocol import ENCODING_DELTA, decode_packet
+from ecg_recording import DTYPE_DELTA, RecordingWriter, ads1115_scale
+from ecg_replay import RecordingSource, replay
+
+RATE = 100.0
+
+
+def write_text(path, times, volts):
+    lines = [f"{k},{t:.6f},{v:.6f}" for k, (t, v) in enumerate(zip(times, volts))]
+    path.write_text("# ECG Data Recording\n# Sample rate: ~100 Hz\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+def write_binary(path, times, volts, dtype=None, gain=1):
+    options = {} if dtype is None else {'dtype': dtype, 'scale': ads1115_scale(gain)}
+    writer = RecordingWriter(str(path), RATE, gain=gain, **options)
+    writer.write_samples(times, volts, volts=True)
+    writer.close()
+    return str(path)
+
+
+def decoded(source):
+    return [(offset, decode_packet(data)) for offset, data in source]
+
+
+@pytest.fixture(params=['text', 'binary'])
+def recording(request, tmp_path):
+    times = np.arange(237) / RATE
+    volts = (np.arange(237) / 1000).astype(np.float32)
+    if request.param == 'text':
+        return write_text(tmp_path / 'a.txt', times, volts), volts
+    return write_binary(tmp_path / 'a.ecg', times, volts), volts
+
+
+def test_packets(recording):
+    path, volts = recording
+    source = RecordingSource(path, start_time=5000.0, device_id=3, batch_size=25)
+    packets = decoded(source)
+    assert [len(p) for _, p in packets] == [25] * 9 + [12]
+    assert [p.seq for _, p in packets] == list(range(10))
+    assert all(p.device_id == 3 and p.sample_rate == pytest.approx(RATE) for _, p in packets)
+    # Each packet is due when its last sample was recorded
+    assert [offset for offset, _ in packets] == pytest.approx([(25 * k + 24) / RATE
+                                                               for k in range(9)] + [2.36])
+    assert packets[1][1].t0 == pytest.approx(5000.25)
+    np.testing.assert_allclose(np.concatenate([p.voltages for _, p in packets]), volts, atol=1e-6)
+    assert source.stats()['samples'] == 237
+
+
+def test_dropouts_cut_packets(tmp_path):
+    times = np.concatenate((np.arange(40), np.arange(60, 100))) / RATE
+    path = write_text(tmp_path / 'gap.txt', times, np.zeros(80))
+    source = RecordingSource(path, 0.0, batch_size=25)
+    packets = decoded(source)
+    assert [len(p) for _, p in packets] == [25, 15, 25, 15]
+    assert packets[2][1].t0 == pytest.approx(0.6)
+    assert source.gaps == 1
+
+
+def test_small_blocks_carry_the_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(ecg_replay, 'BLOCK_SAMPLES', 30)
+    times = np.arange(100) / RATE
+    path = write_binary(tmp_path / 'a.ecg', times, np.arange(100) / 1000)
+    packets = decoded(RecordingSource(path, 0.0, batch_size=25))
+    assert [len(p) for _, p in packets] == [25] * 4
+    np.testing.assert_allclose(np.concatenate([p.voltages for _, p in packets]),
+                               np.arange(100) / 1000, atol=1e-6)
+
+
+def test_loops_continue_the_session(tmp_path):
+    path = write_binary(tmp_path / 'a.ecg', np.arange(50) / RATE, np.zeros(50))
+    source = RecordingSource(path, 0.0, batch_size=20, loops=3)
+    packets = decoded(source)
+    assert source.plays == 3
+    assert sum(len(p) for _, p in packets) == 150
+    assert [p.seq for _, p in packets] == list(range(len(packets)))
+    # One uniform time axis across the passes, no gaps
+    starts = np.array([p.t0 for _, p in packets])
+    assert starts == pytest.approx(np.arange(0, 150, 20)[:len(starts)] / RATE)
+    assert source.gaps == 0
+
+
+def test_codes_keep_their_gain(tmp_path):
+    codes = np.arange(-50, 50)
+    scale = ads1115_scale(4)
+    path = write_binary(tmp_path / 'a.ecg', np.arange(100) / RATE, codes * scale,
+                        dtype=DTYPE_DELTA, gain=4)
+    packets = decoded(RecordingSource(path, 0.0, encoding='delta'))
+    assert all(p.encoding == ENCODING_DELTA and p.gain == 4 for _, p in packets)
+    np.testing.assert_allclose(np.concatenate([p.voltages for _, p in packets]) / scale, codes,
+                               atol=1e-3)
+
+
+def test_empty_recording(tmp_path):
+    path = write_text(tmp_path / 'empty.txt', [], [])
+    assert decoded(RecordingSource(path, 0.0, loops=0)) == []
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+
+def test_replay_merges_files(tmp_path, receiver):
+    a = write_binary(tmp_path / 'a.ecg', np.arange(100) / RATE, np.zeros(100))
+    b = write_text(tmp_path / 'b.txt', np.arange(50) / RATE, np.ones(50))
+    stats = replay([a, b], receiver.getsockname(), speed=0, device_id=7, report_seconds=None)
+    assert stats['packets'] == 6
+    assert stats['signal_seconds'] == pytest.approx(0.99)
+    assert [f['device_id'] for f in stats['files']] == [7, 8]
+    packets = [decode_packet(receiver.recv(65535)) for _ in range(6)]
+    # Sent in recorded order across both files
+    due = [p.t0 + (len(p) - 1) / RATE for p in packets]
+    assert due == sorted(due)
+    assert sorted(p.device_id for p in packets) == [7, 7, 7, 7, 8, 8]
+
+
+def test_replay_speed(tmp_path, receiver):
+    path = write_binary(tmp_path / 'a.ecg', np.arange(200) / RATE, np.zeros(200))
+    stats = replay([path], receiver.getsockname(), speed=4, report_seconds=None)
+    # 2 s of signal at 4x; the clock starts at the first packet, due at 0.24 s
+    assert stats['elapsed'] == pytest.approx((1.99 - 0.24) / 4, abs=0.1)
+    assert stats['max_late_ms'] < 50
+
+
+def test_stop(tmp_path, receiver):
+    path = write_binary(tmp_path / 'a.ecg', np.arange(100) / RATE, np.zeros(100))
+    stats = replay([path], receiver.getsockname(), speed=0, loops=0, batch_size=1,
+                   stop=lambda: True, report_seconds=None)
+    assert stats['packets'] == 256
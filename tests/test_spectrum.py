@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from ecg_spectrum import StreamingSpectrum, band_power
+
+RATE = 256.0
+
+
+def tone(seconds, freq, amplitude=1.0, rate=RATE, noise=0.0, seed=0):
+    t = np.arange(int(seconds * rate)) / rate
+    rng = np.random.default_rng(seed)
+    return t, amplitude * np.sin(2 * np.pi * freq * t) + noise * rng.standard_normal(len(t))
+
+
+def feed(spectrum, times, volts, batch=25, rate=RATE):
+    for pos in range(0, len(volts), batch):
+        spectrum.update(times[pos:pos + batch], volts[pos:pos + batch], rate)
+
+
+def test_matches_scipy_welch():
+    # 10 s average: every segment of 12 s of signal that starts within the last 10 s
+    spectrum = StreamingSpectrum(segment_seconds=2.0, average_seconds=10.0)
+    times, volts = tone(12, 10.0, noise=0.5)
+    feed(spectrum, times, volts)
+    freqs, psd = spectrum.psd()
+    n, hop = spectrum.nperseg, spectrum.hop
+    assert n == 512 and hop == 256
+    assert spectrum.frames == 9
+    start = (spectrum.segments - spectrum.frames) * hop
+    _, expected = signal.welch(volts[start:start + n + hop * (spectrum.frames - 1)], RATE,
+                               nperseg=n, noverlap=n - hop)
+    np.testing.assert_allclose(psd, expected, rtol=1e-9, atol=1e-15)
+
+
+@pytest.mark.parametrize('batch', [1, 7, 100, 1000])
+def test_batch_size_does_not_matter(batch):
+    times, volts = tone(8, 20.0, noise=0.1)
+    reference = StreamingSpectrum()
+    reference.update(times, volts, RATE)
+    spectrum = StreamingSpectrum()
+    feed(spectrum, times, volts, batch)
+    np.testing.assert_allclose(spectrum.psd()[1], reference.psd()[1])
+
+
+def test_tone_peak_and_power():
+    spectrum = StreamingSpectrum()
+    times, volts = tone(8, 16.0, amplitude=2.0)
+    feed(spectrum, times, volts)
+    freqs, psd = spectrum.psd()
+    assert freqs[np.argmax(psd)] == 16.0
+    # A sine of amplitude A carries A^2 / 2
+    assert band_power(freqs, psd, 14, 18) == pytest.approx(2.0, rel=0.01)
+
+
+def test_mains_relative_to_ecg():
+    spectrum = StreamingSpectrum()
+    times, ecg = tone(8, 10.0, amplitude=1.0)
+    _, mains = tone(8, 50.0, amplitude=0.1)
+    feed(spectrum, times, ecg + mains)
+    summary = spectrum.to_dict()
+    assert summary['mains']['50']['db'] == pytest.approx(-20.0, abs=0.5)
+    assert summary['mains']['60']['db'] < -60
+    assert summary['ecg'] == pytest.approx(0.5, rel=0.01)
+    assert summary['high'] < 1e-3
+
+
+def test_spectrogram_rows_oldest_first():
+    spectrum = StreamingSpectrum(history_seconds=3.0)
+    assert spectrum.spectrogram() is None and spectrum.to_dict() is None
+    times, volts = tone(10, 10.0)
+    feed(spectrum, times, volts)
+    centers, rows = spectrum.spectrogram()
+    assert len(centers) == 3
+    assert np.all(np.diff(centers) == 1.0)
+    assert centers[-1] == times[(spectrum.segments - 1) * spectrum.hop + spectrum.nperseg // 2]
+    assert rows.shape == (3, len(spectrum.freqs))
+
+
+def test_to_dict():
+    spectrum = StreamingSpectrum()
+    times, volts = tone(4, 10.0)
+    feed(spectrum, times, volts)
+    payload = spectrum.to_dict(max_freq=40, spectrogram=True)
+    assert payload['sample_rate'] == RATE
+    assert payload['resolution'] == 0.5
+    assert max(payload['freqs']) == 40
+    assert len(payload['psd_db']) == len(payload['freqs'])
+    assert len(payload['spectrogram']['db'][0]) == len(payload['freqs'])
+
+
+def test_rate_change_restarts():
+    spectrum = StreamingSpectrum()
+    times, volts = tone(4, 10.0)
+    feed(spectrum, times, volts)
+    assert spectrum.segments > 0
+    spectrum.update(np.arange(10) / 500.0, np.zeros(10), 500.0)
+    assert spectrum.segments == 0
+    assert spectrum.nperseg == 1024
+    assert spectrum.psd() is None
+
+
+def test_bad_overlap():
+    with pytest.raises(ValueError):
+        StreamingSpectrum(overlap=1.0)
@@ -0,0 +1,91 @@
+import socket
+
+import numpy as np
+import pytest
+
+from ecg_protocol import ENCODING_DELTA, decode_packet
+from ecg_recording import ads1115_scale
+from ecg_synth import ECGSynth, MAX_SAMPLE_RATE, stream
+
+
+def test_shape_and_time_base():
+    synth = ECGSynth(500, channels=3, seed=1)
+    times, volts = synth.generate(1000)
+    assert volts.shape == (3, 1000)
+    assert volts.dtype == np.float32
+    np.testing.assert_allclose(times, np.arange(1000) / 500)
+    times, _ = synth.generate(10)
+    assert times[0] == 2.0
+
+
+def test_blocks_continue_the_same_signal():
+    whole = ECGSynth(250, noise=0.0, hrv=0.05, seed=3).generate(5000)[1]
+    synth = ECGSynth(250, noise=0.0, hrv=0.05, seed=3)
+    pieces = np.concatenate([synth.generate(n)[1] for n in (1, 999, 2000, 2000)], axis=1)
+    np.testing.assert_allclose(pieces, whole, atol=1e-6)
+
+
+def test_heart_rate():
+    synth = ECGSynth(250, heart_rate=120, hrv=0.0, wander=0.0, noise=0.0, seed=1)
+    _, volts = synth.generate(250 * 30)
+    rising = np.flatnonzero((volts[0, 1:] > 2.0) & (volts[0, :-1] <= 2.0))
+    assert len(rising) == pytest.approx(60, abs=1)
+
+
+def test_mains():
+    synth = ECGSynth(1000, heart_rate=60, wander=0.0, noise=0.0, mains=0.1, mains_hz=50, seed=1)
+    _, volts = synth.generate(4000)
+    spectrum = np.abs(np.fft.rfft(volts[0] - volts[0].mean()))
+    freqs = np.fft.rfftfreq(4000, 1 / 1000)
+    assert freqs[np.argmax(spectrum[freqs > 40]) + np.count_nonzero(freqs <= 40)] == 50
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        ECGSynth(MAX_SAMPLE_RATE + 1)
+    with pytest.raises(ValueError):
+        ECGSynth(500, channels=0)
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+
+def receive(sock, count):
+    return [decode_packet(sock.recv(65535)) for _ in range(count)]
+
+
+def test_stream_channels_as_devices(receiver):
+    synth = ECGSynth(500, channels=2, seed=1)
+    stats = stream(synth, receiver.getsockname(), batch_size=50, realtime=False, duration=1.0,
+                   device_id=4)
+    assert stats['samples'] == 500
+    assert stats['packets'] == 20
+    packets = receive(receiver, 20)
+    for device in (4, 5):
+        mine = [p for p in packets if p.device_id == device]
+        assert [p.seq for p in mine] == list(range(10))
+        assert [p.t0 - mine[0].t0 for p in mine] == pytest.approx(np.arange(10) * 0.1)
+        assert sum(len(p) for p in mine) == 500
+
+
+def test_stream_delta(receiver):
+    synth = ECGSynth(250, noise=0.0, seed=2)
+    reference = ECGSynth(250, noise=0.0, seed=2).generate(250)[1][0]
+    stream(synth, receiver.getsockname(), realtime=False, duration=1.0,
+           encoding=ENCODING_DELTA, gain=1)
+    packets = receive(receiver, 10)
+    assert all(p.encoding == ENCODING_DELTA and p.gain == 1 for p in packets)
+    volts = np.concatenate([p.voltages for p in packets])
+    np.testing.assert_allclose(volts, reference, atol=ads1115_scale(1))
+
+
+def test_stream_realtime_paces(receiver):
+    stats = stream(ECGSynth(200, seed=1), receiver.getsockname(), duration=0.5)
+    assert stats['elapsed'] == pytest.approx(0.5, abs=0.1)